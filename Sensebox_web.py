@@ -1,10 +1,21 @@
 import streamlit as st
-import joblib
 import pandas as pd
 import os
 from streamlit_lottie import st_lottie
-import json
-from typing import Optional
+import hashlib
+import math
+from model_registry import RELOAD_SECONDS, ModelRegistry
+from ingest import CHUNK_SIZE, iter_upload_chunks, open_upload_parts, upload_digest, upload_progress
+from bulk import ALL_TASKS, TASKS, BulkResult, ResultStore, classify_chunks, classify_files, text_columns
+from cascade import CASCADE_TASKS, CascadePredictor, cascade_version, default_threshold
+from inference import ParallelPredictor
+from batching import MicroBatchScheduler
+from metrics import METRICS
+import assets
+from multitask import MULTI_TASKS, MultiTaskPredictor, available_tasks
+from jobs import ACTIVE, CANCELLED, DONE, QUEUED, JobManager, job_progress
+from streaming import STREAM_DIR, JsonlSink, StreamPipeline, StreamRunner, listen_socket, stream_path, tail_jsonl
+from warmup import FAILED, WARMUP, Readiness, warm_up
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,30 +24,93 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 
 
-spam_model = joblib.load(os.path.join(MODEL_DIR, "spam_classifier.pkl"))
-language_model = joblib.load(os.path.join(MODEL_DIR, "lang_det.pkl"))
-news_model = joblib.load(os.path.join(MODEL_DIR, "news_cat.pkl"))
-review_model = joblib.load(os.path.join(MODEL_DIR, "review.pkl"))
+@st.cache_resource(show_spinner=False)
+def get_model_registry() -> ModelRegistry:
+    """One registry per process, shared by every session and rerun.
 
-def load_lottiefile(filepath: str) -> Optional[dict]:
-    """Load Lottie animation file"""
-    try:
-        with open(filepath, "r") as f:
-            return json.load(f)
-    except:
-        return None
+    New versions in models/<name>/<version>/ are warmed up and swapped in by a background
+    watcher, so sessions keep running across a model update.
+    """
+    registry = ModelRegistry(MODEL_DIR)
+    registry.watch(RELOAD_SECONDS, warm_up)
+    return registry
 
 
-animation_spam = load_lottiefile("spam_animation.json") if os.path.exists("spam_animation.json") else None
-animation_language = load_lottiefile("language_animation.json") if os.path.exists("language_animation.json") else None
-animation_sentiment = load_lottiefile("sentiment_animation.json") if os.path.exists("sentiment_animation.json") else None
-animation_news = load_lottiefile("news_animation.json") if os.path.exists("news_animation.json") else None
+registry = get_model_registry()
 
 
-def set_background():
-    st.markdown(
-        """
-        <style>
+@st.cache_resource(show_spinner=False)
+def get_readiness(_registry: ModelRegistry) -> Readiness:
+    """Warms the models up once per process in the background when SENSEBOX_WARMUP=1"""
+    readiness = Readiness(_registry)
+    if WARMUP:
+        readiness.start()
+    return readiness
+
+
+readiness = get_readiness(registry)
+
+
+@st.cache_resource(show_spinner=False)
+def get_inference_engine(_registry: ModelRegistry) -> ParallelPredictor:
+    """Process pool used for bulk predictions, shared by every session"""
+    return ParallelPredictor(_registry)
+
+
+engine = get_inference_engine(registry)
+
+
+@st.cache_resource(show_spinner=False)
+def get_batch_scheduler(_engine: ParallelPredictor) -> MicroBatchScheduler:
+    """Combines the single-text predictions of all sessions into shared batches"""
+    return MicroBatchScheduler(_engine.predict_tagged)
+
+
+scheduler = get_batch_scheduler(engine)
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_manager(_engine: ParallelPredictor) -> JobManager:
+    """Background bulk jobs, shared by every session so any of them can follow a job"""
+    return JobManager(_engine)
+
+
+jobs = get_job_manager(engine)
+
+
+@st.cache_resource(show_spinner=False)
+def get_stream_runner() -> StreamRunner:
+    """The live stream classifier; one per process, so every session sees the same feed"""
+    return StreamRunner()
+
+
+stream = get_stream_runner()
+
+
+def get_model(name: str):
+    """Fetch a model from the registry, loading it on first use"""
+    model = registry.get(name)
+    if model is None:
+        st.error(f"Error loading model: {registry.error(name)}")
+    return model
+
+
+def model_unavailable_warning(name: str) -> bool:
+    """Show a warning and return True if the model for this tab cannot be used"""
+    if registry.is_available(name):
+        return False
+    st.warning(f"⚠️ This model is currently unavailable: {registry.error(name)}")
+    return True
+
+
+# Parsed once per process; None when the animation file is not in the project folder
+animation_spam = assets.lottie("spam_animation.json")
+animation_language = assets.lottie("language_animation.json")
+animation_sentiment = assets.lottie("sentiment_animation.json")
+animation_news = assets.lottie("news_animation.json")
+
+
+APP_CSS = """
         .stApp {
             background: linear-gradient(to right, #0f0c29, #302b63, #24243e);
             background-size: cover;
@@ -175,10 +249,43 @@ def set_background():
             0%, 100% { transform: translateY(0); }
             50% { transform: translateY(-10px); }
         }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
+        /* Add this new CSS for file uploader */
+        .stFileUploader > div > div {
+            background-color: #000000 !important;
+            border-radius: 8px;
+            padding: 1rem;
+        }
+        .stFileUploader > div > div:hover {
+            border-color: #4CAF50 !important;
+        }
+        .stFileUploader > label > div > p {
+            color: white !important;
+        }
+
+        /* Animation for sidebar image */
+        .sidebar-image {
+            animation: pulse 2s infinite;
+        }
+        @keyframes pulse {
+            0% { transform: scale(1); }
+            50% { transform: scale(1.03); }
+            100% { transform: scale(1); }
+        }
+
+        /* Animation for project cards */
+        .project-card-animation {
+            transition: all 0.5s ease;
+        }
+        .project-card-animation:hover {
+            transform: translateY(-5px) scale(1.02);
+            box-shadow: 0 10px 25px rgba(76, 175, 80, 0.3) !important;
+        }
+"""
+
+
+def set_background():
+    """Inject the whole stylesheet in one block; it is minified once per process"""
+    st.markdown(assets.stylesheet(APP_CSS), unsafe_allow_html=True)
     
 
 
@@ -192,44 +299,9 @@ st.set_page_config(
 set_background()
 
 with st.sidebar:
-    st.markdown("""
-    <style>
-    /* Add this new CSS for file uploader */
-    .stFileUploader > div > div {
-        background-color: #000000 !important;
-        border-radius: 8px;
-        padding: 1rem;
-    }
-    .stFileUploader > div > div:hover {
-        border-color: #4CAF50 !important;
-    }
-    .stFileUploader > label > div > p {
-        color: white !important;
-    }
-    
-    /* Animation for sidebar image */
-    .sidebar-image {
-        animation: pulse 2s infinite;
-    }
-    @keyframes pulse {
-        0% { transform: scale(1); }
-        50% { transform: scale(1.03); }
-        100% { transform: scale(1); }
-    }
-    
-    /* Animation for project cards */
-    .project-card-animation {
-        transition: all 0.5s ease;
-    }
-    .project-card-animation:hover {
-        transform: translateY(-5px) scale(1.02);
-        box-shadow: 0 10px 25px rgba(76, 175, 80, 0.3) !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    if os.path.exists("kushank.png"):
-        st.image("kushank.png", caption="Sense Box AI", use_container_width=True)
+    sidebar_image = assets.image("kushank.png")
+    if sidebar_image is not None:
+        st.image(sidebar_image, caption="Sense Box AI", use_container_width=True)
     else:
         st.warning("⚠️ kushank.png not found in project folder.")
 
@@ -268,25 +340,254 @@ with st.sidebar:
 st.markdown('<h1 class="title-text">🎯 Sense Box AI: Market Sentiment Engine</h1>', unsafe_allow_html=True)
 
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
     "🤖 Spam Classifier",
     "🗣️ Language Detection", 
     "🍽️ Food Review Sentiment",
     "📰 News Classification",
-    "📊 Kushank Data Analyst Portfolio"
+    "📊 Kushank Data Analyst Portfolio",
+    "🧩 Analyze All",
+    "📡 Live Stream"
 ])
 
-def read_uploaded_file(uploaded_file):
-    """Helper function to read both CSV and TXT files"""
+PAGE_SIZES = [50, 100, 500]
+
+# CSV and TXT, also gzip-compressed, and zip or tar archives of one or more of them
+UPLOAD_TYPES = ["csv", "txt", "gz", "zip", "tar", "tgz"]
+UPLOAD_LABEL = "Upload files (CSV or TXT, optionally .gz, or zip/tar.gz archives of them)"
+
+# Uploads at least this large run as background jobs unless the user opts out
+BACKGROUND_JOB_BYTES = int(float(os.environ.get("SENSEBOX_BACKGROUND_JOB_MB", 20)) * 1024 * 1024)
+JOB_POLL_SECONDS = 1.0
+
+STREAM_REFRESH_SECONDS = 1.0
+STREAM_SOURCES = ["Follow a JSONL file", "Listen on a local socket"]
+
+
+def uploads_digest(uploaded_files) -> str:
+    """sha256 of a single upload, or of the digests of several uploads in order"""
+    digests = st.session_state.setdefault("upload_digests", {})
+    hashes = []
+    for uploaded_file in uploaded_files:
+        file_id = getattr(uploaded_file, "file_id", None)
+        digest = digests.get(file_id) or upload_digest(uploaded_file)
+        if file_id is not None:
+            digests[file_id] = digest
+        hashes.append(digest)
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256(" ".join(hashes).encode()).hexdigest()
+
+
+def run_bulk_classification(uploaded_files, task: str):
+    """Classify the uploads chunk by chunk, showing progress and offering the results as a download.
+
+    Several files, or an archive of several, are classified in parallel into one result.
+    """
+    store = st.session_state.setdefault("bulk_results", ResultStore())
+    digest = uploads_digest(uploaded_files)
+    threshold = None
+    if task == ALL_TASKS:
+        tasks = available_tasks(registry)
+        model = MultiTaskPredictor(registry, engine, tasks, pin=True)
+        key = (task, digest, tuple(model.versions.values()))
+    else:
+        model = engine.for_model(task)
+        if task in CASCADE_TASKS and st.checkbox(
+                "Fast mode (cascade)", key=f"{task}_cascade",
+                help="A cheap first stage labels the rows it is confident about; "
+                     "only the rest go through the full model"):
+            threshold = st.slider("Confidence threshold", 0.5, 0.999, default_threshold(task), step=0.001,
+                                  format="%.3f", key=f"{task}_cascade_threshold",
+                                  help="Higher sends more rows to the full model: slower, but closer to its answers")
+        key = (task, digest, model.version if threshold is None else cascade_version(model.version, threshold))
+
+    result = store.get(key)
+    if result is None and threshold is not None:
+        # Building the first stage scores the model's whole vocabulary, so it is only done on a miss
+        try:
+            model = CascadePredictor(engine, task, threshold)
+        except ValueError:
+            st.caption("This model version cannot run as a cascade; using the full model.")
+            key = (task, digest, model.version)
+            result = store.get(key)
+        else:
+            # Pinned when built, which may be a version reloaded since the lookup
+            key = (task, digest, model.version)
+    if result is not None:
+        files = "this file" if len(uploaded_files) == 1 else "these files"
+        st.caption(f"Showing saved results for {files} ({result.rows:,} rows).")
+        if result.warning:
+            st.warning(result.warning)
+        show_bulk_result(result)
+        return
+
+    uploaded_file = uploaded_files[0]
     try:
-        if uploaded_file.name.endswith('.csv'):
-            return pd.read_csv(uploaded_file)
-        else:  # TXT file
-            content = uploaded_file.read().decode('utf-8')
-            return pd.DataFrame({'text': content.split('\n')})
+        with open_upload_parts(uploaded_files) as parts:
+            single = len(parts) == 1 and parts[0] is uploaded_file
+            if not single:
+                result = classify_upload_parts(parts, model, task)
     except Exception as e:
         st.error(f"Error reading file: {str(e)}")
-        return None
+        return
+    if not single:
+        store.put(key, result)
+        if result.warning:
+            st.warning(result.warning)
+        show_bulk_result(result)
+        return
+
+    # Background jobs run one full model over one file; "analyze all" and cascades always run inline
+    background = task != ALL_TASKS and not isinstance(model, CascadePredictor) and st.checkbox(
+        "Run as a background job", value=uploaded_file.size >= BACKGROUND_JOB_BYTES, key=f"{task}_background",
+        help="Keeps classifying while you use the rest of the app; progress is saved so a cancelled job can be resumed")
+    if background:
+        run_background_job(uploaded_file, task, key)
+        return
+
+    progress = st.progress(0.0, text="Reading file...")
+
+    def on_progress(rows: int, seconds: float):
+        rate = rows / seconds if seconds else 0.0
+        progress.progress(upload_progress(uploaded_file), text=f"Classified {rows:,} rows ({rate:,.0f} rows/s)")
+
+    try:
+        chunks = iter_upload_chunks(uploaded_file, max(CHUNK_SIZE, engine.chunk_size), text_columns(task))
+        result = classify_chunks(chunks, model, task, on_progress)
+    except Exception as e:
+        progress.empty()
+        st.error(f"Error reading file: {str(e)}")
+        return
+
+    store.put(key, result)
+
+    progress.progress(1.0, text=f"Classified {result.rows:,} rows in {result.seconds:.1f}s "
+                                f"({result.rows_per_second:,.0f} rows/s)")
+    if result.warning:
+        st.warning(result.warning)
+    show_bulk_result(result)
+
+
+def classify_upload_parts(parts, model, task: str) -> BulkResult:
+    """classify_files with an overall progress bar and a table of per-file progress"""
+    progress = st.progress(0.0, text=f"Reading {len(parts)} files...")
+    table = st.empty()
+    sizes = [getattr(part, "size", 0) or 1 for part in parts]
+
+    def on_progress(files, seconds: float):
+        rows = sum(file["rows"] for file in files)
+        finished = sum(file["status"] not in ("waiting", "reading") for file in files)
+        done = sum(file["fraction"] * size for file, size in zip(files, sizes)) / sum(sizes)
+        rate = rows / seconds if seconds else 0.0
+        progress.progress(min(done, 1.0), text=f"Classified {rows:,} rows, {finished} of {len(files)} files "
+                                               f"finished ({rate:,.0f} rows/s)")
+        table.dataframe(pd.DataFrame(files), hide_index=True, column_config={
+            "file": "File",
+            "rows": st.column_config.NumberColumn("Rows", format="%d"),
+            "fraction": st.column_config.ProgressColumn("Progress", min_value=0.0, max_value=1.0),
+            "status": "Status",
+        })
+
+    try:
+        result = classify_files(parts, model, task, max(CHUNK_SIZE, engine.chunk_size), on_progress)
+    except BaseException:
+        progress.empty()
+        table.empty()
+        raise
+    progress.progress(1.0, text=f"Classified {result.rows:,} rows from {len(parts)} files in {result.seconds:.1f}s "
+                                f"({result.rows_per_second:,.0f} rows/s)")
+    return result
+
+
+def run_background_job(uploaded_file, task: str, key):
+    """Submit the upload as a job, or follow the job already running or finished for it"""
+    session_jobs = st.session_state.setdefault("bulk_jobs", {})
+    job = jobs.get(session_jobs[key]) if key in session_jobs else None
+    if job is None:
+        # Another session may already have classified the same file with the same model
+        job = jobs.find(task, key[1], key[2])
+    if job is None:
+        job = jobs.get(jobs.submit(uploaded_file, task, key[1]))
+    session_jobs[key] = job["id"]
+
+    if job["status"] in ACTIVE:
+        poll_job(job["id"])
+        return
+    if job["status"] == DONE:
+        result = jobs.result(job["id"])
+        st.caption(f"Background job finished: {result.rows:,} rows in {result.seconds:.1f}s "
+                   f"({result.rows_per_second:,.0f} rows/s)")
+    else:
+        result = jobs.result(job["id"], partial=True)
+        reason = "was cancelled" if job["status"] == CANCELLED else f"failed: {job['error']}"
+        st.warning(f"Background job {reason} after {job['rows_done']:,} rows.")
+        if st.button("▶️ Resume job", key=f"{task}_resume_{job['id']}"):
+            jobs.resume(job["id"])
+            st.rerun()
+    if result is not None and result.rows:
+        if result.warning:
+            st.warning(result.warning)
+        show_bulk_result(result)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job(job_id: str):
+    """Progress of a running job, refreshed on its own without rerunning the whole app"""
+    job = jobs.get(job_id)
+    if job is None or job["status"] not in ACTIVE:
+        st.rerun(scope="app")
+    if job["status"] == QUEUED:
+        text = "Waiting for a free worker..."
+    else:
+        rate = job["rows_done"] / job["seconds"] if job["seconds"] else 0.0
+        text = f"Classified {job['rows_done']:,} rows ({rate:,.0f} rows/s)"
+    st.progress(job_progress(job), text=text)
+    if job["cancel_requested"]:
+        st.caption("Cancelling after the current chunk...")
+    elif st.button("⏹️ Cancel job", key=f"cancel_{job_id}"):
+        jobs.cancel(job_id)
+        st.rerun(scope="fragment")
+
+
+def show_bulk_result(result: BulkResult):
+    """Aggregate counts and one page of rows at a time; the full result is only read on download"""
+    task = result.task
+    if result.model_version:
+        st.caption(f"Model version: {result.model_version}")
+    if result.cascade:
+        report = result.cascade
+        audit = (f"it disagreed with the full model on {report['disagreement_rate']:.2%} of "
+                 f"{report['audited']:,} audited rows" if report["audited"] else "no rows were audited")
+        st.caption(f"Cascade: the first stage decided {report['first_stage_share']:.1%} of rows at threshold "
+                   f"{report['threshold']:g}; {audit}. About {report['speedup']:.1f}x the speed of the full model.")
+        if 0 < report["speedup"] <= 1:
+            # The first stage costs about a third of a full predict, so it must decide about that share of rows
+            st.warning(f"Fast mode was no faster than the full model on this upload ({report['speedup']:.2f}x): "
+                       f"the first stage was sure of only {report['first_stage_share']:.1%} of rows. "
+                       "Lower the confidence threshold, or turn fast mode off for uploads like this one.")
+    if 0 < len(result.counts) <= 4:
+        for column, (label, count) in zip(st.columns(len(result.counts)), result.counts.items()):
+            column.metric(label, f"{count:,}", f"{count / result.rows:.1%}", delta_color="off")
+    elif result.counts:
+        st.bar_chart(pd.DataFrame({"Rows": result.counts}))
+
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{task}_page_size")
+    pages = max(1, math.ceil(result.rows / page_size))
+    # Keyed on the result file so a new result starts again at page 1
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1,
+                           key=f"{task}_page_{os.path.basename(result.path)}")
+    with METRICS.timer("page_read", task):
+        rows = result.read_rows((page - 1) * page_size, page_size)
+    with METRICS.timer("render", task):
+        st.dataframe(rows)
+
+    def open_result():
+        # Opened only when the button is clicked; Streamlit reads the file itself
+        return open(result.path, "rb")
+
+    st.download_button("⬇️ Download results", open_result, file_name=f"{task}_predictions.csv",
+                       mime="text/csv", key=f"{task}_download")
 
 
 with tab1:
@@ -305,28 +606,22 @@ with tab1:
         </div>
         """, unsafe_allow_html=True)
 
-    msg = st.text_input("Enter a message to classify")
-    if st.button("Detect Spam"):
-        pred = spam_model.predict([msg])
-        if pred[0] == 0:
+    spam_disabled = model_unavailable_warning("spam")
+    msg = st.text_input("Enter a message to classify", disabled=spam_disabled)
+    if st.button("Detect Spam", disabled=spam_disabled) and get_model("spam") is not None:
+        pred, version = scheduler.predict("spam", msg)
+        if pred == 0:
             st.success("❌ Spam Detected!", icon="⚠️")
-            st.image("spams.webp", width=300)
+            st.image(assets.image("spams.webp", 300), width=300)
         else:
             st.success("✅ Not Spam!", icon="👍")
-            st.image("tick.jpg", width=300)
-
-    uploaded_file = st.file_uploader("Upload a file (CSV or TXT)", type=["csv", "txt"])
-    if uploaded_file:
-        df = read_uploaded_file(uploaded_file)
-        if df is not None:
-            if len(df.columns) > 1:
-                st.warning("Using first column as messages")
-            df_spam = df[[df.columns[0]]].copy()
-            df_spam.columns = ["Msg"]
-            df_spam.index = range(1, df_spam.shape[0] + 1)
-            df_spam["Prediction"] = spam_model.predict(df_spam["Msg"])
-            df_spam["Prediction"] = df_spam["Prediction"].map({0: 'Spam', 1: 'Not Spam'})
-            st.dataframe(df_spam)
+            st.image(assets.image("tick.jpg", 300), width=300)
+        st.caption(f"Model version: {version}")
+
+    uploaded_files = st.file_uploader(UPLOAD_LABEL, type=UPLOAD_TYPES, accept_multiple_files=True, key="spam",
+                                      disabled=spam_disabled)
+    if uploaded_files and get_model("spam") is not None:
+        run_bulk_classification(uploaded_files, "spam")
 
 
 with tab2:
@@ -346,27 +641,16 @@ with tab2:
         </div>
         """, unsafe_allow_html=True)
 
-    text = st.text_area("Enter text to detect language")
-    if st.button("Detect Language"):
-        pred = language_model.predict([text])
-        st.success(f"🈯 Detected Language: **{pred[0]}**", icon="🌍")
-
-    uploaded_file = st.file_uploader("Upload a file (CSV or TXT)", type=["csv", "txt"], key="lang")
-    if uploaded_file:
-        df = read_uploaded_file(uploaded_file)
-        if df is not None:
-            if len(df.columns) > 1 and 'Text' in df.columns:
-                df_lang = df[['Text']].copy()
-            elif len(df.columns) > 1:
-                st.warning("Using first column as text")
-                df_lang = df[[df.columns[0]]].copy()
-                df_lang.columns = ['Text']
-            else:
-                df_lang = df.copy()
-                df_lang.columns = ['Text']
-            
-            df_lang["Language"] = language_model.predict(df_lang["Text"])
-            st.dataframe(df_lang)
+    lang_disabled = model_unavailable_warning("language")
+    text = st.text_area("Enter text to detect language", disabled=lang_disabled)
+    if st.button("Detect Language", disabled=lang_disabled) and get_model("language") is not None:
+        pred, version = scheduler.predict("language", text)
+        st.success(f"🈯 Detected Language: **{pred}**", icon="🌍")
+        st.caption(f"Model version: {version}")
+
+    uploaded_files = st.file_uploader(UPLOAD_LABEL, type=UPLOAD_TYPES, accept_multiple_files=True, key="lang", disabled=lang_disabled)
+    if uploaded_files and get_model("language") is not None:
+        run_bulk_classification(uploaded_files, "language")
 
 
 with tab3:
@@ -386,31 +670,19 @@ with tab3:
         </div>
         """, unsafe_allow_html=True)
 
-    review = st.text_area("Enter a food review")
-    if st.button("Analyze Sentiment"):
-        pred = review_model.predict([review])
-        if pred[0] == 0:
+    review_disabled = model_unavailable_warning("review")
+    review = st.text_area("Enter a food review", disabled=review_disabled)
+    if st.button("Analyze Sentiment", disabled=review_disabled) and get_model("review") is not None:
+        pred, version = scheduler.predict("review", review)
+        if pred == 0:
             st.success("👎 Negative Feedback", icon="😞")
         else:
             st.success("👍 Positive Feedback", icon="😊")
+        st.caption(f"Model version: {version}")
 
-    uploaded_file = st.file_uploader("Upload a file (CSV or TXT)", type=["csv", "txt"], key="review")
-    if uploaded_file:
-        df = read_uploaded_file(uploaded_file)
-        if df is not None:
-            if len(df.columns) > 1 and 'Review' in df.columns:
-                df_rev = df[['Review']].copy()
-            elif len(df.columns) > 1:
-                st.warning("Using first column as reviews")
-                df_rev = df[[df.columns[0]]].copy()
-                df_rev.columns = ['Review']
-            else:
-                df_rev = df.copy()
-                df_rev.columns = ['Review']
-            
-            df_rev["Sentiment"] = review_model.predict(df_rev["Review"])
-            df_rev["Sentiment"] = df_rev["Sentiment"].map({0: 'Negative Feedback', 1: 'Positive Feedback'})
-            st.dataframe(df_rev)
+    uploaded_files = st.file_uploader(UPLOAD_LABEL, type=UPLOAD_TYPES, accept_multiple_files=True, key="review", disabled=review_disabled)
+    if uploaded_files and get_model("review") is not None:
+        run_bulk_classification(uploaded_files, "review")
 
 
 with tab4:
@@ -423,57 +695,30 @@ with tab4:
         st.markdown("""
         <div class="model-info">
         <h4>Model Description</h4>
-        <p>This model is currently under development to deliver more accurate and reliable category 
-        predictions for news articles. I am improving its training data and algorithms to ensure 
-        better performance in classifying news into topics like sports, politics, and technology. 
-        Stay tuned for updates!</p>
+        <p>The news classification model sorts headlines and articles into topics like sports, 
+        politics, business and technology. It uses TF-IDF features and a Naive Bayes classifier, 
+        and shows the most likely categories with their probabilities, so close calls between 
+        related topics are easy to spot.</p>
         </div>
         """, unsafe_allow_html=True)
 
-    
-        if os.path.exists("under_construction.png"):
-            st.image("under_construction.png", width=300)
-        else:
-            st.warning("⚠️ under_construction.png not found in project folder.")
+    news_disabled = model_unavailable_warning("news")
+    article = st.text_area("Enter a news headline or article", disabled=news_disabled)
+    if st.button("Categorize Article", disabled=news_disabled) and get_model("news") is not None:
+        loaded = engine.snapshot("news")
+        categories, scores = engine.predict_top_k("news", [article], TASKS["news"]["top_k"], loaded)
+        st.success(f"📰 {categories[0, 0].title()}", icon="🗞️")
+        for category, score in zip(categories[0], scores[0]):
+            st.progress(float(score), text=f"{category.title()}: {score:.1%}")
+        st.caption(f"Model version: {loaded.version}")
+
+    uploaded_files = st.file_uploader(UPLOAD_LABEL, type=UPLOAD_TYPES, accept_multiple_files=True, key="news", disabled=news_disabled)
+    if uploaded_files and get_model("news") is not None:
+        run_bulk_classification(uploaded_files, "news")
 
 
 with tab5:
-    
-    st.markdown(
-        """
-        <style>
-        .portfolio-tab {
-            background: linear-gradient(to bottom, #1a1a2e, #16213e);
-            padding: 2rem;
-            border-radius: 15px;
-            margin: -1rem;
-        }
-        .portfolio-project {
-            background-color: rgba(255, 255, 255, 0.1);
-            padding: 1.5rem;
-            border-radius: 10px;
-            margin-bottom: 2rem;
-            border-left: 4px solid #4CAF50;
-        }
-        .project-title {
-            color: #4CAF50 !important;
-            margin-bottom: 1rem !important;
-        }
-        .project-image {
-            border-radius: 8px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-        }
-        .portfolio-tab p, .portfolio-tab li {
-            color: #ffffff !important;
-        }
-        .portfolio-tab h1, .portfolio-tab h2, .portfolio-tab h3 {
-            color: #4CAF50 !important;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-    
+    # The portfolio styles are part of APP_CSS
     with st.container():
         st.markdown('<div class="portfolio-tab">', unsafe_allow_html=True)
         
@@ -488,8 +733,9 @@ with tab5:
             
             col1, col2 = st.columns([1, 2])
             with col1:
-                if os.path.exists("netflix.png"):
-                    st.image("netflix.png", width=300, use_container_width=True, clamp=True, caption="Netflix Analysis Dashboard")
+                project_image = assets.image("netflix.png")
+                if project_image is not None:
+                    st.image(project_image, width=300, use_container_width=True, clamp=True, caption="Netflix Analysis Dashboard")
                 else:
                     st.warning("Image not found: netflix.png")
             
@@ -522,8 +768,9 @@ with tab5:
             
             col1, col2 = st.columns([1, 2])
             with col1:
-                if os.path.exists("ola.png"):
-                    st.image("ola.png", width=300, use_container_width=True, caption="Ola Rides Analysis Dashboard")
+                project_image = assets.image("ola.png")
+                if project_image is not None:
+                    st.image(project_image, width=300, use_container_width=True, caption="Ola Rides Analysis Dashboard")
                 else:
                     st.warning("Image not found: ola.png")
             
@@ -555,8 +802,9 @@ with tab5:
             
             col1, col2 = st.columns([1, 2])
             with col1:
-                if os.path.exists("musicstore.png"):
-                    st.image("musicstore.png", width=300, use_container_width=True, caption="Music Store Analysis")
+                project_image = assets.image("musicstore.png")
+                if project_image is not None:
+                    st.image(project_image, width=300, use_container_width=True, caption="Music Store Analysis")
                 else:
                     st.warning("Image not found: musicstore.png")
             
@@ -589,8 +837,9 @@ with tab5:
             
             col1, col2 = st.columns([1, 2])
             with col1:
-                if os.path.exists("dashboard.png"):
-                    st.image("dashboard.png", width=300, use_container_width=True, caption="E-Commerce Dashboard")
+                project_image = assets.image("dashboard.png")
+                if project_image is not None:
+                    st.image(project_image, width=300, use_container_width=True, caption="E-Commerce Dashboard")
                 else:
                     st.warning("Image not found: dashboard.png")
             
@@ -615,3 +864,168 @@ with tab5:
             st.markdown('</div>', unsafe_allow_html=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
+
+
+with tab6:
+    st.header("🧩 Analyze All")
+
+    with st.container():
+        st.markdown("""
+        <div class="model-info">
+        <h4>One Pass, Every Model</h4>
+        <p>Runs the spam, language and sentiment models over the same file at once. The upload is 
+        read a single time, models that tokenize text the same way share one tokenization, and all 
+        models predict concurrently into one joined table.</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # is_available only checks the files, so the models still load on first use
+    all_tasks = [task for task in MULTI_TASKS if registry.is_available(task)]
+    if all_tasks:
+        st.caption(f"Models included: {', '.join(all_tasks)}")
+    else:
+        st.warning("⚠️ None of the models are currently available.")
+    uploaded_files = st.file_uploader(UPLOAD_LABEL, type=UPLOAD_TYPES, accept_multiple_files=True, key="all",
+                                      disabled=not all_tasks)
+    if uploaded_files and all_tasks:
+        run_bulk_classification(uploaded_files, ALL_TASKS)
+
+
+def start_stream(source_kind: str, path: str, from_start: bool, port: int, text_key: str, sink_path: str,
+                 tasks):
+    """Start classifying the chosen feed on the background stream runner"""
+    sink = JsonlSink(sink_path)
+    pipeline = StreamPipeline(MultiTaskPredictor(registry, engine, tasks).predict_all_versioned, sink)
+    if source_kind == STREAM_SOURCES[0]:
+        async def source(inbox, stop, stats):
+            await tail_jsonl(path, inbox, stop, stats, text_key, from_start)
+        description = f"Following {path}"
+    else:
+        async def source(inbox, stop, stats):
+            await listen_socket("127.0.0.1", port, inbox, stop, stats, text_key)
+        description = f"Listening on 127.0.0.1:{port}"
+    stream.start(pipeline, source, f"{description}, writing to {sink_path}", on_exit=sink.close)
+
+
+@st.fragment(run_every=STREAM_REFRESH_SECONDS)
+def show_stream_stats():
+    """Rolling throughput and label rates of the live stream, refreshed without rerunning the app"""
+    if stream.pipeline is None:
+        return
+    summary = stream.pipeline.stats.summary()
+    columns = st.columns(4)
+    columns[0].metric("Messages/s (last 10 s)", f"{summary['messages_per_second']:,.1f}")
+    columns[1].metric("Classified", f"{summary['classified']:,}")
+    columns[2].metric("Queue depth", f"{summary['queue_depth']:,}")
+    columns[3].metric("Latency p95", f"{summary['latency_p95_ms']:,.1f} ms")
+    st.caption(f"{summary['batches']:,} batches, mean size {summary['mean_batch_size']:.1f}; "
+               f"latency p50 {summary['latency_p50_ms']:.1f} ms; {summary['skipped']:,} lines without text skipped")
+
+    history = stream.pipeline.stats.history()
+    if history:
+        frame = pd.DataFrame(history).fillna(0)
+        frame["second"] = pd.to_datetime(frame["second"], unit="s")
+        frame = frame.set_index("second")
+        st.markdown("**Throughput (messages/s)**")
+        st.line_chart(frame["messages"])
+        labels = frame.drop(columns="messages")
+        if not labels.empty:
+            st.markdown("**Label rates (messages/s)**")
+            st.line_chart(labels)
+
+
+with tab7:
+    st.header("📡 Live Stream")
+
+    with st.container():
+        st.markdown("""
+        <div class="model-info">
+        <h4>Real-Time Feed Classification</h4>
+        <p>Point Sense Box at a live feed, a JSONL file that keeps growing or a local socket receiving 
+        one message per line, and every message is classified as it arrives. Results are appended to a 
+        JSONL file and the charts below follow the throughput and label rates.</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+    stream_tasks = [task for task in MULTI_TASKS if registry.is_available(task)]
+    if STREAM_DIR is None:
+        st.info("The live stream is turned off. To turn it on, set SENSEBOX_STREAM_DIR to the directory "
+                "it may follow feeds in and write results to. The stream is shared: every visitor of the "
+                "app can start and stop it, so only turn it on where the visitors are trusted.")
+    elif stream.running:
+        st.info(f"▶️ {stream.description}")
+        if st.button("⏹️ Stop stream", key="stream_stop"):
+            stream.stop()
+            st.rerun()
+    else:
+        if stream.error:
+            st.error(f"The stream stopped: {stream.error}")
+        if not stream_tasks:
+            st.warning("⚠️ None of the models are currently available.")
+        source_kind = st.radio("Source", STREAM_SOURCES, horizontal=True, key="stream_source")
+        if source_kind == STREAM_SOURCES[0]:
+            feed_path = st.text_input(f"JSONL file to follow, in {STREAM_DIR}", key="stream_path")
+            from_start = st.checkbox("Classify the lines already in the file first", key="stream_from_start")
+            port = None
+        else:
+            feed_path, from_start = None, False
+            port = st.number_input("Port", min_value=1024, max_value=65535, value=9009, key="stream_port")
+        text_key = st.text_input("Text field of each JSON message", value="text", key="stream_text_key")
+        sink_path = st.text_input(f"Append results to (JSONL), in {STREAM_DIR}", key="stream_sink",
+                                  value="sensebox_stream.jsonl")
+        ready = bool(stream_tasks) and bool(sink_path) and (port is not None or bool(feed_path))
+        if st.button("▶️ Start stream", key="stream_start", disabled=not ready):
+            try:
+                start_stream(source_kind, feed_path and stream_path(feed_path, STREAM_DIR), from_start,
+                             int(port or 0), text_key, stream_path(sink_path, STREAM_DIR), stream_tasks)
+            except (OSError, ValueError) as e:
+                st.error(f"Could not start the stream: {e}")
+            else:
+                st.rerun()
+    show_stream_stats()
+
+
+with st.sidebar:
+    with st.expander("⏱️ Model Status"):
+        for name, status in registry.status().items():
+            st.markdown(f"**{name}**: {status}")
+        if WARMUP:
+            report = readiness.report()
+            if not report["warmed"]:
+                st.caption("Warming up the models...")
+            for name, check in report["models"].items():
+                if check["status"] == FAILED:
+                    st.error(f"{name} failed its start-up check: {check['error']}")
+                elif "first_predict_ms" in check:
+                    st.caption(f"{name} warmed up: first predict {check['first_predict_ms']:.1f} ms, "
+                               f"then {check['warm_predict_ms']:.1f} ms")
+        for name, stats in engine.cache_stats().items():
+            st.caption(f"{name} cache: {stats['size']:,} entries, {stats['hits']:,} hits / "
+                       f"{stats['misses']:,} misses ({stats['hit_rate']:.0%})")
+        batching = scheduler.metrics()
+        if batching["batches"]:
+            st.caption(f"Micro-batching: {batching['requests']:,} requests in {batching['batches']:,} batches "
+                       f"(mean size {batching['mean_batch_size']:.1f}), queue delay "
+                       f"p50 {batching['queue_delay_p50_ms']:.1f} ms / p95 {batching['queue_delay_p95_ms']:.1f} ms")
+        asset_stats = assets.STATS.summary()
+        st.caption(f"Static assets: {asset_stats['assets']} prepared once in "
+                   f"{asset_stats['prepare_seconds'] * 1000:,.0f} ms, reused {asset_stats['reuses']:,} times, "
+                   f"saving {asset_stats['saved_seconds'] * 1000:,.0f} ms of file loading and "
+                   f"{asset_stats['saved_bytes'] / 1024 / 1024:,.1f} MB sent to browsers")
+
+    if METRICS.enabled:
+        with st.expander("🛠️ Developer Metrics"):
+            stages = METRICS.snapshot()
+            if stages:
+                st.dataframe(pd.DataFrame(stages).round(3), hide_index=True)
+            for name, value in METRICS.counters().items():
+                st.caption(f"{name} = {value:,.0f}")
+            st.download_button("⬇️ Prometheus metrics", METRICS.render_prometheus, file_name="sensebox_metrics.prom",
+                               mime="text/plain", key="metrics_download")
+
+    recent_jobs = jobs.list_jobs(limit=5)
+    if recent_jobs:
+        with st.expander("🧵 Background Jobs"):
+            for job in recent_jobs:
+                st.markdown(f"**{job['source_name']}** ({job['task']}): {job['status']}, "
+                            f"{job['rows_done']:,} rows, {job_progress(job):.0%}")
@@ -0,0 +1,192 @@
+"""Static assets for the Streamlit app, prepared once per process.
+
+    python assets.py        # warm the on-disk image cache and report the savings
+
+Images are decoded once, downscaled to the widest size they are shown at
+(twice the CSS width, for high-DPI screens) and re-encoded as WebP. The
+encoded bytes are also kept under SENSEBOX_ASSET_CACHE, so a new server
+process does not repeat the work. Lottie animations are parsed once and the
+stylesheet is minified once. STATS records what each asset cost to prepare
+and how often a rerun reused it instead.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+try:
+    from PIL import Image, features
+except ImportError:  # Streamlit depends on Pillow, but images are still served unoptimized without it
+    Image = None
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_CACHE_DIR = os.environ.get("SENSEBOX_ASSET_CACHE", os.path.join(tempfile.gettempdir(), "sensebox_assets"))
+
+# Widest any image is displayed at, in CSS pixels
+DEFAULT_DISPLAY_WIDTH = 400
+WEBP_QUALITY = 85
+
+
+class AssetStats:
+    """Per-asset preparation cost, reuse count and size before and after optimization"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.load_seconds = {}
+        self.baseline_seconds = {}
+        self.original_bytes = {}
+        self.served_bytes = {}
+        self.hits = Counter()
+
+    def record_load(self, key: str, seconds: float, baseline: float, original: int, served: int):
+        with self._lock:
+            self.load_seconds[key] = seconds
+            self.baseline_seconds[key] = baseline
+            self.original_bytes[key] = original
+            self.served_bytes[key] = served
+
+    def record_hit(self, key: str):
+        with self._lock:
+            self.hits[key] += 1
+
+    def summary(self) -> Dict[str, float]:
+        """Totals since start-up; saved_* is what re-reading the original files on every rerun would have cost"""
+        with self._lock:
+            return {
+                "assets": len(self.load_seconds),
+                "reuses": sum(self.hits.values()),
+                "prepare_seconds": sum(self.load_seconds.values()),
+                "saved_seconds": sum(self.baseline_seconds[key] * hits for key, hits in self.hits.items()),
+                "saved_bytes": sum((self.original_bytes[key] - self.served_bytes[key]) * (hits + 1)
+                                   for key, hits in self.hits.items()),
+            }
+
+
+STATS = AssetStats()
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key: str, load):
+    """Return the cached value for key, or call load() -> (value, baseline_seconds, original_bytes, served_bytes)"""
+    with _cache_lock:
+        if key in _cache:
+            STATS.record_hit(key)
+            return _cache[key]
+    start = time.perf_counter()
+    value, baseline, original, served = load()
+    STATS.record_load(key, time.perf_counter() - start, baseline, original, served)
+    with _cache_lock:
+        return _cache.setdefault(key, value)
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _optimize(data: bytes, max_width: int) -> bytes:
+    """data downscaled to at most max_width pixels wide and re-encoded as WebP, if that makes it smaller"""
+    if Image is None or not features.check("webp"):
+        return data
+    try:
+        image = Image.open(io.BytesIO(data))
+        if getattr(image, "is_animated", False):
+            return data
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+    except OSError:
+        return data
+    optimized = buffer.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+def image(name: str, display_width: int = DEFAULT_DISPLAY_WIDTH) -> Optional[bytes]:
+    """Optimized bytes of the image file name, or None if it does not exist"""
+    path = os.path.join(BASE_DIR, name)
+    max_width = display_width * 2
+
+    def load():
+        start = time.perf_counter()
+        data = _read(path)
+        baseline = time.perf_counter() - start
+        if data is None:
+            return None, baseline, 0, 0
+        stat = os.stat(path)
+        digest = hashlib.sha256(f"{name}:{stat.st_mtime_ns}:{stat.st_size}:{max_width}:{WEBP_QUALITY}".encode())
+        cached_path = os.path.join(ASSET_CACHE_DIR, digest.hexdigest()[:32])
+        optimized = _read(cached_path)
+        if optimized is None:
+            optimized = _optimize(data, max_width)
+            try:
+                os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=ASSET_CACHE_DIR)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(optimized)
+                os.replace(tmp_path, cached_path)
+            except OSError:
+                pass
+        return optimized, baseline, len(data), len(optimized)
+
+    return _cached(f"image:{name}:{max_width}", load)
+
+
+def lottie(name: str) -> Optional[dict]:
+    """Parsed Lottie animation from the JSON file name, or None if it is missing or invalid"""
+    path = os.path.join(BASE_DIR, name)
+
+    def load():
+        start = time.perf_counter()
+        data = _read(path)
+        try:
+            animation = json.loads(data) if data is not None else None
+        except ValueError:
+            animation = None
+        size = len(data) if data is not None else 0
+        return animation, time.perf_counter() - start, size, size
+
+    return _cached(f"lottie:{name}", load)
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).replace(";}", "}").strip()
+
+
+def stylesheet(css: str) -> str:
+    """A <style> block with css minified, built once per distinct stylesheet"""
+    def load():
+        start = time.perf_counter()
+        block = f"<style>{minify_css(css)}</style>"
+        return block, time.perf_counter() - start, len(css.encode()), len(block.encode())
+
+    return _cached(f"css:{hashlib.sha256(css.encode()).hexdigest()[:16]}", load)
+
+
+def main():
+    names = sorted(name for name in os.listdir(BASE_DIR) if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+    for name in names:
+        start = time.perf_counter()
+        data = image(name)
+        seconds = time.perf_counter() - start
+        original = os.path.getsize(os.path.join(BASE_DIR, name))
+        print(f"{name}: {original:,} B -> {len(data):,} B, prepared in {seconds * 1000:.1f} ms")
+    print(f"Optimized images cached in {ASSET_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Sequence
+
+
+DEFAULT_WINDOW_MS = float(os.environ.get("SENSEBOX_BATCH_WINDOW_MS", 5))
+DEFAULT_MAX_BATCH = int(os.environ.get("SENSEBOX_MAX_BATCH", 64))
+
+# How many recent queueing delays to keep for the percentiles
+DELAY_SAMPLES = 1_000
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MicroBatchScheduler:
+    """Combines single-text predictions from all sessions into vectorized predict calls.
+
+    Requests for a model are collected until window_ms has passed since the first
+    one arrived or max_batch requests are waiting, whichever comes first.
+    """
+
+    def __init__(self, predict: Callable[[str, Sequence[str]], Sequence], window_ms: float = DEFAULT_WINDOW_MS,
+                 max_batch: int = DEFAULT_MAX_BATCH):
+        self._predict = predict
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._delays = deque(maxlen=DELAY_SAMPLES)
+        self._requests = 0
+
+    def submit(self, name: str, text: str) -> Future:
+        future = Future()
+        self._queue(name).put((text, time.perf_counter(), future))
+        return future
+
+    def predict(self, name: str, text: str, timeout: Optional[float] = None):
+        """Blocking single-text prediction"""
+        return self.submit(name, text).result(timeout)
+
+    def _queue(self, name: str) -> queue.Queue:
+        with self._lock:
+            if name not in self._queues:
+                self._queues[name] = queue.Queue()
+                threading.Thread(target=self._run, args=(name, self._queues[name]),
+                                 name=f"microbatch-{name}", daemon=True).start()
+            return self._queues[name]
+
+    def _run(self, name: str, requests: queue.Queue):
+        while True:
+            batch = [requests.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    batch.append(requests.get(timeout=timeout) if timeout > 0 else requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._requests += len(batch)
+                self._delays.extend(started - enqueued for _, enqueued, _ in batch)
+
+            try:
+                predictions = self._predict(name, [text for text, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), prediction in zip(batch, predictions):
+                future.set_result(prediction)
+
+    def metrics(self) -> Dict[str, object]:
+        """Batch size histogram and queueing delay percentiles (in milliseconds)"""
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            delays = list(self._delays)
+            return {
+                "requests": self._requests,
+                "batches": batches,
+                "mean_batch_size": self._requests / batches if batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "queue_delay_p50_ms": _percentile(delays, 0.50) * 1000,
+                "queue_delay_p95_ms": _percentile(delays, 0.95) * 1000,
+                "queue_delay_max_ms": max(delays, default=0.0) * 1000,
+            }
@@ -0,0 +1,363 @@
+"""Offline benchmarks for the Sense Box models and bulk path.
+
+    python benchmark.py --rows 1000 10000 100000 --output bench.json
+    python benchmark.py --compare bench.json     # fail if anything regressed
+
+Measures model load time per pickle, single-message latency (p50/p99), bulk
+throughput through the app's chunked upload path, and peak memory when
+uploading the same corpus as CSV and as TXT, and how much of a bulk run the
+confidence-gated cascade decides without the full model, and a sharded upload
+classified file by file versus all at once. Corpora are synthetic and
+seeded, so runs are comparable across commits.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+from bulk import ALL_TASKS, classify_chunks, classify_files, text_columns
+from cascade import CASCADE_TASKS, compare as compare_cascade, default_threshold
+from ingest import iter_upload_chunks
+from inference import ParallelPredictor
+from model_registry import ModelRegistry, load_model
+from multitask import MultiTaskPredictor, available_tasks
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+
+SPAM_PHRASES = [
+    "WINNER!! You have been selected to receive a {amount} prize",
+    "URGENT: your account has been suspended, call {phone} now",
+    "Free entry to win {amount} cash, text WIN to {short}",
+    "Congratulations, claim your free {item} today at {url}",
+]
+HAM_PHRASES = [
+    "Hey, are we still on for {meal} {day}?",
+    "I'll be home late tonight, can you pick up {item}?",
+    "Running a bit late, see you at the {place} in 10",
+    "Thanks for {meal} {day}, it was great to catch up",
+]
+REVIEW_PHRASES = [
+    "The {dish} was {good} and the service was {good}",
+    "Really {bad} {dish}, would not order again",
+    "{good} portions, {bad} delivery time",
+    "Best {dish} in town, absolutely {good}",
+]
+FILLERS = {
+    "amount": ["£1000", "$500", "€2,000", "1 million"],
+    "phone": ["09061701461", "0800 123 456", "87121"],
+    "short": ["87121", "80086", "69669"],
+    "item": ["iPhone", "gift card", "holiday", "milk", "bread"],
+    "url": ["www.win-now.biz", "bit.ly/claim", "prize.example"],
+    "meal": ["lunch", "dinner", "coffee", "breakfast"],
+    "day": ["tomorrow", "on Friday", "this weekend", "tonight"],
+    "place": ["station", "office", "cafe", "gym"],
+    "dish": ["pizza", "curry", "burger", "pasta", "sushi"],
+    "good": ["amazing", "delicious", "great", "lovely", "fresh"],
+    "bad": ["cold", "bland", "awful", "soggy", "slow"],
+}
+
+
+def synthetic_corpus(kind: str, size: int, seed: int = 0):
+    """Generate size messages ('messages') or food reviews ('reviews')"""
+    rng = random.Random(seed)
+    phrases = REVIEW_PHRASES if kind == "reviews" else SPAM_PHRASES + HAM_PHRASES
+    texts = []
+    for i in range(size):
+        text = rng.choice(phrases).format(**{key: rng.choice(values) for key, values in FILLERS.items()})
+        # A unique suffix keeps the prediction cache from hiding the real cost
+        texts.append(f"{text} #{i}")
+    return texts
+
+
+def as_upload(texts, fmt: str):
+    """Wrap a corpus in a file-like object that looks like a Streamlit upload"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        buffer.write("Msg\n")
+        for text in texts:
+            buffer.write('"' + text.replace('"', '""') + '"\n')
+        data = buffer.getvalue().encode("utf-8")
+    else:
+        data = "\n".join(texts).encode("utf-8")
+    upload = io.BytesIO(data)
+    upload.name = f"benchmark.{fmt}"
+    upload.size = len(data)
+    return upload
+
+
+def bench_load(registry: ModelRegistry, repeats: int):
+    """In-process load time per model file, plus a cold start in a fresh interpreter"""
+    results = {}
+    for name in registry.files:
+        paths = {"pickle": registry.pickle_path(name)}
+        if registry.path(name) != paths["pickle"]:
+            paths["compact"] = registry.path(name)
+        for fmt, path in paths.items():
+            if not os.path.exists(path):
+                continue
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                load_model(path)
+                timings.append(time.perf_counter() - start)
+            cold = subprocess.run(
+                [sys.executable, "-W", "ignore", "-c",
+                 "import time; s = time.perf_counter(); from model_registry import load_model; load_model(%r); "
+                 "print(time.perf_counter() - s)" % path],
+                capture_output=True, text=True, check=True, cwd=BASE_DIR,
+            )
+            if os.path.isdir(path):
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            else:
+                size = os.path.getsize(path)
+            results[f"{name}_{fmt}"] = {
+                "file_bytes": size,
+                "median_load_ms": statistics.median(timings) * 1000,
+                "cold_start_ms": float(cold.stdout.strip().splitlines()[-1]) * 1000,
+            }
+    return results
+
+
+def bench_single(registry: ModelRegistry, iterations: int, seed: int):
+    results = {}
+    for name, kind in (("spam", "messages"), ("language", "messages"), ("review", "reviews")):
+        model = registry.get(name)
+        if model is None:
+            continue
+        texts = synthetic_corpus(kind, iterations, seed)
+        timings = []
+        for text in texts:
+            start = time.perf_counter()
+            model.predict([text])
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[name] = {
+            "iterations": iterations,
+            "p50_ms": timings[len(timings) // 2] * 1000,
+            "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+        }
+    return results
+
+
+def bench_bulk(registry: ModelRegistry, row_counts, workers: int, seed: int):
+    """Rows per second through ingest + classify_chunks, as the bulk tabs run it"""
+    engine = ParallelPredictor(registry, workers=workers, cache_size=0)
+    results = {}
+    try:
+        for name, kind in (("spam", "messages"), ("language", "messages"), ("review", "reviews"),
+                           ("news", "messages")):
+            if registry.get(name) is None:
+                continue
+            results[name] = {}
+            for rows in row_counts:
+                upload = as_upload(synthetic_corpus(kind, rows, seed), "csv")
+                chunks = iter_upload_chunks(upload, engine.chunk_size, text_columns(name))
+                result = classify_chunks(chunks, engine.for_model(name), name)
+                os.remove(result.path)
+                results[name][str(rows)] = {"seconds": result.seconds, "rows_per_second": result.rows_per_second}
+    finally:
+        engine.shutdown()
+    return results
+
+
+def bench_multitask(registry: ModelRegistry, rows: int, seed: int):
+    """Wall time to run every model over one corpus: one bulk run per model versus one "analyze all" pass"""
+    tasks = available_tasks(registry)
+    if not tasks:
+        return {}
+    engine = ParallelPredictor(registry, workers=1, cache_size=0)
+    upload = as_upload(synthetic_corpus("messages", rows, seed), "csv")
+    try:
+        start = time.perf_counter()
+        for name in tasks:
+            os.remove(classify_chunks(iter_upload_chunks(upload, text_columns=text_columns(name)),
+                                      engine.for_model(name), name).path)
+        separate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predictor = MultiTaskPredictor(registry, engine, tasks)
+        os.remove(classify_chunks(iter_upload_chunks(upload, text_columns=text_columns(ALL_TASKS)), predictor,
+                                  ALL_TASKS).path)
+        combined = time.perf_counter() - start
+    finally:
+        engine.shutdown()
+    return {"tasks": ",".join(tasks), "rows": rows, "separate_seconds": separate, "combined_seconds": combined,
+            "speedup": separate / combined if combined else 0.0}
+
+
+def bench_files(registry: ModelRegistry, shards: int, rows: int, workers: int, seed: int):
+    """Wall time for an upload split into shards: one bulk run per shard versus classify_files"""
+    if registry.get("spam") is None:
+        return {}
+    engine = ParallelPredictor(registry, workers=workers, cache_size=0)
+    uploads = [as_upload(synthetic_corpus("messages", rows, seed + i), "csv") for i in range(shards)]
+    try:
+        start = time.perf_counter()
+        for upload in uploads:
+            os.remove(classify_chunks(iter_upload_chunks(upload, engine.chunk_size, text_columns("spam")),
+                                      engine.for_model("spam"), "spam").path)
+        separate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        os.remove(classify_files(uploads, engine.for_model("spam"), "spam", engine.chunk_size).path)
+        combined = time.perf_counter() - start
+    finally:
+        engine.shutdown()
+    return {"shards": shards, "rows": shards * rows, "separate_seconds": separate, "combined_seconds": combined,
+            "speedup": separate / combined if combined else 0.0}
+
+
+def bench_cascade(registry: ModelRegistry, rows: int, seed: int):
+    """Share of rows the cascade's first stage decides, its disagreement with the full model and the speed-up"""
+    engine = ParallelPredictor(registry, workers=1, cache_size=0)
+    results = {}
+    try:
+        for name in CASCADE_TASKS:
+            if registry.get(name) is None:
+                continue
+            kind = "reviews" if name == "review" else "messages"
+            try:
+                row = compare_cascade(engine, name, synthetic_corpus(kind, rows, seed),
+                                      [default_threshold(name)])[0]
+            except ValueError:
+                # The model is not a binary TF-IDF pipeline the first stage can be built from
+                continue
+            results[name] = {key: row[key] for key in
+                             ("first_stage_share", "disagreement_rate", "full_seconds", "cascade_seconds", "speedup")}
+    finally:
+        engine.shutdown()
+    return results
+
+
+def bench_memory(registry: ModelRegistry, rows: int, seed: int):
+    """Peak traced memory for reading and for classifying the same corpus as CSV and TXT"""
+    model = registry.get("spam")
+    texts = synthetic_corpus("messages", rows, seed)
+    results = {}
+    for fmt in ("csv", "txt"):
+        upload = as_upload(texts, fmt)
+        tracemalloc.start()
+        for _ in iter_upload_chunks(upload):
+            pass
+        _, read_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        entry = {"upload_bytes": upload.size, "read_peak_bytes": read_peak}
+        if model is not None:
+            tracemalloc.start()
+            result = classify_chunks(iter_upload_chunks(upload, text_columns=text_columns("spam")), model, "spam")
+            _, classify_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            os.remove(result.path)
+            entry["classify_peak_bytes"] = classify_peak
+        results[fmt] = entry
+    return results
+
+
+# Metrics where a larger value is a regression; everything else compared is "higher is better"
+LOWER_IS_BETTER = ("_ms", "_bytes", "seconds", "disagreement_rate")
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(previous, current, tolerance: float):
+    """Return a description of every metric that got worse by more than tolerance"""
+    old = _flatten(previous["results"])
+    new = _flatten(current["results"])
+    regressions = []
+    for key, before in old.items():
+        after = new.get(key)
+        if after is None or not before or key.endswith(("file_bytes", "upload_bytes", "iterations", ".rows")):
+            continue
+        change = (after - before) / before
+        if not key.endswith(LOWER_IS_BETTER):
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{key}: {before:,.3f} -> {after:,.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sense Box models and bulk upload path")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Row counts for the bulk throughput benchmark")
+    parser.add_argument("--single-iterations", type=int, default=500)
+    parser.add_argument("--load-repeats", type=int, default=3)
+    parser.add_argument("--memory-rows", type=int, default=50_000)
+    parser.add_argument("--multitask-rows", type=int, default=50_000)
+    parser.add_argument("--cascade-rows", type=int, default=50_000)
+    parser.add_argument("--shards", type=int, default=8, help="Files in the multi-file upload benchmark")
+    parser.add_argument("--shard-rows", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=1, help="Process pool size for the bulk benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Previous results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown allowed before --compare reports a regression")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    registry = ModelRegistry(args.model_dir)
+    print("Benchmarking model load time...")
+    results = {"load": bench_load(registry, args.load_repeats)}
+    print("Benchmarking single-message latency...")
+    results["single"] = bench_single(registry, args.single_iterations, args.seed)
+    print("Benchmarking bulk throughput...")
+    results["bulk"] = bench_bulk(registry, args.rows, args.workers, args.seed)
+    print("Benchmarking analyze-all against separate runs...")
+    results["multitask"] = bench_multitask(registry, args.multitask_rows, args.seed)
+    print("Benchmarking a sharded upload...")
+    results["files"] = bench_files(registry, args.shards, args.shard_rows, args.workers, args.seed)
+    print("Benchmarking the cascade against the full model...")
+    results["cascade"] = bench_cascade(registry, args.cascade_rows, args.seed)
+    print("Benchmarking upload memory...")
+    results["memory"] = bench_memory(registry, args.memory_rows, args.seed)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print("Regressions against", args.compare)
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions against", args.compare)
+
+
+if __name__ == "__main__":
+    main()
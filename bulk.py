@@ -0,0 +1,459 @@
+"""Bulk classification of uploads.
+
+Uploads are read in chunks of CHUNK_SIZE rows (see ingest.py), each chunk is
+labelled by the task's model, and the labelled rows are appended to a result
+CSV on disk by a ResultWriter. The writer also keeps the label counts and a
+row -> byte offset index, so BulkResult.read_rows() can page through the file
+without holding it in memory. ResultStore keeps a session's finished results
+for reruns.
+
+classify_files() splits a multi-file upload by file: up to FILE_WORKERS files
+are read and predicted on threads of their own, and their chunks are appended
+to one result as they finish, with SOURCE_COLUMN naming each row's file.
+"""
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+from ingest import CHUNK_SIZE, iter_upload_chunks, pick_text_column, upload_progress
+from metrics import METRICS
+
+
+# Granularity of the row -> byte offset index kept for paging through results
+INDEX_ROWS = 1_000
+
+# Limits for the finished results each session keeps around for reruns
+MAX_STORED_RESULTS = int(os.environ.get("SENSEBOX_MAX_STORED_RESULTS", 6))
+MAX_STORED_BYTES = int(os.environ.get("SENSEBOX_MAX_STORED_MB", 512)) * 1024 * 1024
+
+# Files of a multi-file upload that are read and classified at the same time
+FILE_WORKERS = int(os.environ.get("SENSEBOX_FILE_WORKERS", min(8, os.cpu_count() or 1)))
+# How often classify_files reports per-file progress
+FILE_PROGRESS_SECONDS = 0.25
+
+# First column of a multi-file result: the file each row came from
+SOURCE_COLUMN = "Source file"
+
+
+TASKS = {
+    "spam": {
+        "column": "Msg",
+        "preferred": ("Msg", "Message"),
+        "output": "Prediction",
+        "labels": {0: 'Spam', 1: 'Not Spam'},
+        "warning": "Using first column as messages",
+    },
+    "language": {
+        "column": "Text",
+        "preferred": ("Text",),
+        "output": "Language",
+        "labels": None,
+        "warning": "Using first column as text",
+    },
+    "review": {
+        "column": "Review",
+        "preferred": ("Review",),
+        "output": "Sentiment",
+        "labels": {0: 'Negative Feedback', 1: 'Positive Feedback'},
+        "warning": "Using first column as reviews",
+    },
+    "news": {
+        "column": "Article",
+        "preferred": ("Article", "Headline", "Text", "short_description", "Description"),
+        "output": "Category",
+        "labels": None,
+        "warning": "Using first column as articles",
+        # Keep the k most probable categories and their probabilities instead of a single prediction
+        "top_k": 3,
+    },
+}
+
+# Pseudo-task that runs every available model over the same text column in one pass
+ALL_TASKS = "all"
+ALL_TASKS_SPEC = {"column": "Text", "preferred": ("Text", "Msg", "Message", "Review"),
+                  "warning": "Using first column as text"}
+
+
+def task_spec(task: str) -> dict:
+    return ALL_TASKS_SPEC if task == ALL_TASKS else TASKS[task]
+
+
+def text_columns(task: str):
+    """Candidate text column names for task, to pass to iter_upload_chunks"""
+    return task_spec(task)["preferred"]
+
+
+def top_k_columns(spec: dict) -> List[str]:
+    """Category, Score, Category 2, Score 2, ... for a top_k task"""
+    columns = []
+    for rank in range(1, spec["top_k"] + 1):
+        suffix = f" {rank}" if rank > 1 else ""
+        columns += [f"{spec['output']}{suffix}", f"Score{suffix}"]
+    return columns
+
+
+def task_columns(task: str, tasks: Optional[Iterable[str]] = None) -> List[str]:
+    """Columns of the result file: the text, then one prediction column per task"""
+    if task == ALL_TASKS:
+        return [ALL_TASKS_SPEC["column"]] + [TASKS[name]["output"] for name in tasks]
+    spec = TASKS[task]
+    if spec.get("top_k"):
+        return [spec["column"]] + top_k_columns(spec)
+    return [spec["column"], spec["output"]]
+
+
+def label_columns(task: str, columns: List[str]) -> List[str]:
+    """The columns of a result whose values are counted: every prediction column, not the scores"""
+    if task == ALL_TASKS:
+        return [column for column in columns if column not in (SOURCE_COLUMN, ALL_TASKS_SPEC["column"])]
+    return [TASKS[task]["output"]]
+
+
+class BulkResult:
+    """Summary of a finished bulk run. The predictions themselves live in the CSV at path.
+
+    offsets[i] is the byte offset of row i * INDEX_ROWS in that file, so a page of rows can
+    be read without scanning the file from the start.
+    """
+
+    def __init__(self, path: str, task: str, rows: int, seconds: float, counts: Dict[str, int],
+                 offsets: List[int], warning: Optional[str], columns: Optional[List[str]] = None,
+                 model_version: Optional[str] = None, cascade: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.task = task
+        self.rows = rows
+        self.seconds = seconds
+        self.counts = counts
+        self.offsets = offsets
+        self.warning = warning
+        self.columns = columns or task_columns(task)
+        # Every row of a run is predicted by the same model version
+        self.model_version = model_version
+        # CascadePredictor.report() when the run went through the cascade
+        self.cascade = cascade
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def read_rows(self, start: int, count: int) -> pd.DataFrame:
+        """Rows start .. start + count of the result, indexed by their 1-based row number"""
+        start = max(0, min(start, self.rows))
+        count = max(0, min(count, self.rows - start))
+        block = start // INDEX_ROWS
+        skip = start - block * INDEX_ROWS
+        if count == 0:
+            page = pd.DataFrame(columns=self.columns)
+        else:
+            with open(self.path, "rb") as f:
+                f.seek(self.offsets[block])
+                page = pd.read_csv(f, header=None, names=self.columns, nrows=skip + count,
+                                   dtype=str, keep_default_na=False).iloc[skip:]
+        page.index = range(start + 1, start + len(page) + 1)
+        return page
+
+
+def text_column(chunk: pd.DataFrame, task: str):
+    """Column of the first chunk to classify, and the warning to show if it was a fallback"""
+    spec = task_spec(task)
+    # Uploads read with text_columns only hold the text column; pick from every column they had
+    column, fallback = pick_text_column(chunk.attrs.get("source_columns") or list(chunk.columns), spec["preferred"])
+    return column, spec["warning"] if fallback else None
+
+
+def label_chunk(chunk: pd.DataFrame, model, task: str, column) -> pd.DataFrame:
+    """Predict one chunk and return it as the task's two output columns.
+
+    For ALL_TASKS, model is a MultiTaskPredictor and there is one prediction column per model.
+    """
+    if task == ALL_TASKS:
+        return _label_chunk_all(chunk, model, column)
+    spec = TASKS[task]
+    if spec.get("top_k"):
+        return _label_chunk_top_k(chunk, model, spec, column)
+    start = time.perf_counter()
+    result = pd.DataFrame({spec["column"]: chunk[column]})
+    built = time.perf_counter()
+    predictions = model.predict(result[spec["column"]])
+    predicted = time.perf_counter()
+    result[spec["output"]] = predictions
+    if spec["labels"] is not None:
+        result[spec["output"]] = result[spec["output"]].map(spec["labels"])
+    # Frame construction and label mapping, without the predict call in between
+    METRICS.observe("dataframe", (built - start) + (time.perf_counter() - predicted), task)
+    return result
+
+
+def _label_chunk_top_k(chunk: pd.DataFrame, model, spec: dict, column) -> pd.DataFrame:
+    result = pd.DataFrame({spec["column"]: chunk[column]})
+    classes, scores = model.predict_top_k(result[spec["column"]], spec["top_k"])
+    names = top_k_columns(spec)
+    for rank in range(classes.shape[1]):
+        result[names[2 * rank]] = classes[:, rank]
+        result[names[2 * rank + 1]] = scores[:, rank].round(4)
+    return result
+
+
+def _label_chunk_all(chunk: pd.DataFrame, model, column) -> pd.DataFrame:
+    result = pd.DataFrame({ALL_TASKS_SPEC["column"]: chunk[column]})
+    for name, predictions in model.predict_all(result[ALL_TASKS_SPEC["column"]]).items():
+        spec = TASKS[name]
+        result[spec["output"]] = predictions
+        if spec["labels"] is not None:
+            result[spec["output"]] = result[spec["output"]].map(spec["labels"])
+    return result
+
+
+class ResultWriter:
+    """Appends labelled chunks to a result CSV, keeping label counts and the page offset index.
+
+    Pass the state returned by checkpoint() to continue a file written by an earlier writer;
+    anything written after that checkpoint is discarded.
+    """
+
+    def __init__(self, path: str, task: str, state: Optional[dict] = None, columns: Optional[List[str]] = None):
+        self.path = path
+        self.task = task
+        if state is None:
+            self.columns = columns or task_columns(task)
+            self.rows = 0
+            self.counts = Counter()
+            self.offsets = []
+            self._out = open(path, "wb")
+            pd.DataFrame(columns=self.columns).to_csv(self._out, index=False)
+        else:
+            self.columns = state.get("columns") or task_columns(task)
+            self.rows = state["rows"]
+            self.counts = Counter(state["counts"])
+            self.offsets = list(state["offsets"])
+            self._out = open(path, "r+b")
+            self._out.truncate(state["size"])
+            self._out.seek(state["size"])
+        self.label_columns = label_columns(task, self.columns)
+
+    def write(self, result: pd.DataFrame):
+        with METRICS.timer("write", self.task):
+            self._write(result)
+
+    def _write(self, result: pd.DataFrame):
+        outputs = self.label_columns
+        for output in outputs:
+            # With several prediction columns the counts are kept apart as "<column>: <label>"
+            prefix = f"{output}: " if len(outputs) > 1 else ""
+            self.counts.update({f"{prefix}{label}": int(count)
+                                for label, count in result[output].value_counts().items()})
+        # Write in INDEX_ROWS slices aligned to the overall row number so every
+        # index entry lands on a slice boundary
+        position = 0
+        while position < len(result):
+            size = INDEX_ROWS - (self.rows + position) % INDEX_ROWS
+            if (self.rows + position) % INDEX_ROWS == 0:
+                self.offsets.append(self._out.tell())
+            result.iloc[position:position + size].to_csv(self._out, header=False, index=False, encoding="utf-8")
+            position += size
+        self.rows += len(result)
+
+    def checkpoint(self) -> dict:
+        """Flush to disk and return the state needed to resume from this point"""
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        return {"rows": self.rows, "counts": dict(self.counts), "offsets": list(self.offsets),
+                "size": self._out.tell(), "columns": list(self.columns)}
+
+    def result(self, seconds: float, warning: Optional[str], model_version: Optional[str] = None,
+               cascade: Optional[Dict[str, float]] = None) -> BulkResult:
+        ordered = self.counts.most_common()
+        if len(self.label_columns) > 1:
+            # Keep the labels of each prediction column together
+            ordered.sort(key=lambda item: self.columns.index(item[0].split(": ", 1)[0]))
+        counts = {label: count for label, count in ordered}
+        return BulkResult(self.path, self.task, self.rows, seconds, counts, list(self.offsets), warning,
+                          list(self.columns), model_version, cascade)
+
+    def close(self):
+        self._out.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def classify_chunks(chunks: Iterable[pd.DataFrame], model, task: str,
+                    on_progress: Optional[Callable[[int, float], None]] = None,
+                    output_path: Optional[str] = None) -> BulkResult:
+    """Run model.predict on each chunk and append the labelled rows to a CSV file"""
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(prefix=f"sensebox_{task}_", suffix=".csv")
+        os.close(fd)
+
+    warning = None
+    column = None
+    start = time.perf_counter()
+    columns = task_columns(task, model.tasks) if task == ALL_TASKS else None
+    try:
+        with ResultWriter(output_path, task, columns=columns) as writer:
+            for chunk in chunks:
+                if column is None:
+                    column, warning = text_column(chunk, task)
+                writer.write(label_chunk(chunk, model, task, column))
+                if on_progress is not None:
+                    on_progress(writer.rows, time.perf_counter() - start)
+    except Exception:
+        os.remove(output_path)
+        raise
+    report = getattr(model, "report", None)
+    return writer.result(time.perf_counter() - start, warning, model_version(model),
+                         report() if report is not None else None)
+
+
+def classify_files(files: Sequence, model, task: str, chunk_size: int = CHUNK_SIZE,
+                   on_progress: Optional[Callable[[List[dict], float], None]] = None,
+                   output_path: Optional[str] = None, workers: int = FILE_WORKERS) -> BulkResult:
+    """classify_chunks for several files at once, into one result whose SOURCE_COLUMN names each row's file.
+
+    Up to workers files are read and predicted on threads of their own. Their chunks are appended
+    to the result as they finish, so the rows of different files interleave while each file keeps
+    its own order. on_progress is called on the calling thread with one {"file", "rows", "fraction",
+    "status"} dict per file. A file that cannot be read is named in the warning, along with the rows
+    read from it before the error, which stay in the result. Only when no rows were read at all is a
+    ValueError raised, naming every file that failed.
+    """
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(prefix=f"sensebox_{task}_", suffix=".csv")
+        os.close(fd)
+
+    progress = [{"file": getattr(file, "name", "") or f"file {i + 1}", "rows": 0, "fraction": 0.0,
+                 "status": "waiting"} for i, file in enumerate(files)]
+    columns = [SOURCE_COLUMN] + (task_columns(task, model.tasks) if task == ALL_TASKS else task_columns(task))
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def classify(index: int, file) -> Optional[str]:
+        entry = progress[index]
+        entry["status"] = "reading"
+        column = warning = None
+        try:
+            for chunk in iter_upload_chunks(file, chunk_size, text_columns(task)):
+                if stop.is_set():
+                    raise RuntimeError("Stopped")
+                if column is None:
+                    column, warning = text_column(chunk, task)
+                labelled = label_chunk(chunk, model, task, column)
+                labelled.insert(0, SOURCE_COLUMN, entry["file"])
+                with lock:
+                    writer.write(labelled)
+                entry["rows"] += len(labelled)
+                entry["fraction"] = upload_progress(file)
+        except Exception as e:
+            # Before the future completes, so the last progress report shows it
+            entry["status"] = f"failed: {e}"
+            raise
+        entry.update(status="done", fraction=1.0)
+        return warning
+
+    start = time.perf_counter()
+    warnings = []
+    failures = []
+    try:
+        with ResultWriter(output_path, task, columns=columns) as writer, \
+                ThreadPoolExecutor(max(1, min(workers, len(files))), thread_name_prefix="sensebox-files") as pool:
+            try:
+                futures = [pool.submit(classify, i, file) for i, file in enumerate(files)]
+                pending = set(futures)
+                while pending:
+                    _, pending = wait(pending, timeout=FILE_PROGRESS_SECONDS)
+                    if on_progress is not None:
+                        on_progress([dict(entry) for entry in progress], time.perf_counter() - start)
+            except BaseException:
+                # Interrupted (a Streamlit rerun, say): let the running files stop after their current chunk
+                stop.set()
+                pool.shutdown(cancel_futures=True)
+                raise
+        for entry, future in zip(progress, futures):
+            error = future.exception()
+            if error is not None:
+                failures.append((entry["file"], entry["rows"], error))
+            elif future.result():
+                warnings.append(f"{entry['file']}: {future.result()}")
+        if failures and writer.rows == 0:
+            raise ValueError("No rows could be read from "
+                             + ", ".join(f"{name} ({error})" for name, _, error in failures)) from failures[0][2]
+    except BaseException:
+        os.remove(output_path)
+        raise
+    skipped = [f"{name} ({error})" for name, rows, error in failures if not rows]
+    if skipped:
+        warnings.append("Skipped files that could not be read: " + ", ".join(skipped))
+    partial = [f"{name} ({rows:,} rows, then {error})" for name, rows, error in failures if rows]
+    if partial:
+        warnings.append("Stopped partway through files, keeping the rows read before the error: "
+                        + ", ".join(partial))
+    report = getattr(model, "report", None)
+    return writer.result(time.perf_counter() - start, "\n".join(warnings) or None, model_version(model),
+                         report() if report is not None else None)
+
+
+def model_version(model) -> Optional[str]:
+    """The version a BoundPredictor or pinned MultiTaskPredictor predicts with, for display"""
+    versions = getattr(model, "versions", None)
+    if versions:
+        return ", ".join(f"{task} {version}" for task, version in versions.items())
+    return getattr(model, "version", None)
+
+
+def _remove_result_files(entries):
+    for result in entries.values():
+        if os.path.exists(result.path):
+            os.remove(result.path)
+
+
+class ResultStore:
+    """Finished bulk results of one session, keyed on (task, upload hash, model version).
+
+    Least recently used results are evicted, and their files deleted, once more than
+    max_results are stored or their files take more than max_bytes on disk.
+    """
+
+    def __init__(self, max_results: int = MAX_STORED_RESULTS, max_bytes: int = MAX_STORED_BYTES):
+        self.max_results = max_results
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        # Delete the files when the session (and with it this store) goes away
+        weakref.finalize(self, _remove_result_files, self._entries)
+
+    def get(self, key) -> Optional[BulkResult]:
+        result = self._entries.get(key)
+        if result is None:
+            return None
+        if not os.path.exists(result.path):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result: BulkResult):
+        previous = self._entries.pop(key, None)
+        if previous is not None and previous.path != result.path and os.path.exists(previous.path):
+            os.remove(previous.path)
+        self._entries[key] = result
+        # Always keep the newest result, even if it alone is over the limit
+        while len(self._entries) > 1 and (len(self._entries) > self.max_results
+                                          or self.total_bytes() > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            if os.path.exists(evicted.path):
+                os.remove(evicted.path)
+
+    def total_bytes(self) -> int:
+        return sum(os.path.getsize(result.path) for result in self._entries.values() if os.path.exists(result.path))
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,260 @@
+"""Confidence-gated cascade for bulk spam and sentiment runs.
+
+    python cascade.py spam --rows 200000                   # report on a synthetic corpus
+    python cascade.py review --file reviews.csv --thresholds 0.9 0.99
+
+A FirstStage is built from the model's own weights. It tokenizes the whole
+batch on bytes (one str.lower, bytes.translate and bytes.split instead of
+the token regex, which is most of the cost of a predict call) and scores
+each row with the same TF-IDF weighting and classifier, pruned to the most
+discriminative FEATURE_SHARE of the features. Rows whose first-stage probability reaches
+the threshold keep that answer; the rest go through the full pipeline.
+
+The bytes tokenizer differs from the regex only on non-ASCII punctuation, so
+the two stages mostly agree. To measure how often they do not, the full
+model also predicts every AUDIT_EVERY-th row the first stage decided, and
+the report extrapolates the disagreement rate and the throughput gain
+from those rows.
+"""
+import argparse
+import os
+import time
+from itertools import repeat
+from typing import Dict, Optional
+
+import numpy as np
+
+from compact_model import feature_importance
+from fast_path import SEPARATOR, FastTfidfPipeline
+
+
+# Probability of its top class the first stage needs to decide a row on its own. The sentiment
+# model is less sure of itself: at 0.95 its first stage decides too few rows to pay for itself.
+DEFAULT_THRESHOLDS = {"spam": 0.95, "review": 0.8}
+CASCADE_TASKS = tuple(DEFAULT_THRESHOLDS)
+# Share of the model's features the first stage keeps, unless SENSEBOX_CASCADE_FEATURES gives a count
+FEATURE_SHARE = 0.25
+# Features kept by the first stage: None for FEATURE_SHARE of the vocabulary, 0 for the whole vocabulary
+DEFAULT_FEATURES = (int(os.environ["SENSEBOX_CASCADE_FEATURES"]) if os.environ.get("SENSEBOX_CASCADE_FEATURES")
+                    else None)
+# Every AUDIT_EVERY-th row the first stage decides is also predicted by the full model; 0 disables
+AUDIT_EVERY = int(os.environ.get("SENSEBOX_CASCADE_AUDIT_EVERY", 100))
+
+# Bytes that end a token: ASCII except letters, digits and "_", like the \w of the token regex, and
+# except the document separator. Bytes >= 128 belong to UTF-8 encoded characters and are kept.
+_WORD_BYTES = set(b"abcdefghijklmnopqrstuvwxyz0123456789_" + SEPARATOR.encode())
+_TOKEN_TABLE = bytes(byte if byte in _WORD_BYTES or byte >= 128 else 0x20 for byte in range(256))
+_SEPARATOR_BYTES = SEPARATOR.encode()
+
+_SEPARATOR_COLUMN = -1
+_UNKNOWN_COLUMN = -2
+
+
+def default_threshold(name: str) -> float:
+    """The task's threshold from DEFAULT_THRESHOLDS, unless SENSEBOX_CASCADE_THRESHOLD sets one for every task"""
+    if os.environ.get("SENSEBOX_CASCADE_THRESHOLD"):
+        return float(os.environ["SENSEBOX_CASCADE_THRESHOLD"])
+    return DEFAULT_THRESHOLDS[name]
+
+
+def cascade_version(version: Optional[str], threshold: float) -> str:
+    """What cascade results are stored under: they can differ from the full model's, so apart from them"""
+    return f"{version}, cascade at {threshold:g}"
+
+
+class FirstStage:
+    """Cheap approximation of a binary TF-IDF pipeline that also says how sure it is"""
+
+    def __init__(self, model, features: Optional[int] = DEFAULT_FEATURES):
+        fast = FastTfidfPipeline.from_model(model)
+        if not fast.batched or not fast.lowercase or len(fast.classes_) != 2:
+            raise ValueError("The cascade needs a lower-casing, unigram, binary TF-IDF model")
+        self.fast = fast
+        self.classes_ = fast.classes_
+        # Log-odds of classes_[1] = features @ delta + offset
+        weights = fast.float_weights()
+        if weights.shape[0] == 1:
+            self.delta, self.offset = weights[0], float(fast.bias[0])
+        else:
+            self.delta = weights[1] - weights[0]
+            self.offset = float(fast.bias[1] - fast.bias[0])
+
+        kept = None
+        if features is None:
+            features = max(1, int(fast.n_features * FEATURE_SHARE))
+        if 0 < features < fast.n_features:
+            importance = feature_importance(weights, fast.idf)
+            kept = set(np.argpartition(-importance, features - 1)[:features].tolist())
+        self.features = len(kept) if kept is not None else fast.n_features
+        self._lookup = {term.encode("utf-8"): column for term, column in fast._lookup.items()
+                        if term != SEPARATOR and (kept is None or column in kept)}
+        self._lookup[_SEPARATOR_BYTES] = _SEPARATOR_COLUMN
+
+    def log_odds(self, texts) -> Optional[np.ndarray]:
+        """Log-odds of classes_[1] for each text, or None if the batch cannot be tokenized in one go"""
+        texts = texts if isinstance(texts, list) else list(texts)
+        if not all(isinstance(text, str) for text in texts):
+            return None
+        joined = SEPARATOR.join(texts)
+        if joined.count(SEPARATOR) != len(texts) - 1:
+            return None
+        joined = joined.lower()
+        if self.fast._strip_accents is not None:
+            joined = self.fast._strip_accents(joined)
+        tokens = (joined.encode("utf-8", "surrogatepass").translate(_TOKEN_TABLE)
+                  .replace(_SEPARATOR_BYTES, b" " + _SEPARATOR_BYTES + b" ").split())
+        columns = np.fromiter(map(self._lookup.get, tokens, repeat(_UNKNOWN_COLUMN)),
+                              dtype=np.int64, count=len(tokens))
+        row_ids = np.cumsum(columns == _SEPARATOR_COLUMN)
+        known = columns >= 0
+        features = self.fast.weight_counts(self.fast._counts(row_ids[known], columns[known], len(texts)))
+        return np.asarray(features @ self.delta).ravel() + self.offset
+
+    def decide(self, texts, threshold: float):
+        """(predictions, confident) where confident marks the rows whose top class has probability >= threshold"""
+        log_odds = self.log_odds(texts)
+        if log_odds is None:
+            return None, np.zeros(len(texts), dtype=bool)
+        predictions = self.classes_[(log_odds > 0).astype(int)]
+        # max(p, 1 - p) >= threshold  <=>  |log-odds| >= logit(threshold)
+        margin = np.log(threshold / (1 - threshold)) if threshold < 1 else np.inf
+        return predictions, np.abs(log_odds) >= margin
+
+
+class CascadePredictor:
+    """predict(texts) through a FirstStage, sending only its uncertain rows to the full model.
+
+    Pinned to the model version current when it was created, like a BoundPredictor.
+    """
+
+    def __init__(self, engine, name: str, threshold: Optional[float] = None,
+                 features: Optional[int] = DEFAULT_FEATURES, audit_every: int = AUDIT_EVERY):
+        self.full = engine.for_model(name)
+        if self.full.loaded is None:
+            raise RuntimeError(engine.registry.error(name))
+        self.name = name
+        self.threshold = default_threshold(name) if threshold is None else threshold
+        self.audit_every = audit_every
+        self.first_stage = FirstStage(self.full.loaded.model, features)
+        self.rows = 0
+        self.decided = 0
+        self.audited = 0
+        self.disagreements = 0
+        self.first_seconds = 0.0
+        self.full_seconds = 0.0
+        self.full_rows = 0
+
+    @property
+    def version(self) -> Optional[str]:
+        return cascade_version(self.full.version, self.threshold)
+
+    def predict(self, texts):
+        texts = texts if isinstance(texts, list) else list(texts)
+        start = time.perf_counter()
+        predictions, confident = self.first_stage.decide(texts, self.threshold)
+        self.first_seconds += time.perf_counter() - start
+
+        decided = np.flatnonzero(confident)
+        # Audit rows are picked by their position in the whole run, so every run audits the same rows
+        audit = decided[(self.decided + np.arange(len(decided))) % self.audit_every == 0] \
+            if self.audit_every > 0 else decided[:0]
+        uncertain = np.flatnonzero(~confident)
+        to_full = np.concatenate([uncertain, audit])
+
+        result = predictions.copy() if predictions is not None else None
+        if len(to_full):
+            start = time.perf_counter()
+            full = self.full.predict([texts[i] for i in to_full])
+            self.full_seconds += time.perf_counter() - start
+            self.full_rows += len(to_full)
+            if result is None:
+                result = np.asarray(full)
+            else:
+                result = result.astype(np.result_type(result, np.asarray(full)))
+                result[uncertain] = full[:len(uncertain)]
+                self.disagreements += int(np.sum(result[audit] != full[len(uncertain):]))
+        self.rows += len(texts)
+        self.decided += len(decided)
+        self.audited += len(audit)
+        return result if result is not None else np.empty(0)
+
+    def report(self) -> Dict[str, float]:
+        """Share of rows the first stage decided, its audited disagreement rate and the estimated speed-up"""
+        full_per_row = self.full_seconds / self.full_rows if self.full_rows else 0.0
+        seconds = self.first_seconds + self.full_seconds
+        # Without the cascade every row would cost what a full-model row cost here
+        full_only = self.rows * full_per_row
+        return {
+            "threshold": self.threshold,
+            "features": self.first_stage.features,
+            "rows": self.rows,
+            "first_stage_share": self.decided / self.rows if self.rows else 0.0,
+            "audited": self.audited,
+            "disagreement_rate": self.disagreements / self.audited if self.audited else 0.0,
+            "seconds": seconds,
+            "estimated_full_seconds": full_only,
+            "speedup": full_only / seconds if seconds and full_only else 0.0,
+        }
+
+
+def compare(engine, name: str, texts, thresholds, features: Optional[int] = DEFAULT_FEATURES):
+    """Cascade against the full model on texts for each threshold: exact disagreement and measured speed-up"""
+    texts = list(texts)
+    start = time.perf_counter()
+    full = engine.predict(name, texts)
+    full_seconds = time.perf_counter() - start
+    rows = []
+    for threshold in thresholds:
+        cascade = CascadePredictor(engine, name, threshold, features, audit_every=0)
+        start = time.perf_counter()
+        predictions = cascade.predict(texts)
+        seconds = time.perf_counter() - start
+        rows.append({
+            "threshold": threshold,
+            "features": cascade.first_stage.features,
+            "first_stage_share": cascade.decided / len(texts) if texts else 0.0,
+            "disagreement_rate": float(np.mean(predictions != full)) if texts else 0.0,
+            "full_seconds": full_seconds,
+            "cascade_seconds": seconds,
+            "speedup": full_seconds / seconds if seconds else 0.0,
+        })
+    return rows
+
+
+def main():
+    from benchmark import synthetic_corpus
+    from ingest import iter_upload_chunks
+    from bulk import text_column, text_columns
+    from inference import ParallelPredictor
+    from model_registry import ModelRegistry
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compare the cascade with the full model")
+    parser.add_argument("model", choices=CASCADE_TASKS)
+    parser.add_argument("--file", help="CSV or TXT upload to read the texts from (default: a synthetic corpus)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Size of the synthetic corpus")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.9, 0.95, 0.99, 0.999])
+    parser.add_argument("--features", type=int, default=DEFAULT_FEATURES,
+                        help=f"Features the first stage keeps (default: {FEATURE_SHARE * 100:.0f}%% of the model's; 0 for all)")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "models"))
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            texts = []
+            for chunk in iter_upload_chunks(f, text_columns=text_columns(args.model)):
+                texts.extend(chunk[text_column(chunk, args.model)[0]].tolist())
+    else:
+        kind = "reviews" if args.model == "review" else "messages"
+        texts = synthetic_corpus(kind, args.rows)
+    # No prediction cache, so repeated rows cost the full model what they would in a first run
+    engine = ParallelPredictor(ModelRegistry(args.model_dir), workers=1, cache_size=0)
+    print(f"{'threshold':>9} {'features':>8} {'decided':>8} {'disagree':>9} {'full s':>7} {'cascade s':>9} {'speedup':>7}")
+    for row in compare(engine, args.model, texts, args.thresholds, args.features):
+        print(f"{row['threshold']:>9g} {row['features']:>8,} {row['first_stage_share']:>8.1%} "
+              f"{row['disagreement_rate']:>9.3%} {row['full_seconds']:>7.2f} {row['cascade_seconds']:>9.2f} "
+              f"{row['speedup']:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
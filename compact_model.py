@@ -0,0 +1,386 @@
+"""Compact, memory-mapped on-disk format for the TF-IDF pipelines.
+
+    python compact_model.py                 # export every pickle in models/
+    python compact_model.py spam review     # export selected models
+
+Each model is written to models/compact/<name>/ as a meta.json plus .npy
+arrays: the vocabulary as a sorted byte-string array, the IDF weights and the
+classifier coefficients. Loading maps the arrays read-only with np.load(mmap_mode="r"),
+so every process on a host shares one physical copy through the page cache,
+and neither scikit-learn nor the training-only SMOTE state has to be unpickled.
+
+Format version 2 stores the coefficients as float16 or int8 (see
+model_variants.py); int8 weights come with a per-class scale and offset.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+
+FORMAT_VERSION = 1
+# Version 1 with quantized coefficients, so that older readers refuse it instead of misreading it
+QUANTIZED_FORMAT_VERSION = 2
+
+COMPACT_DIR_NAME = "compact"
+VARIANTS_DIR_NAME = "variants"
+
+META_FILE = "meta.json"
+ARRAYS = ("vocabulary", "term_index", "idf", "weights", "bias")
+# Only present for int8 weights: weights[c] * weight_scale[c] + weight_offset[c] is the original row
+QUANTIZED_ARRAYS = ("weight_scale", "weight_offset")
+
+
+def _strip_accents_unicode(text: str) -> str:
+    try:
+        text.encode("ASCII", errors="strict")
+        return text
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", text)
+        return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def _strip_accents_ascii(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode("ASCII")
+
+
+ACCENT_FUNCTIONS = {None: None, "unicode": _strip_accents_unicode, "ascii": _strip_accents_ascii}
+
+
+def _split_pipeline(pipeline):
+    """Return the vectorizer and classifier of a fitted pipeline, or raise ValueError"""
+    steps = [step for _, step in getattr(pipeline, "steps", [])]
+    if len(steps) < 2:
+        raise ValueError("Expected a Pipeline with a vectorizer and a classifier")
+    vectorizer, classifier = steps[0], steps[-1]
+    for step in steps[1:-1]:
+        # Samplers such as SMOTE only run during fit; anything else would change predictions
+        if step not in (None, "passthrough") and not hasattr(step, "fit_resample"):
+            raise ValueError(f"Unsupported intermediate step: {type(step).__name__}")
+    if type(vectorizer).__name__ != "TfidfVectorizer":
+        raise ValueError(f"Unsupported vectorizer: {type(vectorizer).__name__}")
+    if vectorizer.analyzer != "word" or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None:
+        raise ValueError("Only the built-in word analyzer is supported")
+    if callable(vectorizer.strip_accents) or vectorizer.strip_accents not in ACCENT_FUNCTIONS:
+        raise ValueError(f"Unsupported strip_accents: {vectorizer.strip_accents!r}")
+    return vectorizer, classifier
+
+
+def _classifier_arrays(classifier):
+    """(kind, weights, bias) such that scores = X @ weights.T + bias"""
+    if type(classifier).__name__ == "MultinomialNB":
+        return "nb", classifier.feature_log_prob_, classifier.class_log_prior_
+    if hasattr(classifier, "coef_") and hasattr(classifier, "intercept_"):
+        return "linear", classifier.coef_, np.atleast_1d(classifier.intercept_)
+    raise ValueError(f"Unsupported classifier: {type(classifier).__name__}")
+
+
+def compact_arrays(pipeline):
+    """(meta, arrays) describing a fitted TF-IDF pipeline, as stored by export_compact"""
+    vectorizer, classifier = _split_pipeline(pipeline)
+    kind, weights, bias = _classifier_arrays(classifier)
+
+    terms = sorted(vectorizer.vocabulary_.items(), key=lambda item: item[0].encode("utf-8"))
+    vocabulary = np.array([term.encode("utf-8") for term, _ in terms], dtype=np.bytes_)
+    term_index = np.array([index for _, index in terms], dtype=np.int32)
+    stop_words = vectorizer.get_stop_words()
+
+    arrays = {
+        "vocabulary": vocabulary,
+        "term_index": term_index,
+        "idf": np.asarray(vectorizer.idf_ if vectorizer.use_idf else np.ones(len(terms)), dtype=np.float64),
+        "weights": np.ascontiguousarray(weights, dtype=np.float64),
+        "bias": np.asarray(bias, dtype=np.float64),
+    }
+    classes = classifier.classes_.tolist()
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "kind": kind,
+        "classes": classes,
+        "lowercase": bool(vectorizer.lowercase),
+        "strip_accents": vectorizer.strip_accents,
+        "token_pattern": vectorizer.token_pattern,
+        "stop_words": sorted(stop_words) if stop_words else None,
+        "ngram_range": list(vectorizer.ngram_range),
+        "binary": bool(vectorizer.binary),
+        "norm": vectorizer.norm,
+        "sublinear_tf": bool(vectorizer.sublinear_tf),
+        "use_idf": bool(vectorizer.use_idf),
+    }
+    return meta, arrays
+
+
+def feature_importance(weights: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """How far each feature can move the class scores apart, weighted by how common the term is.
+
+    Uses idf = ln((1 + n) / (1 + df)) + 1, so exp(1 - idf) grows with the document frequency.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    spread = np.abs(weights[0]) if weights.shape[0] == 1 else weights.max(axis=0) - weights.min(axis=0)
+    return spread * np.exp(1 - np.asarray(idf, dtype=np.float64))
+
+
+def export_compact(pipeline, out_dir: str, source: Optional[str] = None) -> str:
+    """Write a fitted TF-IDF pipeline to out_dir in the compact format"""
+    meta, arrays = compact_arrays(pipeline)
+    return write_compact(meta, arrays, out_dir, source)
+
+
+def write_compact(meta: dict, arrays: dict, out_dir: str, source: Optional[str] = None) -> str:
+    """Write compact_arrays() output, or a variant of it, to out_dir"""
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array)
+    if source is not None:
+        meta["source"] = os.path.basename(source)
+        meta["source_sha256"] = file_sha256(source)
+    # meta.json is written last: its presence marks a complete export
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump(meta, f)
+    return out_dir
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_meta(model_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(model_dir, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest values in each row of scores, largest first"""
+    k = max(1, min(k, scores.shape[1]))
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class CompactPipeline:
+    """Drop-in replacement for a fitted TfidfVectorizer + classifier pipeline"""
+
+    analyzer = "word"
+    tokenizer = None
+    preprocessor = None
+
+    def __init__(self, meta: dict, arrays: dict):
+        self.meta = meta
+        self.vocabulary = arrays["vocabulary"]
+        self.term_index = arrays["term_index"]
+        self.idf = arrays["idf"]
+        self.weights = arrays["weights"]
+        self.bias = arrays["bias"]
+        self.weight_scale = arrays.get("weight_scale")
+        self.weight_offset = arrays.get("weight_offset")
+        self.classes_ = np.asarray(meta["classes"])
+        self.lowercase = meta["lowercase"]
+        self.token_pattern = meta["token_pattern"]
+        self.ngram_range = tuple(meta["ngram_range"])
+        self._token_regex = re.compile(self.token_pattern)
+        self._stop_words = frozenset(meta["stop_words"] or ())
+        self._strip_accents = ACCENT_FUNCTIONS[meta["strip_accents"]]
+
+    @classmethod
+    def load(cls, model_dir: str, mmap: bool = True) -> "CompactPipeline":
+        meta = read_meta(model_dir)
+        if meta is None:
+            raise FileNotFoundError(f"No compact model in {model_dir}")
+        if meta.get("format_version") not in (FORMAT_VERSION, QUANTIZED_FORMAT_VERSION):
+            raise ValueError(f"Unsupported compact format version: {meta.get('format_version')}")
+        names = ARRAYS + (QUANTIZED_ARRAYS if meta.get("weights_dtype") == "int8" else ())
+        arrays = {
+            name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in names
+        }
+        return cls(meta, arrays)
+
+    @property
+    def n_features(self) -> int:
+        return self.weights.shape[1]
+
+    def analyze(self, text: str):
+        """Same tokens as TfidfVectorizer.build_analyzer() for the word analyzer"""
+        if self.lowercase:
+            text = text.lower()
+        if self._strip_accents is not None:
+            text = self._strip_accents(text)
+        tokens = self._token_regex.findall(text)
+        if self._stop_words:
+            tokens = [token for token in tokens if token not in self._stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        original = tokens
+        if min_n == 1:
+            tokens = list(original)
+            min_n += 1
+        else:
+            tokens = []
+        for n in range(min_n, min(max_n + 1, len(original) + 1)):
+            for i in range(len(original) - n + 1):
+                tokens.append(" ".join(original[i:i + n]))
+        return tokens
+
+    def count_matrix(self, texts) -> sp.csr_matrix:
+        """Term counts for texts, in the column order of the original vectorizer"""
+        tokens = []
+        rows = []
+        n_docs = 0
+        for text in texts:
+            if not isinstance(text, str):
+                raise ValueError("np.nan is an invalid document, expected byte or unicode string.")
+            doc_tokens = self.analyze(text)
+            tokens.extend(doc_tokens)
+            rows.append(len(doc_tokens))
+            n_docs += 1
+
+        columns = np.empty(0, dtype=np.int32)
+        row_ids = np.empty(0, dtype=np.int32)
+        if tokens:
+            encoded = np.array([token.encode("utf-8") for token in tokens], dtype=np.bytes_)
+            positions = np.searchsorted(self.vocabulary, encoded)
+            positions[positions == len(self.vocabulary)] = 0
+            known = self.vocabulary[positions] == encoded
+            columns = self.term_index[positions[known]]
+            row_ids = np.repeat(np.arange(n_docs, dtype=np.int32), rows)[known]
+
+        return self._counts(row_ids, columns, n_docs)
+
+    def _counts(self, row_ids: np.ndarray, columns: np.ndarray, n_docs: int) -> sp.csr_matrix:
+        counts = sp.csr_matrix(
+            (np.ones(len(columns), dtype=np.float64), (row_ids, columns)),
+            shape=(n_docs, self.n_features),
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def transform(self, texts) -> sp.csr_matrix:
+        """TF-IDF matrix for texts, in the column order of the original vectorizer"""
+        return self.weight_counts(self.count_matrix(texts))
+
+    def weight_counts(self, counts: sp.csr_matrix) -> sp.csr_matrix:
+        """Apply the vectorizer's TF-IDF weighting and normalization to count_matrix() output, in place"""
+        if self.meta["binary"]:
+            counts.data.fill(1)
+        if self.meta["sublinear_tf"]:
+            np.log(counts.data, counts.data)
+            counts.data += 1
+        if self.meta["use_idf"]:
+            counts.data *= self.idf[counts.indices]
+        norm = self.meta["norm"]
+        if norm is not None:
+            if norm == "l2":
+                row_norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+            else:
+                row_norms = np.asarray(abs(counts).sum(axis=1)).ravel()
+            row_norms[row_norms == 0] = 1.0
+            counts.data /= np.repeat(row_norms, np.diff(counts.indptr))
+        return counts
+
+    @property
+    def arrays(self) -> dict:
+        """The arrays this pipeline was built from, as passed to __init__"""
+        arrays = {"vocabulary": self.vocabulary, "term_index": self.term_index, "idf": self.idf,
+                  "weights": self.weights, "bias": self.bias}
+        if self.weight_scale is not None:
+            arrays.update(weight_scale=self.weight_scale, weight_offset=self.weight_offset)
+        return arrays
+
+    def float_weights(self) -> np.ndarray:
+        """The coefficients as float64, dequantized if they are stored as int8"""
+        weights = np.asarray(self.weights, dtype=np.float64)
+        if self.weight_scale is None:
+            return weights
+        return weights * np.asarray(self.weight_scale)[:, None] + np.asarray(self.weight_offset)[:, None]
+
+    def _scores(self, features: sp.csr_matrix) -> np.ndarray:
+        scores = np.asarray(features @ self.weights.T, dtype=np.float64)
+        if self.weight_scale is not None:
+            # Each row of int8 weights is q * scale + offset, so the offset contributes once per unit of feature mass
+            scores = scores * self.weight_scale + np.asarray(features.sum(axis=1)) * self.weight_offset
+        return scores + self.bias
+
+    def predict(self, texts) -> np.ndarray:
+        return self.predict_features(self.transform(texts))
+
+    def predict_features(self, features: sp.csr_matrix) -> np.ndarray:
+        """Predictions for an already vectorized batch, as returned by transform()"""
+        scores = self._scores(features)
+        if scores.shape[1] == 1:
+            return self.classes_[(scores[:, 0] > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+    def predict_top_k(self, texts, k: int):
+        """The k most probable classes for each text, most probable first, and their probabilities"""
+        return self.top_k_features(self.transform(texts), k)
+
+    def top_k_features(self, features: sp.csr_matrix, k: int):
+        """predict_top_k for an already vectorized batch.
+
+        Probabilities are a softmax over the class scores, which is what predict_proba
+        returns for naive Bayes and multinomial logistic regression. Only the k chosen
+        columns of each row are kept.
+        """
+        scores = self._scores(features)
+        if scores.shape[1] == 1:
+            # Binary linear model: P(classes_[1]) = sigmoid(score) = softmax([0, score])[1]
+            scores = np.hstack([np.zeros_like(scores), scores])
+        index = top_k(scores, k)
+        peak = scores.max(axis=1, keepdims=True)
+        log_norm = peak + np.log(np.exp(scores - peak).sum(axis=1, keepdims=True))
+        return self.classes_[index], np.exp(np.take_along_axis(scores, index, axis=1) - log_norm)
+
+
+def main():
+    import joblib
+    from model_registry import MODEL_FILES
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export the pickled pipelines to the compact mmap format")
+    parser.add_argument("models", nargs="*", help=f"Models to export (default: all of {', '.join(MODEL_FILES)})")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "models"))
+    args = parser.parse_args()
+
+    for name in args.models or MODEL_FILES:
+        source = os.path.join(args.model_dir, MODEL_FILES[name])
+        if not os.path.exists(source):
+            print(f"{name}: {MODEL_FILES[name]} not found, skipping")
+            continue
+        start = time.perf_counter()
+        pipeline = joblib.load(source)
+        pickle_seconds = time.perf_counter() - start
+        out_dir = os.path.join(args.model_dir, COMPACT_DIR_NAME, name)
+        try:
+            export_compact(pipeline, out_dir, source)
+        except ValueError as e:
+            print(f"{name}: cannot export ({e})")
+            continue
+
+        start = time.perf_counter()
+        CompactPipeline.load(out_dir)
+        compact_seconds = time.perf_counter() - start
+        compact_bytes = sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir))
+        print(f"{name}: {os.path.getsize(source):,} B pickle -> {compact_bytes:,} B compact, "
+              f"load {pickle_seconds * 1000:.1f} ms -> {compact_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Fast-path inference for the fitted TF-IDF pipelines.
+
+    python fast_path.py --rows 50000            # verify every model and report rows/s
+    python fast_path.py spam --sample msgs.csv  # verify against a real sample
+
+FastTfidfPipeline re-expresses a pipeline as a fixed term -> column hash index, a
+single compiled tokenizer that runs over a whole batch at once, and NumPy/SciPy
+sparse ops for the TF-IDF weighting and class scores. verify() checks its
+predictions against the original pipeline's predict.
+"""
+import argparse
+import os
+import re
+import time
+import warnings
+from itertools import repeat
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from compact_model import CompactPipeline, compact_arrays
+from prediction_cache import DEFAULT_TOKEN_PATTERN
+
+
+# Joins the documents of a batch; it can never be part of a \w token
+SEPARATOR = "\x00"
+
+# Finds the same tokens as the default (?u)\b\w\w+\b: a greedy \w\w+ always consumes a whole
+# run of word characters, so the \b anchors are redundant and only slow the regex down
+_BATCH_TOKENS = re.compile(r"\x00|\w\w+")
+
+_SEPARATOR_COLUMN = -1
+_UNKNOWN_COLUMN = -2
+
+VERIFY_SAMPLE = [
+    "",
+    "WINNER!! As a valued network customer you have been selected to receive a £900 prize reward!",
+    "Free entry in 2 a wkly comp to win FA Cup final tkts 21st May 2005. Text FA to 87121",
+    "URGENT! Your mobile number has been awarded a £2000 bonus. Call 09061701461 now",
+    "Hey, are we still on for lunch tomorrow?",
+    "I'll be home late, can you pick up some milk on the way back",
+    "Ok lar... Joking wif u oni...",
+    "The pasta was delicious and the staff were lovely",
+    "Cold, soggy fries and the burger was awful. Never again",
+    "Wow... Loved this place.",
+    "Crust is not good.",
+    "Café Müller: ÜBERRASCHEND gut, très bon! ΣΟΦΟΣ",
+    "the and of to a in",
+    "   multiple   spaces\tand\ttabs\nand newlines   ",
+    "1234 5678 9 0",
+    "Apple unveils new iPhone as tech stocks rally on Wall Street",
+    "Senate passes the budget bill after a late-night vote",
+]
+
+
+class FastTfidfPipeline(CompactPipeline):
+    """CompactPipeline with a dict vocabulary index and whole-batch tokenization"""
+
+    def __init__(self, meta: dict, arrays: dict):
+        super().__init__(meta, arrays)
+        self.index = {term.decode("utf-8"): int(column)
+                      for term, column in zip(arrays["vocabulary"].tolist(), arrays["term_index"].tolist())}
+        # Batch tokenization needs the default token pattern and unigrams; anything else
+        # falls back to CompactPipeline's per-document analyzer
+        self.batched = self.token_pattern == DEFAULT_TOKEN_PATTERN and self.ngram_range == (1, 1)
+        self._lookup = {term: column for term, column in self.index.items() if term not in self._stop_words}
+        self._lookup[SEPARATOR] = _SEPARATOR_COLUMN
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "FastTfidfPipeline":
+        return cls(*compact_arrays(pipeline))
+
+    @classmethod
+    def from_model(cls, model) -> "FastTfidfPipeline":
+        """Build from a fitted pipeline or a CompactPipeline; raises ValueError if unsupported"""
+        if isinstance(model, FastTfidfPipeline):
+            return model
+        if isinstance(model, CompactPipeline):
+            return cls(model.meta, model.arrays)
+        return cls.from_pipeline(model)
+
+    @property
+    def tokenizer_key(self):
+        """Pipelines with equal keys produce identical batch_tokens() for the same texts"""
+        return (self.lowercase, self.meta["strip_accents"]) if self.batched else None
+
+    def batch_tokens(self, texts) -> Optional[list]:
+        """Tokens of the whole batch, with SEPARATOR between documents and stop words still in.
+
+        Returns None when the batch cannot be tokenized in one go.
+        """
+        texts = texts if isinstance(texts, list) else list(texts)
+        if not self.batched:
+            return None
+        for text in texts:
+            if not isinstance(text, str):
+                raise ValueError("np.nan is an invalid document, expected byte or unicode string.")
+        joined = SEPARATOR.join(texts)
+        if joined.count(SEPARATOR) != len(texts) - 1:
+            # A document contains the separator itself
+            return None
+
+        # Lower-casing and accent stripping are per character, so they can run on the whole batch
+        if self.lowercase:
+            joined = joined.lower()
+        if self._strip_accents is not None:
+            joined = self._strip_accents(joined)
+        return _BATCH_TOKENS.findall(joined)
+
+    def count_tokens(self, tokens: list, n_docs: int) -> sp.csr_matrix:
+        """Term counts from batch_tokens() output; stop words and unknown terms are dropped here"""
+        columns = np.fromiter(map(self._lookup.get, tokens, repeat(_UNKNOWN_COLUMN)),
+                              dtype=np.int64, count=len(tokens))
+        row_ids = np.cumsum(columns == _SEPARATOR_COLUMN)
+        known = columns >= 0
+        return self._counts(row_ids[known], columns[known], n_docs)
+
+    def predict_tokens(self, tokens: list, n_docs: int) -> np.ndarray:
+        return self.predict_features(self.weight_counts(self.count_tokens(tokens, n_docs)))
+
+    def count_matrix(self, texts) -> sp.csr_matrix:
+        texts = texts if isinstance(texts, list) else list(texts)
+        tokens = self.batch_tokens(texts)
+        if tokens is None:
+            return super().count_matrix(texts)
+        return self.count_tokens(tokens, len(texts))
+
+
+def verify(fast, reference, texts) -> dict:
+    """Compare fast.predict with reference.predict on texts"""
+    texts = list(texts)
+    start = time.perf_counter()
+    expected = reference.predict(texts)
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = fast.predict(texts)
+    fast_seconds = time.perf_counter() - start
+
+    mismatched = np.flatnonzero(np.asarray(expected) != np.asarray(actual))
+    return {
+        "rows": len(texts),
+        "mismatches": int(len(mismatched)),
+        "examples": [(texts[i], expected[i], actual[i]) for i in mismatched[:5]],
+        "reference_rows_per_second": len(texts) / reference_seconds if reference_seconds else 0.0,
+        "fast_rows_per_second": len(texts) / fast_seconds if fast_seconds else 0.0,
+    }
+
+
+def enable_fast_path(model):
+    """Return a verified fast-path version of model, or model itself if that is not possible"""
+    try:
+        fast = FastTfidfPipeline.from_model(model)
+    except (ValueError, AttributeError):
+        return model
+    if verify(fast, model, VERIFY_SAMPLE)["mismatches"]:
+        warnings.warn("Fast path disagrees with the original pipeline; using the original")
+        return model
+    return fast
+
+
+def main():
+    import joblib
+    import pandas as pd
+    from benchmark import synthetic_corpus
+    from model_registry import MODEL_FILES
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Verify the fast path against the pickled pipelines")
+    parser.add_argument("models", nargs="*", help=f"Models to verify (default: all of {', '.join(MODEL_FILES)})")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "models"))
+    parser.add_argument("--rows", type=int, default=20_000, help="Size of the synthetic sample")
+    parser.add_argument("--sample", help="CSV or TXT file to verify on instead of a synthetic sample")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    if args.sample and args.sample.endswith(".csv"):
+        texts = pd.read_csv(args.sample).iloc[:, 0].astype(str).tolist()
+    elif args.sample:
+        with open(args.sample, encoding="utf-8") as f:
+            texts = f.read().split("\n")
+    failed = False
+    for name in args.models or MODEL_FILES:
+        path = os.path.join(args.model_dir, MODEL_FILES[name])
+        if not os.path.exists(path):
+            print(f"{name}: {MODEL_FILES[name]} not found, skipping")
+            continue
+        pipeline = joblib.load(path)
+        try:
+            fast = FastTfidfPipeline.from_pipeline(pipeline)
+        except ValueError as e:
+            print(f"{name}: no fast path ({e})")
+            continue
+        if not args.sample:
+            texts = VERIFY_SAMPLE + synthetic_corpus("reviews" if name == "review" else "messages", args.rows)
+        report = verify(fast, pipeline, texts)
+        failed = failed or report["mismatches"] > 0
+        print(f"{name}: {report['mismatches']} mismatches in {report['rows']:,} rows, "
+              f"{report['reference_rows_per_second']:,.0f} -> {report['fast_rows_per_second']:,.0f} rows/s")
+        for text, expected, actual in report["examples"]:
+            print(f"    {text[:60]!r}: expected {expected!r}, got {actual!r}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
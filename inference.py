@@ -0,0 +1,222 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Sequence
+
+import numpy as np
+
+from compact_model import top_k
+from metrics import METRICS, staged_predict
+from model_registry import LoadedModel, ModelRegistry, load_model
+from prediction_cache import DEFAULT_CACHE_SIZE, PredictionCache, text_normalizer
+
+
+DEFAULT_WORKERS = int(os.environ.get("SENSEBOX_WORKERS", os.cpu_count() or 1))
+DEFAULT_BATCH_SIZE = int(os.environ.get("SENSEBOX_BATCH_SIZE", 1_000))
+
+
+# Models loaded inside a worker process, keyed on (path, mtime, size) so a changed model is reloaded
+_worker_models = {}
+
+# Every model version a worker was asked for stays loaded until this many are, then the oldest goes
+WORKER_MODELS = 8
+
+
+def _worker_model(signature):
+    model = _worker_models.get(signature)
+    if model is None:
+        model = load_model(signature[0])
+        _worker_models[signature] = model
+        while len(_worker_models) > WORKER_MODELS:
+            del _worker_models[next(iter(_worker_models))]
+    return model
+
+
+def _predict_batch(signature, texts, timed=False):
+    model = _worker_model(signature)
+    # Workers have their own METRICS, so stage timings travel back with the predictions
+    return staged_predict(model, texts) if timed else model.predict(texts)
+
+
+def predict_top_k(model, texts, k: int):
+    """(classes, probabilities), each of shape (len(texts), k), most probable first"""
+    if hasattr(model, "predict_top_k"):
+        return model.predict_top_k(texts, k)
+    probabilities = model.predict_proba(texts)
+    index = top_k(probabilities, k)
+    return np.asarray(model.classes_)[index], np.take_along_axis(probabilities, index, axis=1)
+
+
+def _predict_top_k_batch(signature, texts, k):
+    return predict_top_k(_worker_model(signature), texts, k)
+
+
+class ParallelPredictor:
+    """Splits large batches across a process pool; each worker loads a pipeline once.
+
+    Predictions go through a per-model PredictionCache, and every batch is
+    deduplicated so each distinct text is only predicted once.
+    """
+
+    def __init__(self, registry: ModelRegistry, workers: Optional[int] = None, batch_size: Optional[int] = None,
+                 cache_size: Optional[int] = None):
+        self.registry = registry
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.batch_size = max(1, batch_size or DEFAULT_BATCH_SIZE)
+        self.cache_size = DEFAULT_CACHE_SIZE if cache_size is None else cache_size
+        self.caches = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def chunk_size(self) -> int:
+        """Rows to hand over at once so every worker gets a full batch"""
+        return self.workers * self.batch_size
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # The scheduler, background jobs and multi-task runs all predict from their own threads
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the Streamlit server is multi-threaded
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _cache(self, name: str, model) -> PredictionCache:
+        cache = self.caches.get(name)
+        if cache is None:
+            cache = self.caches.setdefault(name, PredictionCache(self.cache_size, text_normalizer(model)))
+        # The cache follows the current version; callers still on an older snapshot bypass it
+        cache.sync(self.registry.loaded_signature(name))
+        return cache
+
+    def snapshot(self, name: str) -> LoadedModel:
+        """The model's current version, to pin several predict calls to it"""
+        loaded = self.registry.snapshot(name)
+        if loaded is None:
+            raise RuntimeError(self.registry.error(name))
+        return loaded
+
+    def predict(self, name: str, texts: Sequence[str], loaded: Optional[LoadedModel] = None) -> np.ndarray:
+        return self.predict_versioned(name, texts, loaded)[0]
+
+    def predict_versioned(self, name: str, texts: Sequence[str], loaded: Optional[LoadedModel] = None):
+        """(predictions, version of the model that made them); loaded pins the version to use"""
+        with METRICS.timer("predict", name):
+            loaded = loaded or self.snapshot(name)
+            return self._predict(name, list(texts), loaded), loaded.version
+
+    def predict_tagged(self, name: str, texts: Sequence[str]) -> list:
+        """One (prediction, model version) pair per text, for the micro-batch scheduler"""
+        predictions, version = self.predict_versioned(name, texts)
+        return [(prediction, version) for prediction in predictions]
+
+    def _predict(self, name: str, texts: list, loaded: LoadedModel) -> np.ndarray:
+        METRICS.inc("rows", len(texts), model=name)
+        model = loaded.model
+        cache = self._cache(name, model)
+
+        keys = [cache.key(text) for text in texts]
+        results = cache.get_many(keys, loaded.signature)
+        # Group the misses so duplicate rows are only predicted once
+        pending = {}
+        uncached = []
+        for i, (key, result) in enumerate(zip(keys, results)):
+            if result is not None:
+                continue
+            if key is None:
+                uncached.append(i)
+            else:
+                pending.setdefault(key, []).append(i)
+        if not pending and not uncached:
+            return np.asarray(results)
+
+        order = list(pending)
+        misses = [texts[pending[key][0]] for key in order] + [texts[i] for i in uncached]
+        predictions = self._predict_uncached(name, loaded, misses)
+        for key, prediction in zip(order, predictions):
+            for i in pending[key]:
+                results[i] = prediction
+        for i, prediction in zip(uncached, predictions[len(order):]):
+            results[i] = prediction
+        cache.put_many(dict(zip(order, predictions)), loaded.signature)
+        return np.asarray(results)
+
+    def _predict_uncached(self, name: str, loaded: LoadedModel, texts: list) -> np.ndarray:
+        timed = METRICS.enabled
+        if self.workers == 1 or len(texts) <= self.batch_size:
+            if not timed:
+                return loaded.model.predict(texts)
+            results = [staged_predict(loaded.model, texts)]
+        else:
+            # Workers load the same file, so they predict with the same version
+            signature = loaded.signature
+            batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+            # map() yields results in submission order, so predictions line up with the input rows
+            results = list(self._pool().map(_predict_batch, [signature] * len(batches), batches,
+                                            [timed] * len(batches)))
+            if not timed:
+                return np.concatenate(results)
+
+        for _, timings in results:
+            for stage, seconds in timings.items():
+                METRICS.observe(stage, seconds, name)
+        return np.concatenate([predictions for predictions, _ in results])
+
+    def predict_top_k(self, name: str, texts: Sequence[str], k: int, loaded: Optional[LoadedModel] = None):
+        """The k most probable classes per text and their probabilities, without the prediction cache.
+
+        Batches are scored one at a time (or one per worker), so only batch_size rows of
+        the full class-probability matrix exist at once; the results hold k columns.
+        """
+        with METRICS.timer("predict", name):
+            texts = list(texts)
+            METRICS.inc("rows", len(texts), model=name)
+            loaded = loaded or self.snapshot(name)
+            model = loaded.model
+            batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+            if self.workers == 1 or len(batches) == 1:
+                results = [predict_top_k(model, batch, k) for batch in batches]
+            else:
+                signature = loaded.signature
+                results = list(self._pool().map(_predict_top_k_batch, [signature] * len(batches), batches,
+                                                [k] * len(batches)))
+            if not results:
+                width = min(k, len(getattr(model, "classes_", ()))) or k
+                return np.empty((0, width), dtype=object), np.empty((0, width))
+            return (np.concatenate([classes for classes, _ in results]),
+                    np.concatenate([scores for _, scores in results]))
+
+    def cache_stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+    def for_model(self, name: str) -> "BoundPredictor":
+        return BoundPredictor(self, name)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+class BoundPredictor:
+    """Exposes predict(texts) for one model so it can stand in for a pipeline.
+
+    It is pinned to the model version current when it was created, so a bulk run that
+    started before a hot reload finishes with the version it started with.
+    """
+
+    def __init__(self, engine: ParallelPredictor, name: str):
+        self.engine = engine
+        self.name = name
+        self.loaded = engine.registry.snapshot(name)
+
+    @property
+    def version(self) -> Optional[str]:
+        return None if self.loaded is None else self.loaded.version
+
+    def predict(self, texts):
+        return self.engine.predict(self.name, texts, self.loaded)
+
+    def predict_top_k(self, texts, k: int):
+        return self.engine.predict_top_k(self.name, texts, k, self.loaded)
@@ -0,0 +1,405 @@
+"""Reading uploads as DataFrame chunks.
+
+Each upload is sniffed from a small sample before it is read: gzip and zip
+compression (by magic bytes, so the extension does not matter), the text
+encoding, the CSV delimiter and whether the first line is a header. A CSV
+without one gets numbered column names and keeps its first row. When the
+caller names the text column it wants, only that column is parsed, as strings. Decompression and
+parsing are streamed, so memory stays bounded by the chunk size.
+
+open_upload_parts() turns several uploads, and zip or tar archives holding
+several CSV or TXT files, into one readable part per file, so that bulk.py
+can classify them in parallel.
+
+SENSEBOX_CSV_ENGINE=pyarrow reads UTF-8 CSVs with pyarrow's streaming reader
+instead of the pandas C parser, if pyarrow is installed.
+"""
+import codecs
+import csv
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from metrics import METRICS
+
+
+CHUNK_SIZE = 10_000
+
+# How much of the (decompressed) upload is looked at to sniff its format
+SAMPLE_BYTES = 64 * 1024
+
+CSV_ENGINE = os.environ.get("SENSEBOX_CSV_ENGINE", "c")
+
+DELIMITERS = ",;\t|"
+
+# A first line with a number, or a cell of more words than this, is read as data rather than a header
+MAX_HEADER_WORDS = 3
+
+# Tried in order when the sample is not UTF-8; latin-1 decodes any byte string
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")
+
+COMPRESSED_SUFFIXES = (".gz", ".gzip", ".zip")
+
+# Archive members read as parts of a multi-file upload; anything else (README, images) is skipped
+PART_SUFFIXES = (".csv", ".txt", ".csv.gz", ".txt.gz")
+
+
+class UploadFormat:
+    """What sniff_upload found out about an upload"""
+
+    def __init__(self, name: str, kind: str, compression: Optional[str], encoding: str, delimiter: str,
+                 columns: List[str], row_bytes: float, header: bool = True):
+        self.name = name
+        self.kind = kind
+        self.compression = compression
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.columns = columns
+        self.row_bytes = row_bytes
+        # False for a CSV whose first line is already data; columns are then numbered
+        self.header = header
+
+
+def pick_text_column(columns, preferred: Optional[Sequence[str]]):
+    """Return the column holding the text and whether a fallback to the first column was needed.
+
+    preferred lists candidate column names, matched case-insensitively in order.
+    """
+    if preferred and len(columns) > 1:
+        lowered = {}
+        for column in columns:
+            lowered.setdefault(str(column).lower(), column)
+        for name in preferred:
+            if name.lower() in lowered:
+                return lowered[name.lower()], False
+    return columns[0], len(columns) > 1
+
+
+def _open_stream(uploaded_file):
+    """(stream, name, compression) for the decompressed content of the upload, read from the start"""
+    name = getattr(uploaded_file, "name", "") or ""
+    uploaded_file.seek(0)
+    magic = uploaded_file.read(4)
+    uploaded_file.seek(0)
+    if magic[:2] == b"\x1f\x8b":
+        base, suffix = os.path.splitext(name)
+        inner_name = base if suffix.lower() in COMPRESSED_SUFFIXES else name
+        return gzip.GzipFile(fileobj=uploaded_file, mode="rb"), inner_name, "gzip"
+    if magic == b"PK\x03\x04":
+        archive = zipfile.ZipFile(uploaded_file)
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+        if not members:
+            raise ValueError("The zip archive contains no files")
+        # Prefer the first CSV or TXT file; zip uploads hold a single table
+        member = next((info for info in members if info.filename.lower().endswith((".csv", ".txt"))), members[0])
+        return archive.open(member), member.filename, "zip"
+    return uploaded_file, name, None
+
+
+class UploadPart(io.BufferedReader):
+    """One file of a tar archive, spooled to a temporary file so it can be read independently of the others"""
+
+    def __init__(self, raw, name: str, size: int):
+        super().__init__(raw)
+        self._part_name = name
+        self.size = size
+
+    @property
+    def name(self) -> str:
+        return self._part_name
+
+
+def _is_part(name: str) -> bool:
+    base = os.path.basename(name)
+    # "._name" files are macOS resource forks
+    return name.lower().endswith(PART_SUFFIXES) and not base.startswith("._") and not name.startswith("__MACOSX/")
+
+
+def _is_tar(uploaded_file) -> bool:
+    """True for a tar archive, optionally gzip compressed"""
+    uploaded_file.seek(0)
+    stream = uploaded_file
+    compressed = uploaded_file.read(2) == b"\x1f\x8b"
+    uploaded_file.seek(0)
+    if compressed:
+        stream = gzip.GzipFile(fileobj=uploaded_file, mode="rb")
+    try:
+        block = stream.read(512)
+    except (OSError, EOFError, zlib.error):
+        return False
+    finally:
+        uploaded_file.seek(0)
+    return block[257:262] == b"ustar"
+
+
+def _archive_parts(uploaded_file, opened: list) -> Optional[list]:
+    """The CSV and TXT members of a zip or tar upload, or None if it is not an archive of several files"""
+    name = getattr(uploaded_file, "name", "") or ""
+    uploaded_file.seek(0)
+    magic = uploaded_file.read(4)
+    uploaded_file.seek(0)
+    if magic == b"PK\x03\x04":
+        archive = zipfile.ZipFile(uploaded_file)
+        members = [info for info in archive.infolist() if not info.is_dir() and _is_part(info.filename)]
+        if len(members) < 2:
+            # A single table: read as before, straight from the upload
+            archive.close()
+            return None
+        parts = []
+        for info in members:
+            # Members of one ZipFile can be read from several threads; each seeks under the archive's lock
+            member = archive.open(info)
+            member.name = f"{name}/{info.filename}"
+            member.size = info.file_size
+            opened.append(member)
+            parts.append(member)
+        return parts
+    if not _is_tar(uploaded_file):
+        return None
+    parts = []
+    # A compressed tar can only be read front to back, so each member is copied out once
+    with tarfile.open(fileobj=uploaded_file, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile() or not _is_part(info.name):
+                continue
+            raw = tempfile.TemporaryFile(prefix="sensebox_part_", buffering=0)
+            shutil.copyfileobj(archive.extractfile(info), raw, 1 << 20)
+            raw.seek(0)
+            part = UploadPart(raw, f"{name}/{info.name}", info.size)
+            opened.append(part)
+            parts.append(part)
+    uploaded_file.seek(0)
+    if not parts:
+        raise ValueError("The tar archive contains no CSV or TXT files")
+    return parts
+
+
+@contextmanager
+def open_upload_parts(uploaded_files) -> Iterator[list]:
+    """The files in a list of uploads, with zip and tar archives of several CSV or TXT files expanded.
+
+    Plain uploads are yielded as they are; archive members get a name of the form
+    "<archive>/<member>" and a size, and are closed on exit.
+    """
+    opened = []
+    try:
+        parts = []
+        for uploaded_file in uploaded_files:
+            members = _archive_parts(uploaded_file, opened)
+            parts.extend(members if members is not None else [uploaded_file])
+        yield parts
+    finally:
+        for part in opened:
+            part.close()
+
+
+def _detect_encoding(sample: bytes, complete: bool) -> str:
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if not complete and e.start >= len(sample) - 3:
+            # A multi-byte character cut off at the end of the sample
+            return "utf-8"
+    # Mostly valid UTF-8 with a few bad bytes reads better as UTF-8 with replacements
+    replaced = sample.decode("utf-8", errors="replace").count("\ufffd")
+    non_ascii = sum(byte > 127 for byte in sample)
+    if replaced * 4 < non_ascii:
+        return "utf-8"
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def _is_number(cell: str) -> bool:
+    try:
+        float(cell)
+    except ValueError:
+        return False
+    return True
+
+
+def _has_header(lines: List[str], delimiter: str) -> bool:
+    """Whether the first line names the columns rather than holding the first row.
+
+    Column names are short and not numbers; messages are sentences and labels are often numbers.
+    """
+    if not lines:
+        return True
+    cells = [cell.strip() for cell in next(csv.reader(lines[:1], delimiter=delimiter), [])]
+    return any(cells) and not any(_is_number(cell) or len(cell.split()) > MAX_HEADER_WORDS for cell in cells)
+
+
+def sniff_upload(uploaded_file) -> UploadFormat:
+    """Compression, encoding, delimiter and header of an upload, from its first SAMPLE_BYTES"""
+    stream, name, compression = _open_stream(uploaded_file)
+    try:
+        sample = stream.read(SAMPLE_BYTES)
+        complete = len(sample) < SAMPLE_BYTES
+    finally:
+        if stream is not uploaded_file:
+            stream.close()
+        uploaded_file.seek(0)
+
+    encoding = _detect_encoding(sample, complete)
+    text = sample.decode(encoding, errors="replace")
+    lines = text.splitlines()
+    if not complete and len(lines) > 1:
+        # The last line may be cut off by the sample boundary
+        lines = lines[:-1]
+    row_bytes = len(sample) / max(1, len(lines))
+
+    if not name.lower().endswith(".csv"):
+        return UploadFormat(name, "txt", compression, encoding, "\n", ["text"], row_bytes)
+
+    header = lines[0] if lines else ""
+    delimiter = ","
+    try:
+        sniffed = csv.Sniffer().sniff("\n".join(lines[:100]), delimiters=DELIMITERS).delimiter
+        if sniffed in header:
+            delimiter = sniffed
+    except csv.Error:
+        pass
+    columns = next(csv.reader([header], delimiter=delimiter), []) or [""]
+    if not _has_header(lines, delimiter):
+        columns = [f"Column {i + 1}" for i in range(len(columns))]
+        return UploadFormat(name, "csv", compression, encoding, delimiter, columns, row_bytes, header=False)
+    return UploadFormat(name, "csv", compression, encoding, delimiter, columns, row_bytes)
+
+
+def iter_upload_chunks(uploaded_file, chunk_size: int = CHUNK_SIZE,
+                       text_columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+    """Read a CSV or TXT upload, optionally gzip or zip compressed, as DataFrames of at most chunk_size rows.
+
+    With text_columns (candidate names, see pick_text_column) only the text column is read.
+    Every chunk's attrs["source_columns"] lists all columns of the upload.
+    """
+    chunks = _read_chunks(uploaded_file, chunk_size, text_columns)
+    if not METRICS.enabled:
+        yield from chunks
+        return
+
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(chunks, None)
+        except Exception:
+            METRICS.inc("errors", stage="parse")
+            raise
+        if chunk is None:
+            break
+        METRICS.observe("parse", time.perf_counter() - start)
+        yield chunk
+    try:
+        METRICS.inc("bytes_read", uploaded_file.tell())
+    except ValueError:
+        # Closed by the CSV reader
+        METRICS.inc("bytes_read", getattr(uploaded_file, "size", 0))
+
+
+def _read_chunks(uploaded_file, chunk_size: int, text_columns: Optional[Sequence[str]]) -> Iterator[pd.DataFrame]:
+    fmt = sniff_upload(uploaded_file)
+    stream, _, _ = _open_stream(uploaded_file)
+    try:
+        for chunk in _parse(stream, fmt, chunk_size, text_columns):
+            chunk.attrs["source_columns"] = fmt.columns
+            yield chunk
+    finally:
+        if stream is not uploaded_file:
+            stream.close()
+
+
+def _parse(stream, fmt: UploadFormat, chunk_size: int, text_columns: Optional[Sequence[str]]):
+    if fmt.kind == "csv":
+        usecols = None
+        if text_columns is not None:
+            usecols = [pick_text_column(fmt.columns, text_columns)[0]]
+        if CSV_ENGINE == "pyarrow" and fmt.encoding in ("utf-8", "utf-8-sig"):
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                pass
+            else:
+                yield from _parse_arrow(stream, fmt, chunk_size, usecols)
+                return
+        names = None if fmt.header else fmt.columns
+        with pd.read_csv(stream, chunksize=chunk_size, sep=fmt.delimiter, usecols=usecols, dtype=str,
+                         header="infer" if fmt.header else None, names=names, keep_default_na=False,
+                         encoding=fmt.encoding, encoding_errors="replace") as reader:
+            yield from reader
+        return
+
+    # TXT file: one message per line
+    wrapper = io.TextIOWrapper(stream, encoding=fmt.encoding, errors="replace", newline='')
+    try:
+        lines = []
+        for line in wrapper:
+            lines.append(line.rstrip('\r\n'))
+            if len(lines) == chunk_size:
+                yield pd.DataFrame({'text': lines})
+                lines = []
+        if lines:
+            yield pd.DataFrame({'text': lines})
+    finally:
+        # Leave the upload open so it can be read again on the next rerun
+        wrapper.detach()
+
+
+def _parse_arrow(stream, fmt: UploadFormat, chunk_size: int, usecols: Optional[List[str]]):
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    # pyarrow batches by bytes; size the blocks to hold about chunk_size rows
+    block_size = int(min(max(fmt.row_bytes * chunk_size, 1 << 20), 64 << 20))
+    columns = usecols or fmt.columns
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(block_size=block_size, column_names=None if fmt.header else fmt.columns),
+        parse_options=pa_csv.ParseOptions(delimiter=fmt.delimiter, newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(include_columns=usecols, strings_can_be_null=False,
+                                              column_types={column: pa.string() for column in columns}),
+    )
+    for batch in reader:
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def upload_progress(uploaded_file) -> float:
+    """Fraction of the upload consumed so far, based on the read position"""
+    size = getattr(uploaded_file, 'size', 0)
+    if not size:
+        return 0.0
+    try:
+        return min(uploaded_file.tell() / size, 1.0)
+    except ValueError:
+        return 1.0
+
+
+def upload_digest(uploaded_file) -> str:
+    """sha256 of the upload's content"""
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(1 << 20), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
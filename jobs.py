@@ -0,0 +1,254 @@
+"""Background jobs for long-running bulk classification.
+
+An upload submitted as a job is copied into the jobs directory and classified
+on a small thread pool, so the Streamlit script run that submitted it returns
+immediately and any later rerun (or another session) can poll its progress.
+Job state lives in a SQLite database next to the copies: the result file is
+checkpointed after every chunk, so a cancelled, failed or interrupted job can
+be resumed from where it stopped instead of starting over.
+"""
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Dict, List, Optional
+
+from bulk import BulkResult, ResultWriter, label_chunk, text_column, text_columns
+from ingest import CHUNK_SIZE, iter_upload_chunks
+from inference import ParallelPredictor
+
+
+DEFAULT_JOBS_DIR = os.environ.get("SENSEBOX_JOBS_DIR", os.path.join(tempfile.gettempdir(), "sensebox_jobs"))
+DEFAULT_JOB_WORKERS = int(os.environ.get("SENSEBOX_JOB_WORKERS", 2))
+
+# Finished jobs older than this are deleted together with their files
+JOB_TTL_SECONDS = float(os.environ.get("SENSEBOX_JOB_TTL_HOURS", 24)) * 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE = (QUEUED, RUNNING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    source_name TEXT NOT NULL,
+    digest TEXT,
+    model_version TEXT,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    bytes_total INTEGER NOT NULL DEFAULT 0,
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    checkpoint TEXT,
+    warning TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobManager:
+    """Runs bulk classification jobs on a thread pool and keeps their state in SQLite"""
+
+    def __init__(self, engine: ParallelPredictor, jobs_dir: Optional[str] = None, workers: Optional[int] = None):
+        self.engine = engine
+        self.registry = engine.registry
+        self.jobs_dir = jobs_dir or DEFAULT_JOBS_DIR
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.db_path = os.path.join(self.jobs_dir, "jobs.sqlite3")
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max(1, workers or DEFAULT_JOB_WORKERS), thread_name_prefix="sensebox-job")
+        with closing(self._connect()) as db, db:
+            db.execute(SCHEMA)
+        self.purge()
+        # Jobs that were queued or running when the previous process stopped continue from their checkpoint
+        for job in self.list_jobs(statuses=ACTIVE):
+            self._update(job["id"], status=QUEUED)
+            self._executor.submit(self._run, job["id"])
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _update(self, job_id: str, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, closing(self._connect()) as db, db:
+            db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_jobs(self, statuses=None, limit: Optional[int] = None) -> List[Dict[str, object]]:
+        """Jobs, newest first"""
+        query = "SELECT * FROM jobs"
+        params = []
+        if statuses:
+            query += f" WHERE status IN ({', '.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        query += " ORDER BY created DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with closing(self._connect()) as db:
+            return [dict(row) for row in db.execute(query, params)]
+
+    def find(self, task: str, digest: str, model_version: Optional[str]) -> Optional[Dict[str, object]]:
+        """The newest job for the same upload and model that is running or has finished"""
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT * FROM jobs WHERE task = ? AND digest = ? AND model_version IS ? AND status IN (?, ?, ?) "
+                "ORDER BY created DESC LIMIT 1",
+                (task, digest, model_version, QUEUED, RUNNING, DONE),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def submit(self, uploaded_file, task: str, digest: Optional[str] = None) -> str:
+        """Copy the upload into the jobs directory and queue it; returns the job id"""
+        job_id = uuid.uuid4().hex
+        # Keep the original file name: its extension tells the reader how to parse the copy
+        safe_name = re.sub(r"[^\w.-]", "_", os.path.basename(uploaded_file.name))
+        input_path = os.path.join(self.jobs_dir, f"{job_id}_input_{safe_name}")
+        output_path = os.path.join(self.jobs_dir, f"{job_id}_{task}.csv")
+        uploaded_file.seek(0)
+        with open(input_path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, 1 << 20)
+        uploaded_file.seek(0)
+
+        now = time.time()
+        with self._lock, closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT INTO jobs (id, task, source_name, digest, model_version, input_path, output_path, status, "
+                "bytes_total, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, task, uploaded_file.name, digest, self.registry.version(task), input_path, output_path,
+                 QUEUED, os.path.getsize(input_path), now, now),
+            )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def cancel(self, job_id: str):
+        """Ask a queued or running job to stop after its current chunk; its partial output is kept"""
+        self._update(job_id, cancel_requested=1)
+
+    def resume(self, job_id: str) -> bool:
+        """Queue a cancelled or failed job again, continuing from its last checkpoint"""
+        job = self.get(job_id)
+        if job is None or job["status"] not in (CANCELLED, FAILED):
+            return False
+        self._update(job_id, status=QUEUED, cancel_requested=0, error=None)
+        self._executor.submit(self._run, job_id)
+        return True
+
+    def result(self, job_id: str, partial: bool = False) -> Optional[BulkResult]:
+        """The finished result of a job, or with partial=True the rows classified up to its last checkpoint"""
+        job = self.get(job_id)
+        if job is None or not job["checkpoint"] or (job["status"] != DONE and not partial):
+            return None
+        checkpoint = json.loads(job["checkpoint"])
+        counts = dict(sorted(checkpoint["counts"].items(), key=lambda item: -item[1]))
+        return BulkResult(job["output_path"], job["task"], checkpoint["rows"], job["seconds"], counts,
+                          checkpoint["offsets"], job["warning"], checkpoint.get("columns"), job["model_version"])
+
+    def purge(self, max_age: float = JOB_TTL_SECONDS):
+        """Delete finished jobs, and their files, that have not been touched for max_age seconds"""
+        cutoff = time.time() - max_age
+        with closing(self._connect()) as db:
+            stale = db.execute("SELECT id, input_path, output_path FROM jobs WHERE status NOT IN (?, ?) "
+                               "AND updated < ?", (*ACTIVE, cutoff)).fetchall()
+        for job in stale:
+            for path in (job["input_path"], job["output_path"]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock, closing(self._connect()) as db, db:
+                db.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job_id: str):
+        job = self.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        if job["cancel_requested"]:
+            self._update(job_id, status=CANCELLED)
+            return
+
+        task = job["task"]
+        # Pinned to the current version, so a hot reload during the job does not mix versions in its output
+        model = self.engine.for_model(task)
+        checkpoint = json.loads(job["checkpoint"]) if job["checkpoint"] else None
+        if checkpoint is not None and job["model_version"] != model.version:
+            # The model changed since the partial output was written; start over with the new one
+            checkpoint = None
+        self._update(job_id, status=RUNNING, model_version=model.version)
+
+        seconds = job["seconds"] if checkpoint is not None else 0.0
+        skip = checkpoint["rows"] if checkpoint is not None else 0
+        start = time.perf_counter()
+        column = None
+        warning = job["warning"]
+        try:
+            # The chunk reader is closed before the input file, which it would otherwise flush once closed
+            with open(job["input_path"], "rb") as source, \
+                    ResultWriter(job["output_path"], task, checkpoint) as writer, \
+                    closing(iter_upload_chunks(source, max(CHUNK_SIZE, self.engine.chunk_size),
+                                               text_columns(task))) as chunks:
+                for chunk in chunks:
+                    if column is None:
+                        column, warning = text_column(chunk, task)
+                    if skip:
+                        # Rows before the checkpoint were classified by an earlier run
+                        done = min(skip, len(chunk))
+                        chunk = chunk.iloc[done:]
+                        skip -= done
+                        if chunk.empty:
+                            continue
+                    writer.write(label_chunk(chunk, model, task, column))
+                    self._update(job_id, rows_done=writer.rows, bytes_done=source.tell(),
+                                 seconds=seconds + time.perf_counter() - start,
+                                 checkpoint=json.dumps(writer.checkpoint()), warning=warning)
+                    if self.get(job_id)["cancel_requested"]:
+                        raise JobCancelled()
+                final = writer.checkpoint()
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED)
+            return
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e))
+            return
+        self._update(job_id, status=DONE, rows_done=final["rows"], bytes_done=job["bytes_total"],
+                     seconds=seconds + time.perf_counter() - start, checkpoint=json.dumps(final), warning=warning)
+
+
+def job_progress(job: Dict[str, object]) -> float:
+    """Fraction of the job's input read so far"""
+    if job["status"] == DONE:
+        return 1.0
+    if not job["bytes_total"]:
+        return 0.0
+    return min(job["bytes_done"] / job["bytes_total"], 1.0)
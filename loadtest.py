@@ -0,0 +1,338 @@
+"""Offline load test: simulated concurrent sessions against one Sensebox_web.py process.
+
+    python loadtest.py                                      # 1, 2, 4, 8 and 16 sessions, 20 s each
+    python loadtest.py --sessions 1 4 16 32 --duration 60 --upload-share 0.2 --output load.json
+
+Each session is a Streamlit AppTest running the real script in this process,
+just as the sessions of one `streamlit run` server share a process, its GIL,
+the cached models and the static assets. A session loads the page and then
+repeats a random action until the step ends: a single-text click in the spam,
+review or news tab or, with probability --upload-share, a bulk upload of a
+fresh synthetic CSV in the spam or review tab. Widget state persists as in a
+browser, so every later rerun of that session redraws its last bulk result.
+
+For each session count the report gives rerun latency percentiles per action,
+throughput in reruns per second, process CPU use (in cores, and per session)
+and resident memory growth per session. The saturation point is the first
+session count at which throughput grows by less than --min-gain over the
+previous step, or p95 latency exceeds --latency-budget.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import threading
+import time
+import warnings
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from benchmark import as_upload, synthetic_corpus
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(BASE_DIR, "Sensebox_web.py")
+
+# What a session's patched st.file_uploader hands back, by widget key
+UPLOADS_KEY = "_loadtest_uploads"
+
+# Single-text actions: (input label, button label, corpus kind)
+CLICKS = {
+    "spam": ("Enter a message to classify", "Detect Spam", "messages"),
+    "review": ("Enter a food review", "Analyze Sentiment", "reviews"),
+    "news": ("Enter a news headline or article", "Categorize Article", "messages"),
+}
+# Bulk upload actions: uploader widget key -> corpus kind
+UPLOADS = {"spam": "messages", "review": "reviews"}
+
+SESSION_SCRIPT = f"""
+import sys
+sys.path.insert(0, {BASE_DIR!r})
+import loadtest
+loadtest.run_app({APP_PATH!r})
+"""
+
+# Streamlit releases whose AppTest internals shared_sessions() is written against
+SUPPORTED_STREAMLIT = ("1.66",)
+
+_compiled = {}
+
+
+def check_streamlit():
+    """Raise RuntimeError unless the installed Streamlit is one shared_sessions() supports"""
+    import streamlit
+
+    if ".".join(streamlit.__version__.split(".")[:2]) not in SUPPORTED_STREAMLIT:
+        raise RuntimeError(f"The load test patches AppTest internals and supports Streamlit "
+                           f"{', '.join(v + '.x' for v in SUPPORTED_STREAMLIT)}, not {streamlit.__version__}")
+
+
+@contextmanager
+def shared_sessions():
+    """Let AppTest sessions run at the same time, as the sessions of one server do; undone on exit.
+
+    AppTest installs a fresh mock Runtime and patches the config for each run,
+    undoing both when the run ends, which pulls them from under the runs of
+    the other sessions. Here every session shares one runtime and one config.
+    st.file_uploader also returns the upload a session put in its session
+    state, if any.
+    """
+    check_streamlit()
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test, util
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    runtime.bidi_component_registry = app_test.BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    real_file_uploader = st.file_uploader
+
+    def file_uploader(label, *args, key=None, **kwargs):
+        files = real_file_uploader(label, *args, key=key, **kwargs)
+        upload = st.session_state.get(UPLOADS_KEY, {}).get(key)
+        if upload is None:
+            return files
+        return [upload] if kwargs.get("accept_multiple_files") else upload
+
+    saved = (Runtime._instance, app_test.Runtime, config.get_option, app_test.patch_config_options)
+    Runtime._instance = runtime
+    # What AppTest installs and removes per run goes to a stand-in instead
+    app_test.Runtime = type("Runtime", (), {"_instance": None})
+    config.get_option = util.build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: nullcontext()
+    st.file_uploader = file_uploader
+    try:
+        yield
+    finally:
+        Runtime._instance, app_test.Runtime, config.get_option, app_test.patch_config_options = saved
+        st.file_uploader = real_file_uploader
+
+
+def run_app(path: str = APP_PATH):
+    """Execute the app script as `streamlit run` would; called from inside every AppTest session"""
+    code = _compiled.get(path)
+    if code is None:
+        with open(path, encoding="utf-8") as f:
+            code = _compiled[path] = compile(f.read(), path, "exec")
+    exec(code, {"__name__": "__main__", "__file__": path})
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # Peak rather than current RSS, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_seconds() -> float:
+    """User plus system CPU time of every thread of this process"""
+    times = os.times()
+    return times.user + times.system
+
+
+class Session:
+    """One simulated browser session; sessions run at the same time only inside shared_sessions()"""
+
+    def __init__(self, index: int, upload_share: float, upload_rows: int, timeout: float, seed: int):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.upload_share = upload_share
+        self.upload_rows = upload_rows
+        self.rng = random.Random(seed * 7919 + index)
+        self.app = AppTest.from_string(SESSION_SCRIPT, default_timeout=timeout)
+        self.uploads = 0
+        self.clicks = []
+
+    def _timed(self, action: str, run, samples: list):
+        start = time.perf_counter()
+        try:
+            run()
+            error = bool(self.app.exception)
+        except Exception:
+            error = True
+        samples.append((action, time.perf_counter() - start, error))
+
+    def load(self, samples: list):
+        self._timed("load", self.app.run, samples)
+        # Only click in tabs whose model is available
+        widgets = list(self.app.text_input) + list(self.app.text_area)
+        self.clicks = [task for task, (label, _, _) in CLICKS.items()
+                       if any(widget.label == label and not widget.disabled for widget in widgets)]
+
+    def act(self, samples: list):
+        if self.rng.random() < self.upload_share or not self.clicks:
+            task = self.rng.choice(list(UPLOADS))
+            self.uploads += 1
+            upload = as_upload(synthetic_corpus(UPLOADS[task], self.upload_rows, self.rng.randrange(1 << 30)), "csv")
+            upload.name = upload.file_id = f"session{self.index}-upload{self.uploads}.csv"
+            # The new upload replaces the session's previous one, as re-picking a file would
+            self.app.session_state[UPLOADS_KEY] = {task: upload}
+            self._timed(f"upload:{task}", self.app.run, samples)
+            return
+        task = self.rng.choice(self.clicks)
+        label, button, kind = CLICKS[task]
+        widget = next(widget for widget in list(self.app.text_input) + list(self.app.text_area)
+                      if widget.label == label)
+        widget.input(synthetic_corpus(kind, 1, self.rng.randrange(1 << 30))[0])
+        click = next(widget for widget in self.app.button if widget.label == button).click
+        self._timed(f"click:{task}", lambda: click().run(), samples)
+
+    def run_until(self, deadline: float, samples: list):
+        while time.perf_counter() < deadline:
+            self.act(samples)
+
+
+def _run_threads(sessions: List[Session], target):
+    threads = [threading.Thread(target=target, args=(session,), name=f"loadtest-{session.index}")
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _latencies(samples, prefix: str = "") -> Dict[str, float]:
+    seconds = np.array([duration for action, duration, _ in samples if action.startswith(prefix)])
+    if not len(seconds):
+        return {}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000
+    return {"count": int(len(seconds)), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": seconds.max() * 1000}
+
+
+def run_step(count: int, duration: float, upload_share: float, upload_rows: int, timeout: float, seed: int) -> dict:
+    """Run count concurrent sessions for duration seconds after they have loaded the page"""
+    gc.collect()
+    rss_before = rss_bytes()
+    sessions = [Session(i, upload_share, upload_rows, timeout, seed) for i in range(count)]
+    load_samples = []
+    _run_threads(sessions, lambda session: session.load(load_samples))
+
+    samples = []
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    deadline = start + duration
+    _run_threads(sessions, lambda session: session.run_until(deadline, samples))
+    wall = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+    rss_after = rss_bytes()
+
+    result = {
+        "sessions": count,
+        "reruns": len(samples),
+        "errors": sum(error for _, _, error in load_samples + samples),
+        "throughput": len(samples) / wall if wall else 0.0,
+        "rerun": _latencies(samples),
+        "load": _latencies(load_samples),
+        "actions": {action: _latencies(samples, action) for action in sorted({action for action, _, _ in samples})},
+        "cpu_cores": cpu / wall if wall else 0.0,
+        "cpu_ms_per_rerun": cpu / len(samples) * 1000 if samples else 0.0,
+        "cpu_cores_per_session": cpu / wall / count if wall else 0.0,
+        "rss_mb": rss_after / 2 ** 20,
+        "rss_mb_per_session": (rss_after - rss_before) / count / 2 ** 20,
+    }
+    del sessions
+    gc.collect()
+    return result
+
+
+def saturation(steps: List[dict], min_gain: float, latency_budget_ms: float) -> dict:
+    """Where adding sessions stops adding throughput, and the most sessions that kept p95 within budget"""
+    saturated_at = None
+    for previous, step in zip(steps, steps[1:]):
+        if step["throughput"] < previous["throughput"] * (1 + min_gain):
+            saturated_at = step["sessions"]
+            break
+    within = [step["sessions"] for step in steps if step["rerun"] and step["rerun"]["p95_ms"] <= latency_budget_ms]
+    return {"saturated_at": saturated_at, "max_sessions_within_budget": max(within) if within else None}
+
+
+def warm_up(timeout: float) -> float:
+    """Load the page and run every action once, so the steps do not pay for model loading"""
+    session = Session(-1, 0.0, 100, timeout, 0)
+    samples = []
+    start = time.perf_counter()
+    session.load(samples)
+    for task in session.clicks:
+        session.clicks = [task]
+        session.act(samples)
+    session.upload_share = 1.0
+    for _ in UPLOADS:
+        session.act(samples)
+    return time.perf_counter() - start
+
+
+def run_steps(args):
+    """Warm up, then run and print one step per session count"""
+    print("Warming up...")
+    cold_start = warm_up(args.timeout)
+    print(f"{'sessions':>8} {'reruns':>7} {'errors':>6} {'rerun/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'cores':>6} {'cores/sess':>10} {'RSS MB':>8} {'MB/sess':>8}")
+    steps = []
+    for count in args.sessions:
+        step = run_step(count, args.duration, args.upload_share, args.upload_rows, args.timeout, args.seed)
+        steps.append(step)
+        rerun = step["rerun"] or {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+        print(f"{count:>8} {step['reruns']:>7,} {step['errors']:>6} {step['throughput']:>8.1f} "
+              f"{rerun['p50_ms']:>8.0f} {rerun['p95_ms']:>8.0f} {rerun['p99_ms']:>8.0f} {step['cpu_cores']:>6.2f} "
+              f"{step['cpu_cores_per_session']:>10.3f} {step['rss_mb']:>8.0f} {step['rss_mb_per_session']:>8.1f}")
+    return cold_start, steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with simulated concurrent sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="Concurrent session counts to step through")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of activity per step")
+    parser.add_argument("--upload-share", type=float, default=0.1, help="Share of actions that are bulk uploads")
+    parser.add_argument("--upload-rows", type=int, default=2_000, help="Rows per uploaded file")
+    parser.add_argument("--latency-budget", type=float, default=1000.0, help="Acceptable p95 rerun latency, in ms")
+    parser.add_argument("--min-gain", type=float, default=0.10,
+                        help="Smallest throughput gain per step that does not count as saturated")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before a single rerun counts as hung")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the full report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        check_streamlit()
+    except RuntimeError as e:
+        parser.error(str(e))
+    warnings.filterwarnings("ignore")
+    # Streamlit logs a warning per session for running outside `streamlit run`, and deprecation notices per rerun
+    logging.disable(logging.WARNING)
+    with shared_sessions():
+        cold_start, steps = run_steps(args)
+
+    point = saturation(steps, args.min_gain, args.latency_budget)
+    print(f"Cold start (first page load and models): {cold_start:.1f}s")
+    for action in sorted({action for step in steps for action in step["actions"]}):
+        quantiles = ", ".join(f"{step['sessions']}: {step['actions'][action]['p95_ms']:.0f}"
+                              for step in steps if action in step["actions"])
+        print(f"p95 ms of {action} by sessions: {quantiles}")
+    print(f"Throughput saturated at: {point['saturated_at'] or 'not reached'} sessions; "
+          f"most sessions with p95 <= {args.latency_budget:.0f} ms: {point['max_sessions_within_budget'] or 'none'}")
+
+    if args.output:
+        report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "cpu_count": os.cpu_count(),
+                  "config": vars(args), "cold_start_seconds": cold_start, "steps": steps, "saturation": point}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
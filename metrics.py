@@ -0,0 +1,210 @@
+"""Per-stage timing histograms and counters, exported in the Prometheus text format.
+
+Enable with SENSEBOX_METRICS=1. Stages recorded, labelled by model where one applies:
+
+    parse       reading one chunk of an upload into a DataFrame
+    predict     a whole predict call, including the prediction cache
+    vectorize   the TF-IDF transform of one batch of uncached texts
+    classify    the classifier on the vectorized batch
+    tokenize    one batch tokenization shared by several models ("analyze all")
+    dataframe   building the labelled output frame for a chunk
+    write       appending a labelled chunk to the result CSV
+    page_read   reading one page of a bulk result back from disk
+    render      handing that page to st.dataframe
+    warmup      loading a model and its first predict call at start-up (SENSEBOX_WARMUP=1)
+
+plus the counters sensebox_rows_total, sensebox_bytes_read_total and
+sensebox_errors_total. When disabled, timer() hands back a shared no-op
+context manager and observe()/inc() return straight away.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+
+ENABLED = os.environ.get("SENSEBOX_METRICS", "0") == "1"
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = "sensebox"
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket; not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (the largest finite bound for +Inf)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics: "Metrics", stage: str, model: Optional[str]):
+        self.metrics = metrics
+        self.stage = stage
+        self.model = model
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.model)
+        if exc_type is not None:
+            self.metrics.inc("errors", stage=self.stage, model=self.model)
+        return False
+
+
+def _labels(**labels) -> str:
+    pairs = []
+    for name, value in labels.items():
+        if value is None:
+            continue
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    """Thread-safe store of stage histograms and counters for one process"""
+
+    def __init__(self, enabled: bool = ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def timer(self, stage: str, model: Optional[str] = None):
+        """Context manager recording the time spent in its block, and an error if it raises"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, model)
+
+    def observe(self, stage: str, seconds: float, model: Optional[str] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get((stage, model))
+            if histogram is None:
+                histogram = self._histograms[(stage, model)] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _sorted_histograms(self):
+        return sorted(self._histograms.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """One row per stage and model, with latencies in milliseconds"""
+        with self._lock:
+            return [
+                {
+                    "stage": stage,
+                    "model": model or "",
+                    "count": histogram.count,
+                    "total_s": histogram.sum,
+                    "mean_ms": histogram.sum / histogram.count * 1000,
+                    "p50_ms": histogram.quantile(0.50) * 1000,
+                    "p95_ms": histogram.quantile(0.95) * 1000,
+                }
+                for (stage, model), histogram in self._sorted_histograms()
+            ]
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return {f"{PREFIX}_{name}_total{_labels(**dict(labels))}": value
+                    for (name, labels), value in sorted(self._counters.items(), key=repr)}
+
+    def render_prometheus(self) -> str:
+        """Everything recorded so far in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            histograms = self._sorted_histograms()
+            counters = sorted(self._counters.items(), key=repr)
+            if histograms:
+                name = f"{PREFIX}_stage_seconds"
+                lines.append(f"# HELP {name} Time spent in each processing stage")
+                lines.append(f"# TYPE {name} histogram")
+                for (stage, model), histogram in histograms:
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(stage=stage, model=model, le=repr(bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(stage=stage, model=model, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(stage=stage, model=model)} {histogram.sum!r}")
+                    lines.append(f"{name}_count{_labels(stage=stage, model=model)} {histogram.count}")
+            declared = set()
+            for (counter, labels), value in counters:
+                name = f"{PREFIX}_{counter}_total"
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_labels(**dict(labels))} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by everything in the process: the Streamlit app, the HTTP server and the benchmarks
+METRICS = Metrics()
+
+
+def staged_predict(model, texts):
+    """model.predict(texts), timed as separate vectorize and classify stages.
+
+    Returns the predictions and a {stage: seconds} dict.
+    """
+    # Samplers such as SMOTE only run during fit, so they are skipped here just as in Pipeline.predict
+    steps = [step for _, step in getattr(model, "steps", ())
+             if step not in (None, "passthrough") and not hasattr(step, "fit_resample")]
+    if hasattr(model, "predict_features"):
+        vectorize, classify = model.transform, model.predict_features
+    elif len(steps) > 1:
+        def vectorize(features):
+            for step in steps[:-1]:
+                features = step.transform(features)
+            return features
+        classify = steps[-1].predict
+    else:
+        start = time.perf_counter()
+        predictions = model.predict(texts)
+        return predictions, {"classify": time.perf_counter() - start}
+    start = time.perf_counter()
+    features = vectorize(texts)
+    middle = time.perf_counter()
+    predictions = classify(features)
+    return predictions, {"vectorize": middle - start, "classify": time.perf_counter() - middle}
@@ -0,0 +1,343 @@
+"""Shared, hot-reloadable model store.
+
+Each model is loaded from models/<name>/<version>/ when that directory has
+versions, holding either a pickle or a compact export, with the highest
+version (compared numerically where the names are numbers) winning. Without
+versions it falls back to the flat models/<file>.pkl and its compact export,
+or the pruned or quantized variant of it named by SENSEBOX_MODEL_VARIANT
+(built by model_variants.py).
+
+Every load produces a LoadedModel (model, signature, version) that is
+replaced as a whole, so a caller that took a snapshot keeps predicting with
+one consistent version while a newer one is swapped in. By default get()
+notices a changed file and reloads it in the calling thread. watch() instead
+starts a ModelWatcher that polls for new versions, loads and warms them up in
+the background and swaps them in only once they pass, so no request waits
+for a load and a broken version never replaces a working one.
+"""
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import joblib
+
+from compact_model import COMPACT_DIR_NAME, META_FILE, VARIANTS_DIR_NAME, CompactPipeline, file_sha256, read_meta
+from fast_path import FastTfidfPipeline, enable_fast_path
+
+
+MODEL_FILES = {
+    "spam": "spam_classifier.pkl",
+    "language": "lang_det.pkl",
+    "news": "news_cat.pkl",
+    "review": "review.pkl",
+}
+
+# "auto" loads models/compact/<name>/ when it was exported from the current pickle, "pickle" never does
+MODEL_FORMAT = os.environ.get("SENSEBOX_MODEL_FORMAT", "auto")
+
+# Load models/variants/<variant>/<name>/, such as "int8" or "prune25-int8", for the flat models that have it
+MODEL_VARIANT = os.environ.get("SENSEBOX_MODEL_VARIANT", "")
+
+# Swap supported pipelines for the verified FastTfidfPipeline after loading
+FAST_PATH = os.environ.get("SENSEBOX_FAST_PATH", "0") == "1"
+
+# How often the ModelWatcher looks for new model versions; 0 disables hot reload
+RELOAD_SECONDS = float(os.environ.get("SENSEBOX_RELOAD_SECONDS", 2))
+
+
+def file_signature(path: str):
+    """(mtime, size) of a pickle or of a compact model's meta.json, or None if missing"""
+    if os.path.isdir(path):
+        path = os.path.join(path, META_FILE)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_model(path: str, fast_path: bool = FAST_PATH):
+    """Load a pickled pipeline or a compact model directory"""
+    model = CompactPipeline.load(path) if os.path.isdir(path) else joblib.load(path)
+    return enable_fast_path(model) if fast_path else model
+
+
+def _version_key(version: str):
+    """Sort key that puts version 2 before 10 and v2 before v10"""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", version) if part]
+
+
+class LoadedModel:
+    """A loaded model together with what it was loaded from"""
+
+    def __init__(self, model, signature, version: str, load_seconds: float):
+        self.model = model
+        self.signature = signature
+        self.version = version
+        self.load_seconds = load_seconds
+
+
+class ModelRegistry:
+    """Lazily loads the models and keeps one shared copy of each per process"""
+
+    def __init__(self, model_dir: str, files: Optional[Dict[str, str]] = None, model_format: str = MODEL_FORMAT,
+                 variant: str = MODEL_VARIANT):
+        self.model_dir = model_dir
+        self.files = dict(files or MODEL_FILES)
+        self.model_format = model_format
+        self.variant = variant
+        self._compact_checks = {}
+        self._loaded = {}
+        self._errors = {}
+        self._locks = {name: threading.Lock() for name in self.files}
+        self._watcher = None
+
+    def pickle_path(self, name: str) -> str:
+        return os.path.join(self.model_dir, self.files[name])
+
+    def compact_path(self, name: str) -> str:
+        return os.path.join(self.model_dir, COMPACT_DIR_NAME, name)
+
+    def variant_path(self, name: str) -> str:
+        return os.path.join(self.model_dir, VARIANTS_DIR_NAME, self.variant, name)
+
+    def _compact_is_current(self, name: str, path: Optional[str] = None) -> bool:
+        """True if the compact export at path (by default compact_path) exists and was made from the pickle now on disk"""
+        path = path or self.compact_path(name)
+        key = (file_signature(self.pickle_path(name)), file_signature(path))
+        if key[1] is None:
+            return False
+        cached = self._compact_checks.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        meta = read_meta(path) or {}
+        # Without the pickle there is nothing to be stale against
+        current = key[0] is None or meta.get("source_sha256") == file_sha256(self.pickle_path(name))
+        self._compact_checks[path] = (key, current)
+        return current
+
+    def versions_dir(self, name: str) -> str:
+        return os.path.join(self.model_dir, name)
+
+    def _version_model_path(self, version_dir: str) -> Optional[str]:
+        """The compact export or pickle inside one version directory, or None if it holds neither yet"""
+        compact = os.path.exists(os.path.join(version_dir, META_FILE))
+        if compact and self.model_format != "pickle":
+            return version_dir
+        try:
+            pickles = sorted(entry for entry in os.listdir(version_dir) if entry.endswith(".pkl"))
+        except OSError:
+            return None
+        if pickles:
+            return os.path.join(version_dir, pickles[0])
+        return version_dir if compact else None
+
+    def versions(self, name: str) -> List[str]:
+        """Complete versions in models/<name>/, oldest first"""
+        root = self.versions_dir(name)
+        try:
+            entries = os.listdir(root)
+        except OSError:
+            return []
+        return sorted((entry for entry in entries if not entry.startswith(".")
+                       and self._version_model_path(os.path.join(root, entry)) is not None), key=_version_key)
+
+    def path(self, name: str) -> str:
+        """Where the model is loaded from: its newest version, else the configured variant or the compact
+        export if usable, else the pickle"""
+        versions = self.versions(name)
+        if versions:
+            return self._version_model_path(os.path.join(self.versions_dir(name), versions[-1]))
+        if self.model_format != "pickle" and self.variant and self._compact_is_current(name, self.variant_path(name)):
+            return self.variant_path(name)
+        if self.model_format != "pickle" and self._compact_is_current(name):
+            return self.compact_path(name)
+        return self.pickle_path(name)
+
+    def _version_of(self, name: str, signature) -> str:
+        path, mtime_ns, size = signature
+        root = self.versions_dir(name) + os.sep
+        if path.startswith(root):
+            return path[len(root):].split(os.sep)[0]
+        if self.variant and path == self.variant_path(name):
+            return f"{name}-{self.variant}@{mtime_ns}:{size}"
+        return f"{os.path.basename(path)}@{mtime_ns}:{size}"
+
+    def signature(self, name: str):
+        """(path, mtime, size) of what the model is loaded from, or None if it does not exist"""
+        path = self.path(name)
+        signature = file_signature(path)
+        return None if signature is None else (path, *signature)
+
+    def loaded_signature(self, name: str):
+        """Signature of the file the loaded model came from"""
+        loaded = self._loaded.get(name)
+        return None if loaded is None else loaded.signature
+
+    def version(self, name: str) -> Optional[str]:
+        """Identifies the loaded model: its version directory, or the file name, mtime and size of a flat model"""
+        loaded = self._loaded.get(name)
+        return None if loaded is None else loaded.version
+
+    def is_available(self, name: str) -> bool:
+        """True if the model is loaded or its file exists and has not failed to load"""
+        if name in self._loaded:
+            return True
+        signature = self.signature(name)
+        if signature is None:
+            return False
+        return name not in self._errors or self._errors[name][1] != signature
+
+    def _load(self, name: str, signature) -> LoadedModel:
+        start = time.perf_counter()
+        model = load_model(signature[0])
+        return LoadedModel(model, signature, self._version_of(name, signature), time.perf_counter() - start)
+
+    def snapshot(self, name: str) -> Optional[LoadedModel]:
+        """The loaded model and its version, loading it on first use.
+
+        Without a watcher a model whose file changed on disk is reloaded here. Returns None
+        if the model cannot be loaded.
+        """
+        loaded = self._loaded.get(name)
+        if loaded is not None and self._watcher is not None:
+            return loaded
+        signature = self.signature(name)
+        if loaded is not None and signature in (None, loaded.signature):
+            return loaded
+        with self._locks[name]:
+            loaded = self._loaded.get(name)
+            if loaded is not None and signature in (None, loaded.signature):
+                return loaded
+            if signature is None or (name in self._errors and self._errors[name][1] == signature):
+                return loaded
+            try:
+                loaded = self._load(name, signature)
+            except Exception as e:
+                # Remember the failure until the file changes; keep serving the old model if any
+                self._errors[name] = (str(e), signature)
+                return self._loaded.get(name)
+            self._errors.pop(name, None)
+            self._loaded[name] = loaded
+            return loaded
+
+    def get(self, name: str):
+        """Return the model, loading it on first use (see snapshot). Returns None if it cannot be loaded."""
+        loaded = self.snapshot(name)
+        return None if loaded is None else loaded.model
+
+    def reload(self, name: str, warm: Optional[Callable[[str, object], Optional[str]]] = None) -> bool:
+        """Load the model now on disk alongside the current one and swap it in if it is different and healthy.
+
+        warm(name, model) runs the new model before the swap and returns a problem, or None if it is fit
+        to serve. Callers holding the previous snapshot finish with it. Returns True if a new model was swapped in.
+        """
+        signature = self.signature(name)
+        current = self._loaded.get(name)
+        if signature is None or (current is not None and current.signature == signature):
+            return False
+        if name in self._errors and self._errors[name][1] == signature:
+            return False
+        with self._locks[name]:
+            try:
+                loaded = self._load(name, signature)
+                problem = warm(name, loaded.model) if warm is not None else None
+                if problem is not None:
+                    raise ValueError(f"version {loaded.version} failed its warm-up check: {problem}")
+            except Exception as e:
+                self._errors[name] = (str(e), signature)
+                return False
+            self._errors.pop(name, None)
+            self._loaded[name] = loaded
+        return True
+
+    def watch(self, interval: float = RELOAD_SECONDS,
+              warm: Optional[Callable[[str, object], Optional[str]]] = None) -> Optional["ModelWatcher"]:
+        """Start reloading changed models in the background; snapshot() then never loads a new version itself"""
+        if interval <= 0:
+            return None
+        if self._watcher is None:
+            self._watcher = ModelWatcher(self, interval, warm)
+            self._watcher.start()
+        return self._watcher
+
+    def error(self, name: str) -> Optional[str]:
+        if name in self._errors:
+            return self._errors[name][0]
+        if not os.path.exists(self.path(name)):
+            return f"{self.files[name]} not found in {self.model_dir}"
+        return None
+
+    def load_times(self) -> Dict[str, float]:
+        """Seconds spent loading each model loaded so far"""
+        return {name: loaded.load_seconds for name, loaded in list(self._loaded.items())}
+
+    def status(self) -> Dict[str, str]:
+        status = {}
+        load_times = self.load_times()
+        for name in self.files:
+            loaded = self._loaded.get(name)
+            # A model loaded by another thread since load_times() is reported on the next call
+            if loaded is not None and name in load_times:
+                if isinstance(loaded.model, FastTfidfPipeline):
+                    source = "fast path"
+                elif isinstance(loaded.model, CompactPipeline):
+                    source = "compact"
+                else:
+                    source = "pickle"
+                status[name] = f"version {loaded.version} loaded from {source} in {load_times[name] * 1000:.0f} ms"
+                if name in self._errors:
+                    status[name] += f"; newer version not loaded: {self._errors[name][0]}"
+            elif self.is_available(name):
+                status[name] = "not loaded yet"
+            else:
+                status[name] = "unavailable"
+        return status
+
+
+class ModelWatcher:
+    """Polls the registry's loaded models for a new version and swaps it in once loaded and warmed up.
+
+    A new file is only loaded once its signature has stayed the same for one poll, so a
+    version directory that is still being copied in is not picked up half-written.
+    """
+
+    def __init__(self, registry: ModelRegistry, interval: float,
+                 warm: Optional[Callable[[str, object], Optional[str]]] = None):
+        self.registry = registry
+        self.interval = interval
+        self.warm = warm
+        self.reloads = 0
+        self._seen = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sensebox-model-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def check(self):
+        """One poll of every loaded model"""
+        for name in list(self.registry._loaded):
+            signature = self.registry.signature(name)
+            if signature is None or signature == self.registry.loaded_signature(name):
+                self._seen.pop(name, None)
+                continue
+            if self._seen.get(name) != signature:
+                self._seen[name] = signature
+                continue
+            if self.registry.reload(name, self.warm):
+                self.reloads += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # A transient file system error must not stop the watcher
+                continue
@@ -0,0 +1,217 @@
+"""Pruned and quantized variants of the TF-IDF pipelines, for low-memory deployments.
+
+    python model_variants.py                                     # default variants of every model
+    python model_variants.py spam news --variants int8 prune25-int8
+    python model_variants.py review --sample reviews.csv --label-column Sentiment
+
+A variant name is a weight type, float64 (as exported), float16 or int8,
+optionally preceded by "pruneNN-" to keep only the NN% of features that can
+move the class scores the most. Pruned terms leave the vocabulary, so they no
+longer count towards the TF-IDF norm either. int8 weights are stored per
+class as q * scale + offset.
+
+Each variant is written to models/variants/<variant>/<name>/ in the compact
+format and compared with the original pickle on a sample: size on disk, load
+time, rows per second and how many predictions change (and the accuracy of
+both, when the sample has labels). With SENSEBOX_MODEL_VARIANT=<variant> the
+app and the server load that variant instead of the full model, for every
+model that has it and as long as it was built from the pickle now on disk.
+"""
+import argparse
+import os
+import re
+import time
+import warnings
+from typing import Optional, Sequence
+
+import numpy as np
+
+from compact_model import (COMPACT_DIR_NAME, QUANTIZED_FORMAT_VERSION, VARIANTS_DIR_NAME, CompactPipeline,
+                           compact_arrays, feature_importance, write_compact)
+
+
+DEFAULT_VARIANTS = ("float16", "int8", "prune50-float16", "prune25-int8")
+
+WEIGHT_TYPES = ("float64", "float16", "int8")
+
+_VARIANT = re.compile(r"(?:prune(\d{1,2})-)?(float64|float16|int8)")
+
+
+def parse_variant(variant: str):
+    """(share of features kept or None, weight type) for a variant name; raises ValueError if invalid"""
+    match = _VARIANT.fullmatch(variant)
+    if match is None or match.group(1) in ("0", "00"):
+        raise ValueError(f"Invalid variant {variant!r}: expected [pruneNN-]{'|'.join(WEIGHT_TYPES)}")
+    keep = int(match.group(1)) / 100 if match.group(1) else None
+    return keep, match.group(2)
+
+
+def prune_arrays(meta: dict, arrays: dict, keep: float):
+    """Keep the share keep of the features, ranked by feature_importance(), renumbering their columns"""
+    n_features = arrays["weights"].shape[1]
+    count = max(1, int(round(n_features * keep)))
+    kept = np.zeros(n_features, dtype=bool)
+    kept[np.argpartition(-feature_importance(arrays["weights"], arrays["idf"]), count - 1)[:count]] = True
+    new_column = np.cumsum(kept) - 1
+    in_vocabulary = kept[arrays["term_index"]]
+    pruned = dict(arrays,
+                  vocabulary=arrays["vocabulary"][in_vocabulary],
+                  term_index=new_column[arrays["term_index"][in_vocabulary]].astype(np.int32),
+                  idf=arrays["idf"][kept],
+                  weights=np.ascontiguousarray(arrays["weights"][:, kept]))
+    return dict(meta, pruned_from=n_features), pruned
+
+
+def quantize_arrays(meta: dict, arrays: dict, weight_type: str):
+    """Store the weights as weight_type; int8 rows are scaled to use the full -128 .. 127 range"""
+    if weight_type == "float64":
+        return meta, arrays
+    weights = np.asarray(arrays["weights"], dtype=np.float64)
+    quantized = dict(arrays)
+    if weight_type == "float16":
+        quantized["weights"] = weights.astype(np.float16)
+    else:
+        low = weights.min(axis=1)
+        scale = (weights.max(axis=1) - low) / 255
+        scale[scale == 0] = 1.0
+        quantized["weights"] = (np.round((weights - low[:, None]) / scale[:, None]) - 128).astype(np.int8)
+        quantized["weight_scale"] = scale
+        quantized["weight_offset"] = low + 128 * scale
+    return dict(meta, format_version=QUANTIZED_FORMAT_VERSION, weights_dtype=weight_type), quantized
+
+
+def variant_arrays(pipeline, variant: str):
+    """(meta, arrays) of a variant of a fitted TF-IDF pipeline; raises ValueError if unsupported"""
+    keep, weight_type = parse_variant(variant)
+    meta, arrays = compact_arrays(pipeline)
+    if keep is not None:
+        meta, arrays = prune_arrays(meta, arrays, keep)
+    meta, arrays = quantize_arrays(meta, arrays, weight_type)
+    return dict(meta, variant=variant), arrays
+
+
+def variant_path(model_dir: str, variant: str, name: str) -> str:
+    return os.path.join(model_dir, VARIANTS_DIR_NAME, variant, name)
+
+
+def export_variant(pipeline, out_dir: str, variant: str, source: Optional[str] = None) -> str:
+    return write_compact(*variant_arrays(pipeline, variant), out_dir, source)
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, entry)) for entry in os.listdir(path))
+
+
+def _label_matches(predictions, labels, mapping: Optional[dict]) -> np.ndarray:
+    """Whether each prediction equals its label, given either as the class or as its display name"""
+    shown = [str(mapping.get(prediction, prediction)) if mapping else str(prediction) for prediction in predictions]
+    return np.array([label in (str(prediction), name)
+                     for prediction, name, label in zip(predictions, shown, map(str, labels))])
+
+
+def compare_variant(expected, variant_dir: str, texts: Sequence[str],
+                    labels: Optional[Sequence] = None, mapping: Optional[dict] = None) -> dict:
+    """Size, load time, speed and prediction changes of the variant in variant_dir.
+
+    expected holds the original model's predictions for texts, so they are computed once for every variant.
+    """
+    start = time.perf_counter()
+    model = CompactPipeline.load(variant_dir)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = model.predict(texts)
+    seconds = time.perf_counter() - start
+    changed = np.asarray(predictions) != np.asarray(expected)
+    report = {
+        "bytes": directory_bytes(variant_dir),
+        "features": model.n_features,
+        "load_ms": load_seconds * 1000,
+        "rows_per_second": len(texts) / seconds if seconds else 0.0,
+        "changed": float(np.mean(changed)) if len(texts) else 0.0,
+    }
+    if labels is not None:
+        report["accuracy"] = float(np.mean(_label_matches(predictions, labels, mapping)))
+    return report
+
+
+def _read_sample(path: str, label_column: Optional[str]):
+    """(texts, labels or None) from a CSV or TXT file"""
+    import pandas as pd
+
+    if not path.endswith(".csv"):
+        with open(path, encoding="utf-8") as f:
+            return f.read().split("\n"), None
+    frame = pd.read_csv(path)
+    labels = frame.pop(label_column).tolist() if label_column else None
+    return frame.iloc[:, 0].astype(str).tolist(), labels
+
+
+def main():
+    import joblib
+    from benchmark import synthetic_corpus
+    from bulk import TASKS
+    from model_registry import MODEL_FILES
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build pruned and quantized variants of the models and compare them")
+    parser.add_argument("models", nargs="*", help=f"Models to build variants of (default: all of {', '.join(MODEL_FILES)})")
+    parser.add_argument("--variants", nargs="+", default=list(DEFAULT_VARIANTS),
+                        help="Variant names: [pruneNN-]float64|float16|int8")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "models"))
+    parser.add_argument("--rows", type=int, default=20_000, help="Size of the synthetic sample")
+    parser.add_argument("--sample", help="Held-out CSV or TXT file to compare on instead of a synthetic sample")
+    parser.add_argument("--label-column", help="Column of --sample holding the true labels, to report accuracy")
+    args = parser.parse_args()
+
+    for variant in args.variants:
+        try:
+            parse_variant(variant)
+        except ValueError as e:
+            parser.error(str(e))
+    warnings.filterwarnings("ignore")
+    texts, labels = _read_sample(args.sample, args.label_column) if args.sample else (None, None)
+    for name in args.models or MODEL_FILES:
+        source = os.path.join(args.model_dir, MODEL_FILES[name])
+        if not os.path.exists(source):
+            print(f"{name}: {MODEL_FILES[name]} not found, skipping")
+            continue
+        start = time.perf_counter()
+        pipeline = joblib.load(source)
+        pickle_seconds = time.perf_counter() - start
+        sample = texts if texts is not None else synthetic_corpus("reviews" if name == "review" else "messages",
+                                                                  args.rows)
+        start = time.perf_counter()
+        expected = pipeline.predict(sample)
+        seconds = time.perf_counter() - start
+        mapping = TASKS.get(name, {}).get("labels")
+
+        rows = [("pickle", {
+            "bytes": os.path.getsize(source),
+            "features": len(pipeline.steps[0][1].vocabulary_) if hasattr(pipeline, "steps") else 0,
+            "load_ms": pickle_seconds * 1000,
+            "rows_per_second": len(sample) / seconds if seconds else 0.0,
+            "changed": 0.0,
+            **({"accuracy": float(np.mean(_label_matches(expected, labels, mapping)))} if labels is not None else {}),
+        })]
+        compact_dir = os.path.join(args.model_dir, COMPACT_DIR_NAME, name)
+        if os.path.isdir(compact_dir):
+            rows.append(("compact", compare_variant(expected, compact_dir, sample, labels, mapping)))
+        try:
+            for variant in args.variants:
+                out_dir = export_variant(pipeline, variant_path(args.model_dir, variant, name), variant, source)
+                rows.append((variant, compare_variant(expected, out_dir, sample, labels, mapping)))
+        except ValueError as e:
+            print(f"{name}: cannot build variants ({e})")
+            continue
+
+        print(f"{name} ({len(sample):,} rows{', labelled' if labels is not None else ''}):")
+        print(f"    {'variant':<16} {'bytes':>10} {'features':>8} {'load ms':>8} {'rows/s':>10} {'changed':>8}"
+              + (f" {'accuracy':>8}" if labels is not None else ""))
+        for variant, report in rows:
+            print(f"    {variant:<16} {report['bytes']:>10,} {report['features']:>8,} {report['load_ms']:>8.1f} "
+                  f"{report['rows_per_second']:>10,.0f} {report['changed']:>8.3%}"
+                  + (f" {report['accuracy']:>8.2%}" if labels is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
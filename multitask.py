@@ -0,0 +1,108 @@
+"""Run every available model over the same texts in one pass.
+
+Models whose vectorizers lower-case, strip accents and tokenize the same way
+share one batch tokenization: the batch is joined, normalized and tokenized
+once, and each model only maps the shared tokens to its own vocabulary (which
+is also where its stop words are dropped). Those shared-token models use the
+verified fast path from fast_path.py whether or not SENSEBOX_FAST_PATH is set;
+any model that cannot, such as a character n-gram language detector, goes
+through the ParallelPredictor as usual. The models then predict concurrently
+on a thread pool.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from fast_path import FastTfidfPipeline, enable_fast_path
+from inference import ParallelPredictor
+from metrics import METRICS
+from model_registry import LoadedModel, ModelRegistry
+
+
+MULTI_TASKS = ("spam", "language", "review")
+
+# Verified fast-path versions of the registry's models, keyed on the model file signature
+_shared_models = {}
+SHARED_MODELS = 16
+_shared_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(len(MULTI_TASKS), thread_name_prefix="sensebox-multitask")
+
+
+def available_tasks(registry: ModelRegistry, tasks: Sequence[str] = MULTI_TASKS) -> List[str]:
+    """The tasks whose model is present and loads"""
+    return [task for task in tasks if registry.is_available(task) and registry.get(task) is not None]
+
+
+def shared_model(loaded: LoadedModel) -> Optional[FastTfidfPipeline]:
+    """A fast-path version of a loaded model that can consume shared batch tokens, or None"""
+    with _shared_lock:
+        if loaded.signature in _shared_models:
+            return _shared_models[loaded.signature]
+    fast = enable_fast_path(loaded.model)
+    if not isinstance(fast, FastTfidfPipeline) or fast.tokenizer_key is None:
+        fast = None
+    with _shared_lock:
+        _shared_models[loaded.signature] = fast
+        # Keep the versions that may still be pinned by a running pass, not every version ever loaded
+        while len(_shared_models) > SHARED_MODELS:
+            del _shared_models[next(iter(_shared_models))]
+    return fast
+
+
+class MultiTaskPredictor:
+    """Predicts several tasks for the same texts, tokenizing once per compatible group of models.
+
+    With pin=True every call uses the model versions current when the predictor was created,
+    as a bulk run should; otherwise each call picks up the latest versions.
+    """
+
+    def __init__(self, registry: ModelRegistry, engine: ParallelPredictor, tasks: Sequence[str], pin: bool = False):
+        self.registry = registry
+        self.engine = engine
+        self.tasks = list(tasks)
+        self._pinned = {task: engine.snapshot(task) for task in self.tasks} if pin else None
+
+    @property
+    def versions(self) -> Dict[str, Optional[str]]:
+        """{task: model version} used by the next call"""
+        if self._pinned is not None:
+            return {task: loaded.version for task, loaded in self._pinned.items()}
+        return {task: self.registry.version(task) for task in self.tasks}
+
+    def predict_all(self, texts) -> Dict[str, np.ndarray]:
+        """{task: predictions} for every task, in self.tasks order"""
+        return self.predict_all_versioned(texts)[0]
+
+    def predict_all_versioned(self, texts):
+        """({task: predictions}, {task: version of the model that made them})"""
+        texts = texts if isinstance(texts, list) else list(texts)
+        snapshots = self._pinned or {task: self.engine.snapshot(task) for task in self.tasks}
+        groups = {}
+        futures = {}
+        for task in self.tasks:
+            loaded = snapshots[task]
+            fast = shared_model(loaded)
+            if fast is None:
+                futures[task] = _executor.submit(self.engine.predict, task, texts, loaded)
+            else:
+                METRICS.inc("rows", len(texts), model=task)
+                groups.setdefault(fast.tokenizer_key, []).append((task, fast))
+
+        for members in groups.values():
+            if len(members) == 1:
+                task, fast = members[0]
+                futures[task] = _executor.submit(fast.predict, texts)
+                continue
+            with METRICS.timer("tokenize", "+".join(task for task, _ in members)):
+                tokens = members[0][1].batch_tokens(texts)
+            for task, fast in members:
+                if tokens is None:
+                    futures[task] = _executor.submit(fast.predict, texts)
+                else:
+                    futures[task] = _executor.submit(fast.predict_tokens, tokens, len(texts))
+
+        predictions = {task: np.asarray(futures[task].result()) for task in self.tasks}
+        return predictions, {task: snapshots[task].version for task in self.tasks}
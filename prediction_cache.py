@@ -0,0 +1,102 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+DEFAULT_CACHE_SIZE = int(os.environ.get("SENSEBOX_CACHE_SIZE", 100_000))
+
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+_whitespace = re.compile(r"\s+")
+
+
+def _identity(text: str) -> str:
+    return text
+
+
+def text_normalizer(model) -> Callable[[str], str]:
+    """Build a normalizer that can only map texts together if the model would see them the same way.
+
+    Lower-casing and collapsing whitespace is only safe for a word analyzer with the default
+    token pattern; anything else (char n-grams, custom tokenizers) is cached on the raw text.
+    """
+    steps = getattr(model, "steps", None)
+    vectorizer = steps[0][1] if steps else model
+    if (getattr(vectorizer, "analyzer", None) != "word"
+            or getattr(vectorizer, "tokenizer", None) is not None
+            or getattr(vectorizer, "preprocessor", None) is not None
+            or getattr(vectorizer, "token_pattern", None) != DEFAULT_TOKEN_PATTERN):
+        return _identity
+    if getattr(vectorizer, "lowercase", False):
+        return lambda text: _whitespace.sub(" ", text).strip().lower()
+    return lambda text: _whitespace.sub(" ", text).strip()
+
+
+class PredictionCache:
+    """Bounded LRU cache of predictions keyed on a hash of the normalized text"""
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, normalize: Callable[[str], str] = _identity):
+        self.max_size = max_size
+        self.normalize = normalize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def key(self, text) -> Optional[bytes]:
+        """Hash of the normalized text, or None for values that should not be cached"""
+        if not isinstance(text, str):
+            return None
+        return hashlib.blake2b(self.normalize(text).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def sync(self, signature):
+        """Drop every entry if the model the cache was filled from has changed"""
+        with self._lock:
+            if signature != self._signature:
+                self._entries.clear()
+                self._signature = signature
+
+    def get_many(self, keys: Sequence[Optional[bytes]], signature=None) -> List:
+        """Look up each key, returning None for misses.
+
+        With signature, everything misses unless the cache holds predictions of that model.
+        """
+        found = []
+        with self._lock:
+            if signature is not None and signature != self._signature:
+                return [None] * len(keys)
+            for key in keys:
+                if key is not None and key in self._entries:
+                    self._entries.move_to_end(key)
+                    found.append(self._entries[key])
+                    self.hits += 1
+                else:
+                    found.append(None)
+                    self.misses += 1
+        return found
+
+    def put_many(self, items: Dict[bytes, object], signature=None):
+        """Store predictions; with signature, only if they came from the model the cache holds"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if signature is not None and signature != self._signature:
+                return
+            for key, value in items.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,236 @@
+"""Headless JSON inference service for the Sense Box models.
+
+Run with ``python server.py --port 8000``. Endpoints:
+
+    GET  /health                  liveness check
+    GET  /ready                   readiness check: 503 until warm-up has finished, or if a model
+                                  failed its sanity checks (see warmup.py)
+    GET  /models                  load status of every model, and the seconds each loaded one took to load
+    POST /predict/<model>         {"text": "..."}      -> one prediction
+    POST /predict/<model>/batch   {"texts": ["..."]}   -> one prediction per text
+
+    GET  /batching                micro-batching metrics
+    GET  /metrics                 stage timings and counters in the Prometheus text format
+                                  (recorded when SENSEBOX_METRICS=1)
+
+Concurrent single-text requests for the same model are micro-batched into one
+vectorized predict call by a MicroBatchScheduler.
+
+With --warmup (or SENSEBOX_WARMUP=1) every model is loaded and run on a
+built-in sample at start-up. The port opens straight away so liveness checks
+pass, while /ready keeps the load balancer away until the models are warm.
+
+New model versions dropped into models/<name>/<version>/ are loaded, warmed
+up and swapped in without a restart (see model_registry.py); every prediction
+response names the version that made it.
+"""
+import argparse
+import asyncio
+import json
+import os
+from http import HTTPStatus
+from typing import Optional
+
+from batching import DEFAULT_MAX_BATCH, DEFAULT_WINDOW_MS, MicroBatchScheduler
+from bulk import TASKS
+from inference import ParallelPredictor
+from metrics import METRICS
+from model_registry import RELOAD_SECONDS, ModelRegistry
+from warmup import WARMUP, Readiness, warm_up
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+def to_json_value(value):
+    """Convert numpy scalars to plain Python values"""
+    return value.item() if hasattr(value, "item") else value
+
+
+def label_for(name: str, prediction):
+    labels = TASKS.get(name, {}).get("labels")
+    if labels is None:
+        return prediction
+    return labels.get(prediction, prediction)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str, details: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+class InferenceServer:
+    def __init__(self, registry: ModelRegistry, engine: ParallelPredictor, scheduler: MicroBatchScheduler,
+                 readiness: Optional[Readiness] = None):
+        self.registry = registry
+        self.engine = engine
+        self.scheduler = scheduler
+        self.readiness = readiness or Readiness(registry)
+
+    def _check_model(self, name: str):
+        if name not in self.registry.files:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown model: {name}")
+        if not self.registry.is_available(name):
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, self.registry.error(name) or "Model unavailable")
+
+    async def _load(self, name: str):
+        """Load the model off the event loop so the first request does not block others"""
+        model = await asyncio.get_running_loop().run_in_executor(None, self.registry.get, name)
+        if model is None:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, self.registry.error(name) or "Model unavailable")
+
+    async def handle(self, method: str, path: str, body: bytes):
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if method == "GET" and parts == ["health"]:
+            return {"status": "ok"}
+        if method == "GET" and parts == ["ready"]:
+            report = self.readiness.report()
+            if not report["ready"]:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Not ready", report)
+            return report
+        if method == "GET" and parts == ["models"]:
+            return {"models": self.registry.status(), "load_seconds": self.registry.load_times()}
+        if method == "GET" and parts == ["batching"]:
+            return self.scheduler.metrics()
+        if method == "GET" and parts == ["metrics"]:
+            return METRICS.render_prometheus()
+        if parts[:1] != ["predict"] or len(parts) not in (2, 3) or (len(parts) == 3 and parts[2] != "batch"):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {path}")
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST for predictions")
+
+        name = parts[1]
+        self._check_model(name)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        await self._load(name)
+
+        if len(parts) == 2:
+            text = payload.get("text") if isinstance(payload, dict) else None
+            if not isinstance(text, str):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected {"text": "..."}')
+            prediction, version = await asyncio.wrap_future(self.scheduler.submit(name, text))
+            prediction = to_json_value(prediction)
+            return {"model": name, "version": version, "prediction": prediction, "label": label_for(name, prediction)}
+
+        texts = payload.get("texts") if isinstance(payload, dict) else None
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected {"texts": ["...", ...]}')
+        predictions, version = await asyncio.get_running_loop().run_in_executor(
+            None, self.engine.predict_versioned, name, texts)
+        predictions = [to_json_value(prediction) for prediction in predictions]
+        return {
+            "model": name,
+            "version": version,
+            "predictions": predictions,
+            "labels": [label_for(name, prediction) for prediction in predictions],
+        }
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, result = HTTPStatus.OK, await self.handle(method, path, body)
+                except HTTPError as e:
+                    status, result = e.status, dict(e.details or {}, error=e.message)
+                except Exception as e:
+                    status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, payload, keep_alive: bool):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host: str, port: int, server: InferenceServer, ready: Optional[asyncio.Event] = None):
+    listener = await asyncio.start_server(server.serve_connection, host, port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+    print(f"Sense Box inference server listening on {addresses}")
+    if ready is not None:
+        ready.set()
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Sense Box models over HTTP/JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--batch-window-ms", type=float, default=DEFAULT_WINDOW_MS,
+                        help="How long to wait for more single-text requests before predicting")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size for large batch requests")
+    parser.add_argument("--reload-seconds", type=float, default=RELOAD_SECONDS,
+                        help="How often to look for new model versions to hot-swap in; 0 disables")
+    parser.add_argument("--warmup", action="store_true", default=WARMUP,
+                        help="Load and sanity-check every model before /ready reports ready")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_dir)
+    engine = ParallelPredictor(registry, workers=args.workers)
+    scheduler = MicroBatchScheduler(engine.predict_tagged, args.batch_window_ms, args.max_batch)
+    readiness = Readiness(registry)
+    if args.warmup:
+        readiness.start()
+    registry.watch(args.reload_seconds, warm_up)
+    server = InferenceServer(registry, engine, scheduler, readiness)
+    try:
+        asyncio.run(serve(args.host, args.port, server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""Real-time classification of a message feed.
+
+    python streaming.py --jsonl feed.jsonl --output results.jsonl    # follow a growing JSONL file
+    python streaming.py --listen 9009 --output -                     # newline-delimited messages on a socket
+
+Each message is a JSON object with a text field (see --text-key), a JSON
+string, or a plain line of text. A StreamPipeline moves messages through two
+bounded asyncio queues: source -> inbox -> classifier -> outbox -> sink. When
+a queue is full the stage feeding it waits, so a slow model slows down the
+file tail or stops reading from the socket instead of buffering without
+limit. The classifier takes whatever has queued up, up to max_batch
+messages, and waits for more for about as long as its last predict call took
+(never more than max_wait_ms), so batches grow under load and stay small,
+with low latency, when the feed is quiet.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bulk import TASKS
+
+
+DEFAULT_QUEUE_SIZE = int(os.environ.get("SENSEBOX_STREAM_QUEUE", 1_000))
+DEFAULT_MAX_BATCH = int(os.environ.get("SENSEBOX_STREAM_MAX_BATCH", 256))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("SENSEBOX_STREAM_MAX_WAIT_MS", 50))
+
+# Seconds of per-second history kept for the rolling charts
+HISTORY_SECONDS = 300
+LATENCY_SAMPLES = 1_000
+
+# The only directory the app's Live stream tab may follow feeds in and append results to.
+# Unset, the tab is off: every visitor could otherwise read and write server files through it.
+STREAM_DIR = os.environ.get("SENSEBOX_STREAM_DIR") or None
+
+POLL_SECONDS = 0.2
+# Bytes tail_jsonl reads from the file at a time
+READ_BYTES = 1 << 20
+
+_DONE = object()
+
+
+def stream_path(name: str, base_dir: str) -> str:
+    """name as a path inside base_dir; ValueError for anything that resolves outside it, symlinks included"""
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, name))
+    if path == base or os.path.commonpath([base, path]) != base:
+        raise ValueError(f"{name} is not a file in {base_dir}")
+    return path
+
+
+def parse_message(line: str, text_key: str) -> Optional[dict]:
+    """The message on one line of the feed as a dict with a "text" entry, or None if it has no text"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        value = json.loads(line)
+    except ValueError:
+        value = line
+    if isinstance(value, dict):
+        text = value.get(text_key)
+        return dict(value, text=text) if isinstance(text, str) else None
+    if isinstance(value, str):
+        return {"text": value}
+    return None
+
+
+class RollingStats:
+    """Per-second message and label counts for the last HISTORY_SECONDS, plus running totals"""
+
+    def __init__(self, history: int = HISTORY_SECONDS):
+        self._lock = threading.Lock()
+        self._seconds = deque(maxlen=history)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.received = 0
+        self.skipped = 0
+        self.classified = 0
+        self.batches = 0
+        self.queue_depth = 0
+
+    def _bucket(self, now: float) -> dict:
+        second = int(now)
+        if not self._seconds or self._seconds[-1]["second"] != second:
+            self._seconds.append({"second": second, "messages": 0, "labels": Counter()})
+        return self._seconds[-1]
+
+    def record_received(self, skipped: bool = False):
+        with self._lock:
+            self.received += 1
+            self.skipped += skipped
+
+    def record_batch(self, labels: Counter, latencies: List[float], queue_depth: int):
+        with self._lock:
+            bucket = self._bucket(time.time())
+            bucket["messages"] += len(latencies)
+            bucket["labels"].update(labels)
+            self._latencies.extend(latencies)
+            self.classified += len(latencies)
+            self.batches += 1
+            self.queue_depth = queue_depth
+
+    def history(self) -> List[Dict[str, object]]:
+        """One row per second that saw messages: {"second", "messages", "<label>": count, ...}"""
+        with self._lock:
+            return [dict(bucket["labels"], second=bucket["second"], messages=bucket["messages"])
+                    for bucket in self._seconds]
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            recent = [bucket["messages"] for bucket in self._seconds if bucket["second"] >= time.time() - 10]
+            return {
+                "received": self.received,
+                "skipped": self.skipped,
+                "classified": self.classified,
+                "batches": self.batches,
+                "mean_batch_size": self.classified / self.batches if self.batches else 0.0,
+                "queue_depth": self.queue_depth,
+                "messages_per_second": sum(recent) / 10,
+                "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+                "latency_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+                if latencies else 0.0,
+            }
+
+
+class JsonlSink:
+    """Appends results to a JSONL file, or writes them to stdout for path "-" """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+
+    def __call__(self, results: List[dict]):
+        self._file.write("".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+async def tail_jsonl(path: str, inbox: asyncio.Queue, stop: asyncio.Event, stats: RollingStats, text_key: str,
+                     from_start: bool = False, follow: bool = True):
+    """Put every new line of path into inbox, following the file as it grows, is truncated or replaced"""
+    position = None
+    identity = None
+    pending = b""
+    while not stop.is_set():
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            status = None
+        if status is not None:
+            if (status.st_dev, status.st_ino) != identity or (position is not None and status.st_size < position):
+                # New, rotated or truncated file: start reading it from the top, unless this is the first
+                # look at a file that already existed and only new lines were asked for
+                first_open = identity is None
+                identity = (status.st_dev, status.st_ino)
+                position = status.st_size if first_open and not from_start else 0
+                pending = b""
+            if status.st_size > position:
+                with open(path, "rb") as f:
+                    f.seek(position)
+                    data = f.read(READ_BYTES)
+                position += len(data)
+                # Split before decoding, so a character cut in two by the read stays whole in pending
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    message = parse_message(line.decode("utf-8", errors="replace"), text_key)
+                    stats.record_received(skipped=message is None)
+                    if message is not None:
+                        await inbox.put((message, time.perf_counter()))
+                continue
+        if not follow:
+            if pending:
+                message = parse_message(pending.decode("utf-8", errors="replace"), text_key)
+                stats.record_received(skipped=message is None)
+                if message is not None:
+                    await inbox.put((message, time.perf_counter()))
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def listen_socket(host: str, port: int, inbox: asyncio.Queue, stop: asyncio.Event, stats: RollingStats,
+                        text_key: str, ready: Optional[Callable[[], None]] = None):
+    """Accept newline-delimited messages from any number of local connections until stop is set"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while not stop.is_set():
+                line = await reader.readline()
+                if not line:
+                    break
+                message = parse_message(line.decode("utf-8", errors="replace"), text_key)
+                stats.record_received(skipped=message is None)
+                if message is not None:
+                    # Blocks while the inbox is full, so the client's sends back up in TCP
+                    await inbox.put((message, time.perf_counter()))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port, limit=1 << 20)
+    if ready is not None:
+        ready()
+    async with server:
+        await stop.wait()
+
+
+class StreamPipeline:
+    """Classifies messages from a source coroutine and hands the results to a sink, in batches.
+
+    predict_all(texts) returns ({task: predictions}, {task: model version}), as
+    MultiTaskPredictor.predict_all_versioned does; each result records the versions.
+    """
+
+    def __init__(self, predict_all: Callable[[List[str]], Tuple[Dict[str, object], Dict[str, str]]],
+                 sink: Callable[[List[dict]], None], max_queue: int = DEFAULT_QUEUE_SIZE,
+                 max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.predict_all = predict_all
+        self.sink = sink
+        self.max_queue = max(1, max_queue)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.stats = RollingStats()
+        self._wait = 0.0
+
+    async def run(self, source, stop: asyncio.Event):
+        """Run until source returns (and everything it produced is written) or stop is set.
+
+        source(inbox, stop, stats) is a coroutine function that puts (message, received_at) pairs into inbox.
+        If any stage fails, the others are cancelled and its error is raised.
+        """
+        inbox = asyncio.Queue(self.max_queue)
+        outbox = asyncio.Queue(self.max_queue)
+        stages = [asyncio.create_task(self._read(source, inbox, stop)),
+                  asyncio.create_task(self._classify(inbox, outbox)),
+                  asyncio.create_task(self._write(outbox))]
+        pending = set(stages)
+        try:
+            # Each stage finishes after the one feeding it, so one that finishes early has failed
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for stage in done:
+                    stage.result()
+        finally:
+            # A failed stage no longer drains its queue, so the stages before it would wait forever
+            for stage in pending:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+
+    async def _read(self, source, inbox: asyncio.Queue, stop: asyncio.Event):
+        await source(inbox, stop, self.stats)
+        await inbox.put(_DONE)
+
+    async def _classify(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        latency = 0.0
+        done = False
+        while not done:
+            item = await inbox.get()
+            if item is _DONE:
+                break
+            batch = [item]
+            deadline = loop.time() + self._wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = inbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    # Not wait_for, which can swallow the cancellation of a failed pipeline
+                    getter = asyncio.ensure_future(inbox.get())
+                    try:
+                        await asyncio.wait([getter], timeout=timeout)
+                    finally:
+                        # True while it is still waiting, and then it takes nothing from the inbox
+                        timed_out = getter.cancel()
+                    if timed_out:
+                        break
+                    item = getter.result()
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            start = time.perf_counter()
+            try:
+                predictions, versions = await loop.run_in_executor(None, self.predict_all,
+                                                                   [message["text"] for message, _ in batch])
+            except Exception as e:
+                raise RuntimeError(f"Classifying a batch of {len(batch)} messages failed: {e}") from e
+            finished = time.perf_counter()
+            # Waiting for more messages is only worth it while a predict call costs about as much as the wait
+            latency = 0.8 * latency + 0.2 * (finished - start)
+            self._wait = min(self.max_wait, latency)
+
+            labels = Counter()
+            results = []
+            for i, (message, received) in enumerate(batch):
+                result = dict(message)
+                for task, values in predictions.items():
+                    spec = TASKS[task]
+                    value = values[i].item() if hasattr(values[i], "item") else values[i]
+                    label = spec["labels"].get(value, value) if spec["labels"] is not None else value
+                    result[spec["output"]] = label
+                    labels[f"{spec['output']}: {label}"] += 1
+                result["model_versions"] = versions
+                result["latency_ms"] = round((finished - received) * 1000, 3)
+                results.append(result)
+            self.stats.record_batch(labels, [finished - received for _, received in batch], inbox.qsize())
+            await outbox.put(results)
+        await outbox.put(_DONE)
+
+    async def _write(self, outbox: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            results = await outbox.get()
+            if results is _DONE:
+                return
+            await loop.run_in_executor(None, self.sink, results)
+
+
+class StreamRunner:
+    """Runs one StreamPipeline at a time on a background thread with its own event loop"""
+
+    def __init__(self):
+        self.pipeline = None
+        self.description = None
+        self.error = None
+        self._thread = None
+        self._loop = None
+        self._stop = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, pipeline: StreamPipeline, source, description: str, on_exit: Optional[Callable[[], None]] = None):
+        if self.running:
+            raise RuntimeError("A stream is already running")
+        self.pipeline = pipeline
+        self.description = description
+        self.error = None
+        started = threading.Event()
+
+        def run():
+            async def main():
+                self._loop = asyncio.get_running_loop()
+                self._stop = asyncio.Event()
+                started.set()
+                await pipeline.run(source, self._stop)
+
+            try:
+                asyncio.run(main())
+            except Exception as e:
+                self.error = str(e)
+            finally:
+                started.set()
+                if on_exit is not None:
+                    on_exit()
+
+        self._thread = threading.Thread(target=run, name="sensebox-stream", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self, timeout: Optional[float] = 10):
+        if self.running and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join(timeout)
+
+
+def main():
+    from inference import ParallelPredictor
+    from model_registry import ModelRegistry
+    from multitask import MultiTaskPredictor, available_tasks
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Classify a live message feed")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", help="JSONL (or plain text) file to follow")
+    source.add_argument("--listen", type=int, metavar="PORT", help="Accept messages on 127.0.0.1:PORT")
+    parser.add_argument("--from-start", action="store_true", help="Classify lines already in the file first")
+    parser.add_argument("--no-follow", action="store_true", help="Stop at the end of the file")
+    parser.add_argument("--text-key", default="text")
+    parser.add_argument("--output", default="-", help="JSONL file to append results to, or - for stdout")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "models"))
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_dir)
+    engine = ParallelPredictor(registry, workers=1)
+    tasks = available_tasks(registry)
+    if not tasks:
+        raise SystemExit("No models available")
+    sink = JsonlSink(args.output)
+    pipeline = StreamPipeline(MultiTaskPredictor(registry, engine, tasks).predict_all_versioned, sink,
+                              args.max_queue, args.max_batch, args.max_wait_ms)
+
+    async def run():
+        stop = asyncio.Event()
+        if args.jsonl:
+            async def source(inbox, stop, stats):
+                await tail_jsonl(args.jsonl, inbox, stop, stats, args.text_key, args.from_start, not args.no_follow)
+        else:
+            async def source(inbox, stop, stats):
+                await listen_socket("127.0.0.1", args.listen, inbox, stop, stats, args.text_key,
+                                    lambda: print(f"Listening on 127.0.0.1:{args.listen}", file=sys.stderr))
+        await pipeline.run(source, stop)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        engine.shutdown()
+        print(json.dumps(pipeline.stats.summary()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+
+class Upload(io.BytesIO):
+    """Stands in for a Streamlit UploadedFile"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+        self.file_id = name
+
+
+class SpamStub:
+    """Predicts spam (0) for every text containing "win", like a spam model's predict"""
+
+    version = "stub@1"
+
+    def predict(self, texts):
+        return np.array([0 if "win" in text.lower() else 1 for text in texts])
+
+
+@pytest.fixture
+def make_upload():
+    return Upload
+
+
+@pytest.fixture
+def spam_model():
+    return SpamStub()
+
+
+def csv_bytes(rows: int, column: str = "Msg", start: int = 0) -> bytes:
+    lines = [column] + [f"win a prize {i}" if i % 3 == 0 else f"see you at {i}" for i in range(start, start + rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def truncated_gzip(data: bytes, keep: float = 0.5) -> bytes:
+    compressed = gzip.compress(data)
+    return compressed[:int(len(compressed) * keep)]
+
+
+def read_all(upload, text_columns=None, chunk_size=1_000):
+    """Every row of an upload as one DataFrame"""
+    import pandas as pd
+
+    from ingest import iter_upload_chunks
+
+    return pd.concat(list(iter_upload_chunks(upload, chunk_size, text_columns)), ignore_index=True)
+
+
+SPAM_WORDS = ("win", "free", "prize", "cash", "claim", "urgent", "offer", "winner")
+HAM_WORDS = ("lunch", "meeting", "tomorrow", "thanks", "see", "home", "call", "later")
+
+
+def training_corpus(rows: int = 400, seed: int = 0):
+    """(texts, labels) with label 0 for spam-like and 1 for ordinary messages"""
+    rng = np.random.default_rng(seed)
+    texts, labels = [], []
+    for i in range(rows):
+        spam = i % 2 == 0
+        words = list(rng.choice(SPAM_WORDS if spam else HAM_WORDS, 4)) + list(rng.choice(HAM_WORDS + SPAM_WORDS, 2))
+        texts.append(" ".join(words))
+        labels.append(0 if spam else 1)
+    return texts, np.array(labels)
+
+
+def fit_pipeline(classifier=None, labels=None, **vectorizer_options):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+
+    texts, spam_labels = training_corpus()
+    pipeline = Pipeline([("tfidf", TfidfVectorizer(**vectorizer_options)), ("classifier", classifier or MultinomialNB())])
+    return pipeline.fit(texts, spam_labels if labels is None else labels)
+
+
+# Empty, accented, mixed-case, non-Latin and multi-line texts around the training vocabulary
+EDGE_TEXTS = training_corpus(200, seed=1)[0] + [
+    "",
+    "   ",
+    "WIN a FREE prize!!! call now",
+    "Café naïve résumé: win-win",
+    "free_cash claim_now",
+    "ÆØÅ winner ǅ ﬁnal",
+    "line one\nline two\tfree",
+    "١٢٣ numbers 42 free",
+    "emoji 🎉 prize 🎉",
+]
+
+
+def pipeline_variants():
+    """Pipelines fitted with the vectorizer options and classifiers the exported formats must reproduce"""
+    from sklearn.linear_model import LogisticRegression
+
+    labels = np.array(["ham", "spam", "other"] * 134)[:400]
+    return {
+        "default": fit_pipeline(),
+        "strip_accents": fit_pipeline(strip_accents="unicode"),
+        "strip_accents_ascii": fit_pipeline(strip_accents="ascii", lowercase=False),
+        "stop_words": fit_pipeline(stop_words=["see", "call"]),
+        "sublinear_binary_l1": fit_pipeline(sublinear_tf=True, binary=True, norm="l1"),
+        "no_idf": fit_pipeline(use_idf=False),
+        "bigrams": fit_pipeline(ngram_range=(1, 2)),
+        "logistic": fit_pipeline(LogisticRegression(max_iter=200)),
+        "multiclass": fit_pipeline(labels=labels),
+    }
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """A model directory holding a spam pipeline as spam_classifier.pkl"""
+    import joblib
+
+    joblib.dump(fit_pipeline(), tmp_path / "spam_classifier.pkl")
+    return tmp_path
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from cascade import DEFAULT_THRESHOLDS, FEATURE_SHARE, CascadePredictor, FirstStage
+from inference import ParallelPredictor
+from model_registry import ModelRegistry
+from tests.conftest import fit_pipeline, training_corpus
+
+
+def test_first_stage_is_pruned_by_default():
+    pipeline = fit_pipeline()
+    n_features = len(pipeline[0].vocabulary_)
+    assert FirstStage(pipeline).features == max(1, int(n_features * FEATURE_SHARE)) < n_features
+    assert FirstStage(pipeline, features=0).features == n_features
+    assert FirstStage(pipeline, features=3).features == 3
+
+
+def test_confident_rows_agree_with_the_full_model():
+    pipeline = fit_pipeline()
+    texts = training_corpus(300, seed=5)[0] + ["", "Win a FREE prize!", "see you at lunch, thanks"]
+    predictions, confident = FirstStage(pipeline, features=0).decide(texts, 0.9)
+    assert confident.any()
+    np.testing.assert_array_equal(predictions[confident], pipeline.predict(texts)[confident])
+
+
+def test_multiclass_models_are_refused():
+    with pytest.raises(ValueError):
+        FirstStage(fit_pipeline(labels=np.array(["a", "b", "c", "d"] * 100)))
+
+
+def test_each_task_has_its_own_default_threshold(model_dir, monkeypatch):
+    engine = ParallelPredictor(ModelRegistry(str(model_dir)), workers=1)
+    try:
+        assert CascadePredictor(engine, "spam").threshold == DEFAULT_THRESHOLDS["spam"]
+        assert CascadePredictor(engine, "spam", 0.99).threshold == 0.99
+        monkeypatch.setenv("SENSEBOX_CASCADE_THRESHOLD", "0.9")
+        assert CascadePredictor(engine, "spam").threshold == 0.9
+    finally:
+        engine.shutdown()
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from bulk import SOURCE_COLUMN, classify_files
+from tests.conftest import csv_bytes, truncated_gzip
+
+
+def test_rows_keep_their_file_and_order(make_upload, spam_model, tmp_path):
+    files = [make_upload("a.csv", csv_bytes(2_500)), make_upload("b.csv", csv_bytes(1_500, start=10_000))]
+    result = classify_files(files, spam_model, "spam", chunk_size=500, output_path=str(tmp_path / "out.csv"),
+                            workers=2)
+    assert result.rows == 4_000
+    assert result.warning is None
+    rows = result.read_rows(0, result.rows)
+    for name, count, start in (("a.csv", 2_500, 0), ("b.csv", 1_500, 10_000)):
+        texts = rows.loc[rows[SOURCE_COLUMN] == name, "Msg"].tolist()
+        assert texts == [f"win a prize {i}" if i % 3 == 0 else f"see you at {i}" for i in range(start, start + count)]
+    assert result.counts == {"Not Spam": rows["Prediction"].eq("Not Spam").sum(),
+                             "Spam": rows["Prediction"].eq("Spam").sum()}
+
+
+def test_file_that_fails_partway_is_reported_with_its_rows(make_upload, spam_model, tmp_path):
+    files = [make_upload("good.csv", csv_bytes(3_000)), make_upload("bad.csv.gz", truncated_gzip(csv_bytes(90_000)))]
+    progress = []
+    result = classify_files(files, spam_model, "spam", chunk_size=1_000, output_path=str(tmp_path / "out.csv"),
+                            on_progress=lambda entries, seconds: progress.append(entries))
+    rows = result.read_rows(0, result.rows)
+    bad_rows = int((rows[SOURCE_COLUMN] == "bad.csv.gz").sum())
+    assert 0 < bad_rows < 90_000
+    assert result.rows == 3_000 + bad_rows
+    assert sum(result.counts.values()) == result.rows
+    assert "Skipped" not in result.warning
+    assert f"bad.csv.gz ({bad_rows:,} rows, then" in result.warning
+    assert progress[-1][1]["status"].startswith("failed")
+
+
+def test_unreadable_file_is_skipped(make_upload, spam_model, tmp_path):
+    files = [make_upload("good.csv", csv_bytes(100)), make_upload("bad.csv.gz", b"\x1f\x8b\x08\x00broken")]
+    result = classify_files(files, spam_model, "spam", output_path=str(tmp_path / "out.csv"))
+    assert result.rows == 100
+    assert result.warning.startswith("Skipped files that could not be read: bad.csv.gz (")
+
+
+def test_rows_are_kept_when_every_file_fails_partway(make_upload, spam_model, tmp_path):
+    files = [make_upload(name, truncated_gzip(csv_bytes(90_000))) for name in ("a.csv.gz", "b.csv.gz")]
+    result = classify_files(files, spam_model, "spam", chunk_size=1_000, output_path=str(tmp_path / "out.csv"))
+    rows = result.read_rows(0, result.rows)
+    counts = rows[SOURCE_COLUMN].value_counts()
+    assert result.rows > 0
+    for name in ("a.csv.gz", "b.csv.gz"):
+        assert f"{name} ({counts[name]:,} rows, then" in result.warning
+
+
+def test_no_rows_read_raises_naming_every_file(make_upload, spam_model, tmp_path):
+    output = tmp_path / "out.csv"
+    files = [make_upload(name, b"\x1f\x8b\x08\x00broken") for name in ("a.csv.gz", "b.csv.gz")]
+    with pytest.raises(ValueError, match=r"No rows could be read from a\.csv\.gz \(.+\), b\.csv\.gz \("):
+        classify_files(files, spam_model, "spam", output_path=str(output))
+    assert not os.path.exists(output)
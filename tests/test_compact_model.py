@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from compact_model import CompactPipeline, export_compact
+from tests.conftest import EDGE_TEXTS, pipeline_variants
+
+PIPELINES = pipeline_variants()
+
+
+@pytest.mark.parametrize("name", PIPELINES)
+def test_compact_export_matches_sklearn(name, tmp_path):
+    pipeline = PIPELINES[name]
+    compact = CompactPipeline.load(export_compact(pipeline, str(tmp_path / name)))
+    np.testing.assert_array_equal(compact.predict(EDGE_TEXTS), pipeline.predict(EDGE_TEXTS))
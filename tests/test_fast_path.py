@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmark import synthetic_corpus
+from compact_model import CompactPipeline, export_compact
+from fast_path import SEPARATOR, FastTfidfPipeline, verify
+from model_registry import MODEL_FILES
+from tests.conftest import EDGE_TEXTS, fit_pipeline, pipeline_variants
+
+TEXTS = EDGE_TEXTS + [f"a separator {SEPARATOR} inside a text"]
+PIPELINES = pipeline_variants()
+
+
+@pytest.mark.parametrize("name", PIPELINES)
+def test_fast_path_matches_sklearn(name):
+    pipeline = PIPELINES[name]
+    fast = FastTfidfPipeline.from_pipeline(pipeline)
+    np.testing.assert_array_equal(fast.predict(TEXTS), pipeline.predict(TEXTS))
+    np.testing.assert_allclose(fast.transform(TEXTS).toarray(), pipeline[0].transform(TEXTS).toarray(), atol=1e-12)
+
+
+def test_fast_path_runs_a_compact_model(tmp_path):
+    pipeline = PIPELINES["default"]
+    compact = CompactPipeline.load(export_compact(pipeline, str(tmp_path / "default")))
+    assert FastTfidfPipeline.from_model(compact).predict(TEXTS).tolist() == pipeline.predict(TEXTS).tolist()
+
+
+def test_unsupported_pipelines_are_refused():
+    with pytest.raises(ValueError):
+        FastTfidfPipeline.from_pipeline(fit_pipeline(analyzer="char"))
+
+
+# The shipped pickles come from an older scikit-learn
+@pytest.mark.filterwarnings("ignore::UserWarning")
+@pytest.mark.parametrize("name", ["spam", "review", "news"])
+def test_fast_path_matches_the_shipped_models(name):
+    import joblib
+
+    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models", MODEL_FILES[name])
+    if not os.path.exists(path):
+        pytest.skip(f"{MODEL_FILES[name]} is not in models/")
+    pipeline = joblib.load(path)
+    texts = synthetic_corpus("reviews" if name == "review" else "messages", 2_000, 0) + TEXTS
+    assert verify(FastTfidfPipeline.from_pipeline(pipeline), pipeline, texts)["mismatches"] == 0
@@ -0,0 +1,105 @@
+import codecs
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from ingest import SAMPLE_BYTES, iter_upload_chunks, sniff_upload
+from tests.conftest import Upload, csv_bytes, read_all
+
+ROWS = ["Café crème, très bon", "naïve résumé", "plain text", "déjà vu", "über cool"]
+
+
+def table(delimiter: str = ",", rows=ROWS) -> str:
+    body = [f"Id{delimiter}Msg{delimiter}Score"]
+    body += [f'{i}{delimiter}"{text}"{delimiter}{i / 10}' for i, text in enumerate(rows)]
+    return "\n".join(body) + "\n"
+
+
+@pytest.mark.parametrize("encoding, expected", [
+    ("utf-8", "utf-8"),
+    ("utf-8-sig", "utf-8-sig"),
+    ("utf-16", "utf-16"),
+    ("cp1252", "cp1252"),
+])
+def test_encoding_is_detected(encoding, expected):
+    upload = Upload("reviews.csv", table().encode(encoding))
+    fmt = sniff_upload(upload)
+    assert fmt.encoding == expected
+    assert fmt.columns == ["Id", "Msg", "Score"]
+    assert read_all(upload, ["msg"])["Msg"].tolist() == ROWS
+
+
+def test_multibyte_character_cut_by_the_sample_is_still_utf8():
+    text = "x" * (SAMPLE_BYTES - 1) + "é" + "\nmore\n"
+    assert sniff_upload(Upload("notes.txt", text.encode("utf-8"))).encoding == "utf-8"
+
+
+@pytest.mark.parametrize("delimiter", [",", ";", "\t", "|"])
+def test_delimiter_is_detected(delimiter):
+    upload = Upload("data.csv", table(delimiter).encode())
+    fmt = sniff_upload(upload)
+    assert fmt.delimiter == delimiter
+    frame = read_all(upload)
+    assert list(frame.columns) == ["Id", "Msg", "Score"]
+    assert frame["Msg"].tolist() == ROWS
+
+
+def test_only_the_text_column_is_read_and_source_columns_are_kept():
+    chunks = list(iter_upload_chunks(Upload("data.csv", table().encode()), 2, ["Message", "MSG"]))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert list(chunks[0].columns) == ["Msg"]
+    assert chunks[0].attrs["source_columns"] == ["Id", "Msg", "Score"]
+
+
+def test_quoted_fields_may_span_lines():
+    data = 'Msg,Label\n"first line\nsecond line",1\n"say ""hi""",0\n'
+    assert read_all(Upload("data.csv", data.encode()))["Msg"].tolist() == ["first line\nsecond line", 'say "hi"']
+
+
+def test_txt_upload_is_one_message_per_line():
+    data = "first\r\nsecond, with a comma\n\nlast"
+    frame = read_all(Upload("messages.txt", data.encode()))
+    assert frame["text"].tolist() == ["first", "second, with a comma", "", "last"]
+
+
+def test_gzip_upload():
+    upload = Upload("messages.csv.gz", gzip.compress(csv_bytes(2_500)))
+    fmt = sniff_upload(upload)
+    assert (fmt.compression, fmt.name, fmt.kind) == ("gzip", "messages.csv", "csv")
+    assert len(read_all(upload)) == 2_500
+
+
+def test_zip_upload_with_one_table():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("__MACOSX/._messages.csv", b"junk")
+        archive.writestr("messages.csv", csv_bytes(1_200))
+    upload = Upload("upload.zip", buffer.getvalue())
+    assert sniff_upload(upload).compression == "zip"
+    assert len(read_all(upload)) == 1_200
+
+
+def test_bom_is_not_part_of_the_first_column():
+    upload = Upload("data.csv", codecs.BOM_UTF8 + b"Msg,Label\nhello,1\n")
+    assert sniff_upload(upload).columns == ["Msg", "Label"]
+
+
+@pytest.mark.parametrize("data, columns", [
+    ("hello there my friend\nwin a prize right now\n", ["Column 1"]),
+    ("0,hello there\n1,win a prize\n", ["Column 1", "Column 2"]),
+])
+def test_headerless_csv_keeps_its_first_row(data, columns):
+    upload = Upload("data.csv", data.encode())
+    fmt = sniff_upload(upload)
+    assert (fmt.header, fmt.columns) == (False, columns)
+    frame = read_all(upload)
+    assert list(frame.columns) == columns
+    assert len(frame) == 2
+
+
+def test_short_column_names_are_a_header():
+    upload = Upload("spam.csv", b"v1,v2\nham,Go until jurong point, crazy\nspam,Free entry in 2 a wkly comp\n")
+    fmt = sniff_upload(upload)
+    assert (fmt.header, fmt.columns) == (True, ["v1", "v2"])
@@ -0,0 +1,103 @@
+import sqlite3
+import time
+
+import pytest
+
+import jobs
+from inference import ParallelPredictor
+from jobs import DONE, FAILED, JobManager
+from model_registry import ModelRegistry
+from tests.conftest import csv_bytes
+
+ROWS = 25_000
+
+
+def wait_for(manager: JobManager, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] not in jobs.ACTIVE:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job still {job['status']} after {timeout}s")
+
+
+@pytest.fixture
+def engine(model_dir):
+    # One worker and batches of 1 row, so jobs read CHUNK_SIZE rows at a time in this process
+    return ParallelPredictor(ModelRegistry(str(model_dir)), workers=1, batch_size=1)
+
+
+@pytest.fixture
+def manager(engine, tmp_path):
+    manager = JobManager(engine, str(tmp_path / "jobs"), workers=1)
+    yield manager
+    manager.shutdown(wait=True)
+
+
+def expected_texts():
+    return csv_bytes(ROWS).decode().split("\n")[1:-1]
+
+
+def fail_after(monkeypatch, calls: int):
+    """Make the job's label_chunk raise once it has labelled calls chunks"""
+    real = jobs.label_chunk
+    seen = []
+
+    def label_chunk(*args, **kwargs):
+        if len(seen) == calls:
+            raise RuntimeError("worker lost")
+        seen.append(True)
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(jobs, "label_chunk", label_chunk)
+
+
+def test_job_runs_to_completion(manager, make_upload):
+    job = wait_for(manager, manager.submit(make_upload("messages.csv", csv_bytes(ROWS)), "spam"))
+    assert job["status"] == DONE
+    result = manager.result(job["id"])
+    assert result.rows == ROWS
+    assert result.read_rows(0, ROWS)["Msg"].tolist() == expected_texts()
+
+
+def test_failed_job_resumes_from_its_checkpoint(manager, make_upload, monkeypatch):
+    fail_after(monkeypatch, 1)
+    job_id = manager.submit(make_upload("messages.csv", csv_bytes(ROWS)), "spam")
+    job = wait_for(manager, job_id)
+    assert job["status"] == FAILED
+    assert "worker lost" in job["error"]
+    partial = manager.result(job_id, partial=True)
+    assert partial.rows == jobs.CHUNK_SIZE
+    assert manager.result(job_id) is None
+
+    monkeypatch.undo()
+    assert manager.resume(job_id)
+    assert wait_for(manager, job_id)["status"] == DONE
+    result = manager.result(job_id)
+    assert result.rows == ROWS
+    assert result.read_rows(0, ROWS)["Msg"].tolist() == expected_texts()
+    assert sum(result.counts.values()) == ROWS
+
+
+def test_interrupted_job_continues_in_a_new_process(engine, manager, make_upload, monkeypatch, tmp_path):
+    fail_after(monkeypatch, 2)
+    job_id = manager.submit(make_upload("messages.csv", csv_bytes(ROWS)), "spam")
+    job = wait_for(manager, job_id)
+    monkeypatch.undo()
+    manager.shutdown(wait=True)
+    # As if the process had died mid-chunk: still marked running, with rows after the checkpoint
+    with sqlite3.connect(manager.db_path) as db:
+        db.execute("UPDATE jobs SET status = 'running', error = NULL WHERE id = ?", (job_id,))
+    with open(job["output_path"], "ab") as f:
+        f.write(b"half a row,")
+
+    restarted = JobManager(engine, manager.jobs_dir, workers=1)
+    try:
+        assert wait_for(restarted, job_id)["status"] == DONE
+        result = restarted.result(job_id)
+        assert result.rows == ROWS
+        assert result.read_rows(0, ROWS)["Msg"].tolist() == expected_texts()
+    finally:
+        restarted.shutdown(wait=True)
+
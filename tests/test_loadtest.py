@@ -0,0 +1,27 @@
+import pytest
+import streamlit
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.testing.v1 import app_test
+
+import loadtest
+
+
+def test_shared_sessions_restores_streamlit_on_exit():
+    originals = (Runtime._instance, app_test.Runtime, config.get_option, app_test.patch_config_options,
+                 streamlit.file_uploader)
+    with pytest.raises(KeyError):
+        with loadtest.shared_sessions():
+            assert Runtime._instance is not None
+            assert config.get_option("global.appTest") is True
+            raise KeyError("failed step")
+    assert (Runtime._instance, app_test.Runtime, config.get_option, app_test.patch_config_options,
+            streamlit.file_uploader) == originals
+
+
+def test_unsupported_streamlit_fails_clearly(monkeypatch):
+    monkeypatch.setattr(streamlit, "__version__", "9.0.0")
+    with pytest.raises(RuntimeError, match="supports Streamlit"):
+        with loadtest.shared_sessions():
+            pass
+    assert Runtime._instance is None
@@ -0,0 +1,12 @@
+from model_registry import ModelRegistry
+
+
+def test_status_reports_each_model_and_its_load_time(model_dir):
+    registry = ModelRegistry(str(model_dir))
+    assert registry.load_times() == {}
+    assert registry.status()["spam"] == "not loaded yet"
+    assert registry.status()["language"] == "unavailable"
+    assert registry.get("spam") is not None
+    seconds = registry.load_times()["spam"]
+    assert seconds > 0
+    assert registry.status()["spam"].endswith(f"loaded from pickle in {seconds * 1000:.0f} ms")
@@ -0,0 +1,93 @@
+import os
+
+import joblib
+import numpy as np
+
+from inference import ParallelPredictor
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache, text_normalizer
+from tests.conftest import fit_pipeline, training_corpus
+
+
+def test_entries_are_dropped_when_the_signature_changes():
+    cache = PredictionCache(10)
+    cache.sync("v1")
+    key = cache.key("hello")
+    cache.put_many({key: 1}, "v1")
+    assert cache.get_many([key], "v1") == [1]
+    # A caller still on another version neither reads nor fills the cache
+    assert cache.get_many([key], "v2") == [None]
+    cache.put_many({cache.key("other"): 0}, "v2")
+    assert cache.stats()["size"] == 1
+    cache.sync("v2")
+    assert cache.get_many([key], "v2") == [None]
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = PredictionCache(2)
+    keys = [cache.key(text) for text in ("a", "b", "c")]
+    cache.put_many({keys[0]: 0, keys[1]: 1})
+    cache.get_many([keys[0]])
+    cache.put_many({keys[2]: 2})
+    assert cache.get_many(keys) == [0, None, 2]
+
+
+def test_normalizer_only_merges_texts_the_model_sees_alike():
+    lowercase = PredictionCache(normalize=text_normalizer(fit_pipeline()))
+    assert lowercase.key("Win  a\tPRIZE ") == lowercase.key("win a prize")
+    cased = PredictionCache(normalize=text_normalizer(fit_pipeline(lowercase=False)))
+    assert cased.key("Win a prize") != cased.key("win a prize")
+    custom = PredictionCache(normalize=text_normalizer(fit_pipeline(token_pattern=r"\S+")))
+    assert custom.key("win a prize") != custom.key("win  a prize")
+    assert lowercase.key(float("nan")) is None
+
+
+def _replace(path, pipeline):
+    """Write pipeline over path with a different mtime, as a new deployment would"""
+    stat = os.stat(path) if os.path.exists(path) else None
+    joblib.dump(pipeline, path)
+    if stat is not None:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_predictions_follow_a_replaced_model(model_dir):
+    texts, labels = training_corpus(50, seed=3)
+    engine = ParallelPredictor(ModelRegistry(str(model_dir)), workers=1)
+    first = engine.predict("spam", texts)
+    assert (first == labels).mean() > 0.9
+    assert engine.caches["spam"].stats()["size"] > 0
+
+    _replace(model_dir / "spam_classifier.pkl", fit_pipeline(labels=1 - training_corpus()[1]))
+    np.testing.assert_array_equal(engine.predict("spam", texts), 1 - first)
+
+
+def test_predictions_follow_a_new_version_directory(model_dir):
+    texts = training_corpus(50, seed=3)[0]
+    registry = ModelRegistry(str(model_dir))
+    engine = ParallelPredictor(registry, workers=1)
+    first, version = engine.predict_versioned("spam", texts)
+
+    (model_dir / "spam" / "2").mkdir(parents=True)
+    joblib.dump(fit_pipeline(labels=1 - training_corpus()[1]), model_dir / "spam" / "2" / "model.pkl")
+    second, new_version = engine.predict_versioned("spam", texts)
+    assert new_version != version
+    np.testing.assert_array_equal(second, 1 - first)
+
+
+def test_a_pinned_snapshot_keeps_its_version(model_dir):
+    texts = training_corpus(50, seed=3)[0]
+    engine = ParallelPredictor(ModelRegistry(str(model_dir)), workers=1)
+    pinned = engine.for_model("spam")
+    first = pinned.predict(texts)
+    _replace(model_dir / "spam_classifier.pkl", fit_pipeline(labels=1 - training_corpus()[1]))
+    np.testing.assert_array_equal(pinned.predict(texts), first)
+    np.testing.assert_array_equal(engine.predict("spam", texts), 1 - first)
+
+
+def test_duplicate_rows_are_predicted_once(model_dir):
+    engine = ParallelPredictor(ModelRegistry(str(model_dir)), workers=1)
+    texts = ["win a prize", "see you at lunch", "WIN  a prize", "see you at lunch"] * 25
+    predictions = engine.predict("spam", texts)
+    assert predictions.tolist() == [0, 1, 0, 1] * 25
+    assert engine.caches["spam"].stats()["size"] == 2
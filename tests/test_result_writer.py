@@ -0,0 +1,72 @@
+import json
+
+import pandas as pd
+import pytest
+
+from bulk import INDEX_ROWS, ResultWriter
+
+
+def frame(start: int, rows: int) -> pd.DataFrame:
+    """Spam results whose messages hold newlines, quotes and commas"""
+    texts = [f'line {i}\nsecond, "quoted" line' if i % 7 == 0 else f"message {i}" for i in range(start, start + rows)]
+    return pd.DataFrame({"Msg": texts, "Prediction": ["Spam" if i % 3 == 0 else "Not Spam"
+                                                      for i in range(start, start + rows)]})
+
+
+def write_all(path, frames) -> ResultWriter:
+    with ResultWriter(str(path), "spam") as writer:
+        for part in frames:
+            writer.write(part)
+    return writer
+
+
+def test_pages_are_read_across_index_blocks_and_multiline_fields(tmp_path):
+    expected = frame(0, 3 * INDEX_ROWS + 123)
+    result = write_all(tmp_path / "out.csv", [expected.iloc[i:i + 700] for i in range(0, len(expected), 700)]) \
+        .result(1.0, None)
+    assert result.rows == len(expected)
+    assert len(result.offsets) == 4
+    for start, count in ((0, 10), (INDEX_ROWS - 5, 10), (2 * INDEX_ROWS + 998, 300), (len(expected) - 3, 50)):
+        page = result.read_rows(start, count)
+        wanted = expected.iloc[start:start + count]
+        assert page["Msg"].tolist() == wanted["Msg"].tolist()
+        assert page["Prediction"].tolist() == wanted["Prediction"].tolist()
+        assert page.index[0] == start + 1
+    assert result.read_rows(len(expected), 10).empty
+
+
+def test_resume_from_checkpoint_discards_later_rows(tmp_path):
+    resumed_path = tmp_path / "resumed.csv"
+    writer = ResultWriter(str(resumed_path), "spam")
+    writer.write(frame(0, 1_500))
+    state = writer.checkpoint()
+    # Written after the checkpoint by a run that was then interrupted
+    writer.write(frame(50_000, 700))
+    writer.close()
+
+    with ResultWriter(str(resumed_path), "spam", state) as resumed:
+        resumed.write(frame(1_500, 1_200))
+    straight = write_all(tmp_path / "straight.csv", [frame(0, 1_500), frame(1_500, 1_200)])
+
+    assert resumed_path.read_bytes() == (tmp_path / "straight.csv").read_bytes()
+    assert resumed.rows == straight.rows == 2_700
+    assert resumed.counts == straight.counts
+    assert resumed.offsets == straight.offsets
+    assert resumed.result(1.0, None).read_rows(1_495, 10)["Msg"].tolist() == frame(1_495, 10)["Msg"].tolist()
+
+
+def test_checkpoint_round_trips_through_json(tmp_path):
+    with ResultWriter(str(tmp_path / "out.csv"), "spam") as writer:
+        writer.write(frame(0, 10))
+        state = json.loads(json.dumps(writer.checkpoint()))
+    with ResultWriter(str(tmp_path / "out.csv"), "spam", state) as resumed:
+        assert resumed.rows == 10
+        assert resumed.counts == writer.counts
+        assert resumed.columns == ["Msg", "Prediction"]
+
+
+@pytest.mark.parametrize("rows", [0, 1, INDEX_ROWS, INDEX_ROWS + 1])
+def test_offsets_mark_every_index_block(tmp_path, rows):
+    result = write_all(tmp_path / "out.csv", [frame(0, rows)]).result(1.0, None)
+    assert len(result.offsets) == -(-rows // INDEX_ROWS)
+    assert result.read_rows(0, rows)["Msg"].tolist() == frame(0, rows)["Msg"].tolist()
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+import streaming
+from streaming import StreamPipeline, StreamRunner, stream_path, tail_jsonl
+
+
+def predict_spam(texts):
+    return {"spam": np.array([0 if "win" in text else 1 for text in texts])}, {"spam": "test"}
+
+
+def fail_predict(texts):
+    raise ValueError("model file is corrupt")
+
+
+def counting_source(count):
+    async def source(inbox, stop, stats):
+        for i in range(count):
+            if stop.is_set():
+                return
+            stats.record_received()
+            await inbox.put(({"text": f"win {i}" if i % 2 else f"hello {i}"}, time.perf_counter()))
+    return source
+
+
+def test_pipeline_classifies_every_message_in_order():
+    results = []
+    pipeline = StreamPipeline(predict_spam, results.extend, max_queue=5, max_batch=4, max_wait_ms=1)
+    asyncio.run(pipeline.run(counting_source(50), asyncio.Event()))
+    assert [result["text"] for result in results] == [f"win {i}" if i % 2 else f"hello {i}" for i in range(50)]
+    assert [result["Prediction"] for result in results[:2]] == ["Not Spam", "Spam"]
+    assert results[0]["model_versions"] == {"spam": "test"}
+    assert pipeline.stats.summary()["classified"] == 50
+
+
+def test_failing_predictor_stops_the_stream_and_reports_the_error():
+    runner = StreamRunner()
+    exited = []
+    runner.start(StreamPipeline(fail_predict, lambda results: None, max_queue=5),
+                 counting_source(10_000), "test", on_exit=lambda: exited.append(True))
+    runner._thread.join(5)
+    assert not runner.running
+    assert exited
+    assert "model file is corrupt" in runner.error
+
+
+def test_failing_sink_stops_the_stream_and_reports_the_error():
+    def sink(results):
+        raise OSError("disk full")
+
+    runner = StreamRunner()
+    runner.start(StreamPipeline(predict_spam, sink, max_queue=5), counting_source(10_000), "test")
+    runner._thread.join(5)
+    assert not runner.running
+    assert runner.error == "disk full"
+
+
+def test_stop_ends_a_running_stream():
+    async def endless(inbox, stop, stats):
+        while not stop.is_set():
+            await inbox.put(({"text": "hello"}, time.perf_counter()))
+
+    runner = StreamRunner()
+    runner.start(StreamPipeline(predict_spam, lambda results: None, max_queue=5), endless, "test")
+    runner.stop(timeout=5)
+    assert not runner.running
+    assert runner.error is None
+
+
+def test_tail_jsonl_keeps_characters_split_across_reads(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming, "READ_BYTES", 7)
+    texts = ["héllo wörld", "日本語のテキスト", "plain", "emoji 🎉 end"]
+    path = tmp_path / "feed.jsonl"
+    path.write_text("".join(json.dumps({"text": text}, ensure_ascii=False) + "\n" for text in texts[:-1])
+                    + texts[-1], encoding="utf-8")
+
+    async def read():
+        inbox = asyncio.Queue()
+        await tail_jsonl(str(path), inbox, asyncio.Event(), streaming.RollingStats(), "text",
+                         from_start=True, follow=False)
+        return [inbox.get_nowait()[0]["text"] for _ in range(inbox.qsize())]
+
+    assert asyncio.run(read()) == texts
+
+
+def test_stream_paths_stay_inside_the_stream_directory(tmp_path):
+    base = tmp_path / "streams"
+    (base / "feeds").mkdir(parents=True)
+    (base / "escape").symlink_to(tmp_path)
+    assert stream_path("feed.jsonl", str(base)) == str(base / "feed.jsonl")
+    assert stream_path("feeds/../feeds/a.jsonl", str(base)) == str(base / "feeds" / "a.jsonl")
+    for name in ("/etc/passwd", "../secret.jsonl", "feeds/../../secret.jsonl", "escape/secret.jsonl", ".", ""):
+        with pytest.raises(ValueError):
+            stream_path(name, str(base))
@@ -0,0 +1,55 @@
+import gzip
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from ingest import open_upload_parts
+from tests.conftest import Upload, csv_bytes, read_all
+
+
+def zip_bytes(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_zip_with_one_table_is_passed_through():
+    upload = Upload("upload.zip", zip_bytes([("__MACOSX/._messages.csv", b"junk"), ("messages.csv", csv_bytes(10))]))
+    with open_upload_parts([upload]) as parts:
+        assert parts == [upload]
+
+
+def test_zip_of_several_tables_is_expanded():
+    data = zip_bytes([("a.csv", csv_bytes(300)), ("b.txt", b"one\ntwo\n"), ("readme.md", b"not a table")])
+    with open_upload_parts([Upload("shards.zip", data)]) as parts:
+        assert [part.name for part in parts] == ["shards.zip/a.csv", "shards.zip/b.txt"]
+        assert [len(read_all(part)) for part in parts] == [300, 2]
+
+
+@pytest.mark.parametrize("mode, name", [("w", "shards.tar"), ("w:gz", "shards.tar.gz")])
+def test_tar_members_are_expanded(mode, name):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for member, data in (("x/a.csv", csv_bytes(400)), ("x/b.csv.gz", gzip.compress(csv_bytes(250)))):
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    with open_upload_parts([Upload(name, buffer.getvalue())]) as parts:
+        assert [part.name for part in parts] == [f"{name}/x/a.csv", f"{name}/x/b.csv.gz"]
+        assert [len(read_all(part)) for part in parts] == [400, 250]
+        assert all(not part.closed for part in parts)
+    assert all(part.closed for part in parts)
+
+
+def test_tar_without_tables_is_an_error():
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo("notes.md")
+        archive.addfile(info, io.BytesIO(b""))
+    with pytest.raises(ValueError, match="no CSV or TXT"):
+        with open_upload_parts([Upload("empty.tar", buffer.getvalue())]):
+            pass
@@ -0,0 +1,194 @@
+"""Model warm-up and readiness checks.
+
+    python warmup.py        # warm every model once and exit non-zero if any check fails
+
+The first predict call on a freshly loaded pipeline is much slower than later
+ones (lazy imports, first-call allocations, cold caches). With
+SENSEBOX_WARMUP=1 each model is loaded at process start and run on a small
+built-in sample, so that cost is paid before any user shows up. The sample
+doubles as a sanity check: every prediction must be one of the model's
+classes, the classes must still match the label mapping the app shows (such
+as {0: 'Spam', 1: 'Not Spam'}), and samples with a known answer must get it.
+
+An instance is ready once warm-up has finished and no model that exists on
+disk failed to load or failed its checks. A model whose file is missing is
+reported but does not block readiness, as the app already runs without it.
+"""
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bulk import TASKS
+from metrics import METRICS
+from model_registry import ModelRegistry
+
+
+WARMUP = os.environ.get("SENSEBOX_WARMUP", "0") == "1"
+
+# (text, expected prediction or None) per model; expectations are only set where every
+# shipped model agrees with a wide margin
+SAMPLES: Dict[str, List[Tuple[str, object]]] = {
+    "spam": [
+        ("WINNER!! You have won a free prize. Call now to claim your cash reward", 0),
+        ("Hey, are we still meeting for lunch tomorrow?", 1),
+    ],
+    "language": [
+        ("This is a short sentence written in plain English.", None),
+        ("Ceci est une courte phrase écrite en français.", None),
+    ],
+    "news": [
+        ("The team won the championship after a dramatic overtime goal", "SPORTS"),
+        ("The stock market rallied as the central bank cut interest rates", None),
+    ],
+    "review": [
+        ("The food was delicious and the staff were friendly", 1),
+        ("The food was cold and the service was terrible", 0),
+    ],
+}
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+MISSING = "missing"
+
+
+def _plain(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def check_predictions(name: str, model, samples: Sequence[Tuple[str, object]], predictions) -> Optional[str]:
+    """Why the predictions of model on samples are not sane, or None if they are"""
+    predictions = [_plain(prediction) for prediction in predictions]
+    if len(predictions) != len(samples):
+        return f"{len(predictions)} predictions for {len(samples)} samples"
+    classes = getattr(model, "classes_", None)
+    if classes is not None:
+        classes = [_plain(value) for value in classes]
+        unknown = [prediction for prediction in predictions if prediction not in classes]
+        if unknown:
+            return f"predicted {unknown[0]!r}, which is not one of the model's classes"
+    labels = TASKS.get(name, {}).get("labels")
+    if labels is not None and classes is not None and set(classes) != set(labels):
+        return f"classes {sorted(classes, key=repr)} no longer match the label mapping {labels}"
+    for (text, expected), prediction in zip(samples, predictions):
+        if expected is not None and prediction != expected:
+            shown = labels.get(prediction, prediction) if labels else prediction
+            wanted = labels.get(expected, expected) if labels else expected
+            return f"predicted {shown!r} instead of {wanted!r} for {text!r}"
+    return None
+
+
+def warm_up(name: str, model, samples: Optional[Dict[str, List[Tuple[str, object]]]] = None) -> Optional[str]:
+    """Run model on its sample and check the answers; the warm hook for ModelRegistry.watch()"""
+    samples = (SAMPLES if samples is None else samples).get(name) or [("warm-up", None)]
+    try:
+        predictions = model.predict([text for text, _ in samples])
+    except Exception as e:
+        return f"predict failed: {e}"
+    return check_predictions(name, model, samples, predictions)
+
+
+class Readiness:
+    """Warms up the registry's models once and reports whether the process may take traffic"""
+
+    def __init__(self, registry: ModelRegistry, samples: Optional[Dict[str, List[Tuple[str, object]]]] = None):
+        self.registry = registry
+        self.samples = SAMPLES if samples is None else samples
+        self._lock = threading.Lock()
+        self._models = {name: {"status": PENDING} for name in registry.files}
+        self._started = False
+        self._finished = threading.Event()
+
+    def warm_model(self, name: str) -> dict:
+        """Load name, predict its sample twice and check the answers"""
+        if not self.registry.is_available(name):
+            return {"status": MISSING, "error": self.registry.error(name)}
+        start = time.perf_counter()
+        model = self.registry.get(name)
+        loaded = time.perf_counter()
+        if model is None:
+            return {"status": FAILED, "error": self.registry.error(name) or "Model failed to load"}
+        samples = self.samples.get(name) or [("warm-up", None)]
+        texts = [text for text, _ in samples]
+        try:
+            predictions = model.predict(texts)
+            first = time.perf_counter()
+            model.predict(texts)
+            second = time.perf_counter()
+        except Exception as e:
+            return {"status": FAILED, "error": f"predict failed: {e}"}
+        METRICS.observe("warmup", first - start, name)
+        report = {
+            "status": READY,
+            "version": self.registry.version(name),
+            "load_ms": round((loaded - start) * 1000, 1),
+            "first_predict_ms": round((first - loaded) * 1000, 1),
+            "warm_predict_ms": round((second - first) * 1000, 1),
+        }
+        problem = check_predictions(name, model, samples, predictions)
+        if problem is not None:
+            report.update(status=FAILED, error=problem)
+        return report
+
+    def run(self) -> bool:
+        """Warm every model in turn; returns ready"""
+        with self._lock:
+            self._started = True
+        for name in self.registry.files:
+            try:
+                report = self.warm_model(name)
+            except Exception as e:
+                report = {"status": FAILED, "error": str(e)}
+            with self._lock:
+                self._models[name] = report
+        self._finished.set()
+        return self.ready
+
+    def start(self) -> threading.Thread:
+        """Run the warm-up on a background thread, so the process can already answer health checks"""
+        with self._lock:
+            self._started = True
+        thread = threading.Thread(target=self.run, name="sensebox-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    @property
+    def warmed(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def ready(self) -> bool:
+        """Warm-up finished (or was never started) and no present model failed"""
+        with self._lock:
+            if self._started and not self._finished.is_set():
+                return False
+            return all(report["status"] != FAILED for report in self._models.values())
+
+    def report(self) -> dict:
+        with self._lock:
+            models = {name: dict(report) for name, report in self._models.items()}
+        return {"ready": self.ready, "warmed": self.warmed, "models": models}
+
+
+def main():
+    import argparse
+    import json
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Warm up the Sense Box models and check their predictions")
+    parser.add_argument("--model-dir", default=os.path.join(base_dir, "models"))
+    args = parser.parse_args()
+
+    readiness = Readiness(ModelRegistry(args.model_dir))
+    ready = readiness.run()
+    print(json.dumps(readiness.report(), indent=2))
+    sys.exit(0 if ready else 1)
+
+
+if __name__ == "__main__":
+    main()